@@ -0,0 +1,68 @@
+# backend/app/deadline.py
+"""
+Per-request time budget. An /ask request starts a deadline (X-Request-Timeout-Ms
+header, else ASK_DEADLINE_MS) and every stage below reads what is left from
+a context variable: the LLM chain gets the remainder minus a reserve for the
+query, the DB statement_timeout whatever is left after generation.
+"""
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+HEADER = "X-Request-Timeout-Ms"
+DEFAULT_MS = int(os.getenv("ASK_DEADLINE_MS", "30000"))
+MAX_MS = int(os.getenv("ASK_DEADLINE_MAX_MS", "120000"))
+# kept back from generation for the query and the response
+DB_RESERVE_MS = int(os.getenv("ASK_DB_RESERVE_MS", "1000"))
+
+# absolute time.monotonic() by which the current request must be answered
+_deadline = ContextVar("deadline", default=None)
+
+class DeadlineExceeded(TimeoutError):
+    pass
+
+def budget_ms(header: str | None) -> int:
+    # requested budget, clamped to (0, MAX_MS]; the default when missing or malformed
+    try:
+        ms = int(float(header)) if header else DEFAULT_MS
+    except ValueError:
+        ms = DEFAULT_MS
+    return max(1, min(ms, MAX_MS))
+
+@contextmanager
+def start(ms: int):
+    token = _deadline.set(time.monotonic() + ms / 1000.0)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+def remaining() -> float | None:
+    """
+    Seconds left for the current request; None outside a deadline.
+    """
+    at = _deadline.get()
+    return None if at is None else at - time.monotonic()
+
+def check(what: str = "request") -> None:
+    left = remaining()
+    if left is not None and left <= 0:
+        raise DeadlineExceeded(f"Deadline exceeded before {what}")
+
+def limit(seconds: float, reserve_ms: int = 0) -> float:
+    """
+    `seconds` capped by the time left (minus `reserve_ms`); raises
+    DeadlineExceeded when nothing is left.
+    """
+    left = remaining()
+    if left is None:
+        return seconds
+    left -= reserve_ms / 1000.0
+    if left <= 0:
+        raise DeadlineExceeded("Deadline exceeded")
+    return min(seconds, left)
+
+def generation_limit(seconds: float) -> float:
+    # LLM calls: the time left after the DB reserve
+    return limit(seconds, reserve_ms=DB_RESERVE_MS)
@@ -0,0 +1,194 @@
+# backend/app/encoding.py
+import datetime as dt
+import importlib.util
+import json
+from decimal import Decimal
+import orjson
+
+# /ask response formats by Accept media type. All of them map values the same way:
+#   numeric (Decimal) -> integer without fractional digits (e.g. SUM of an integer column),
+#   else double, like FastAPI's decimal_encoder (Arrow columns: always double),
+#   date / timestamp -> ISO 8601 text in JSON and
+#   date32 / timestamp[us] (UTC when the column has a time zone) in Arrow, NULL -> null.
+JSON = "application/json"                              # FastAPI encoder, rows of arrays (default)
+ROWS = "application/vnd.nl2sql.rows+json"              # same document, encoded by orjson
+COLUMNS = "application/vnd.nl2sql.columns+json"        # result as one array per column
+ARROW = "application/vnd.apache.arrow.stream"          # result as an Arrow IPC stream (needs pyarrow)
+FORMATS = (JSON, ROWS, COLUMNS, ARROW)
+HAS_ARROW = importlib.util.find_spec("pyarrow") is not None
+SUPPORTED = tuple(f for f in FORMATS if f != ARROW or HAS_ARROW)
+
+def _decimal(o: Decimal) -> int | float:
+    # fastapi.encoders.decimal_encoder: Decimal("10") -> 10, Decimal("10.00") -> 10.0
+    return int(o) if o.as_tuple().exponent >= 0 else float(o)
+
+def json_default(o):
+    """
+    Same value mapping FastAPI applies to /ask results:
+    Decimal -> int or float, date/time -> ISO 8601 string.
+    """
+    if isinstance(o, Decimal):
+        return _decimal(o)
+    if isinstance(o, (dt.date, dt.datetime, dt.time)):
+        return o.isoformat()
+    return str(o)
+
+def negotiate(accept: str | None) -> str | None:
+    """
+    Response format for an Accept header: the supported media type with the
+    highest q (earliest on ties). A missing header or */* gives JSON; None
+    when nothing listed is supported (Arrow counts only with pyarrow installed).
+    """
+    best, best_q = None, 0.0
+    for item in (accept or "*/*").split(","):
+        media, *params = [p.strip() for p in item.split(";")]
+        q = 1.0
+        for p in params:
+            if p.startswith("q="):
+                try:
+                    q = float(p[2:])
+                except ValueError:
+                    q = 0.0
+        media = media.lower()
+        if media in ("*/*", "application/*"):
+            media = JSON
+        if media in SUPPORTED and q > best_q:
+            best, best_q = media, q
+    return best
+
+def _orjson_default(o):
+    if isinstance(o, Decimal):
+        v = _decimal(o)
+        # orjson has no bignums: beyond 64 bits (sum() over bigint, numeric(30,0)) it stays a number, as a double
+        return float(v) if isinstance(v, int) and not -2**63 <= v < 2**63 else v
+    raise TypeError
+
+def dumps(obj) -> bytes:
+    """
+    orjson with the json_default value mapping; rows may stay tuples.
+    """
+    return orjson.dumps(obj, default=_orjson_default)
+
+def columnar(result: dict) -> dict:
+    # {"columns": [...], "rows": [...]} -> {"columns": [...], "data": [[column 0 values], ...], "row_count": n}
+    rows = result.get("rows", [])
+    data = list(zip(*rows)) if rows else [() for _ in result.get("columns", [])]
+    return {"columns": result.get("columns", []), "data": data, "row_count": len(rows)}
+
+def _arrow_type(pa, values):
+    # column type from its first non-NULL value
+    for v in values:
+        if v is None:
+            continue
+        if isinstance(v, bool):
+            return pa.bool_()
+        if isinstance(v, int):
+            return pa.int64()
+        if isinstance(v, (float, Decimal)):
+            return pa.float64()
+        if isinstance(v, dt.datetime):
+            return pa.timestamp("us", tz="UTC" if v.tzinfo else None)
+        if isinstance(v, dt.date):
+            return pa.date32()
+        if isinstance(v, dt.time):
+            return pa.time64("us")
+        if isinstance(v, bytes):
+            return pa.binary()
+        return pa.string()
+    return pa.null()
+
+# Postgres type OID -> Arrow type name; anything else travels as text
+_ARROW_OIDS = {
+    16: "bool_", 17: "binary", 20: "int64", 21: "int64", 23: "int64", 26: "int64",
+    700: "float64", 701: "float64", 1700: "float64",
+    1082: "date32", 1083: "time64", 1114: "timestamp", 1184: "timestamptz",
+}
+
+def arrow_schema(description, metadata: dict | None = None):
+    """
+    Arrow schema of a result from the cursor's description (column types
+    known up front, NULL-only columns included). Raises ImportError without
+    pyarrow.
+    """
+    import pyarrow as pa
+
+    fields = []
+    for col in description:
+        name = _ARROW_OIDS.get(col.type_code, "string")
+        if name == "time64":
+            typ = pa.time64("us")
+        elif name in ("timestamp", "timestamptz"):
+            typ = pa.timestamp("us", tz="UTC" if name == "timestamptz" else None)
+        else:
+            typ = getattr(pa, name)()
+        fields.append(pa.field(col.name, typ))
+    return pa.schema(fields, metadata={"nl2sql": dumps(metadata)} if metadata else None)
+
+def arrow_batch(schema, rows: list):
+    # one record batch from one fetched chunk of rows
+    import pyarrow as pa
+
+    arrays = []
+    for field, values in zip(schema, zip(*rows) if rows else [() for _ in schema]):
+        if pa.types.is_floating(field.type):
+            values = [None if v is None else float(v) for v in values]
+        elif pa.types.is_string(field.type):
+            values = [None if v is None else str(v) for v in values]
+        arrays.append(pa.array(values, type=field.type))
+    return pa.record_batch(arrays, schema=schema)
+
+def arrow_ipc(result: dict, metadata: dict | None = None) -> bytes:
+    """
+    Arrow IPC stream of a result. A result from db.aquery_arrow ("table"
+    built from the cursor) is written batch by batch; a cached one ("rows")
+    becomes one record batch, columns typed from their values. `metadata`
+    (question, SQL, ...) travels as JSON in the schema metadata under
+    "nl2sql". Raises ImportError without pyarrow.
+    """
+    import pyarrow as pa
+
+    if "table" in result:
+        table = result["table"]
+        if metadata:
+            table = table.replace_schema_metadata({"nl2sql": dumps(metadata)})
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return sink.getvalue().to_pybytes()
+
+    columns = columnar(result)
+    arrays, fields = [], []
+    for name, values in zip(columns["columns"], columns["data"]):
+        typ = _arrow_type(pa, values)
+        if pa.types.is_floating(typ):
+            values = [None if v is None else float(v) for v in values]
+        elif pa.types.is_string(typ):
+            values = [None if v is None else str(v) for v in values]
+        arrays.append(pa.array(values, type=typ))
+        fields.append(pa.field(name, typ))
+    meta = {"nl2sql": dumps(metadata)} if metadata else None
+    batch = pa.record_batch(arrays, schema=pa.schema(fields, metadata=meta))
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, batch.schema) as writer:
+        writer.write_batch(batch)
+    return sink.getvalue().to_pybytes()
+
+def encode(payload: dict, media: str) -> bytes:
+    """
+    Body of an /ask response in a negotiated format (JSON is FastAPI's own path).
+    """
+    if media == ROWS:
+        return dumps(payload)
+    if media == COLUMNS:
+        return dumps({**payload, "result": columnar(payload["result"])})
+    if media == ARROW:
+        return arrow_ipc(payload["result"], {k: v for k, v in payload.items() if k != "result"})
+    raise ValueError(f"unsupported format: {media}")
+
+def ndjson_line(obj) -> bytes:
+    return (json.dumps(obj, default=json_default, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+
+def sse_event(event: str, obj) -> bytes:
+    # compact JSON never contains a raw newline, so one data: line suffices
+    data = json.dumps(obj, default=json_default, ensure_ascii=False, separators=(",", ":"))
+    return f"event: {event}\ndata: {data}\n\n".encode("utf-8")
@@ -0,0 +1,455 @@
+# backend/app/index_advisor.py
+"""
+Index advisor for the logged query workload (WORKLOAD_LOG, see app/workload.py).
+
+Groups the executed statements by query shape (literals ignored), reads
+join predicates, WHERE filters and ORDER BY columns off each one, and turns them into
+candidate B-tree indexes ranked by the measured time of the queries they
+could serve. Every candidate is then checked with the planner: the index is
+built inside a transaction, the affected queries are EXPLAINed before and
+after, and the transaction is rolled back. Candidates that do not lower the
+estimated cost (or only repeat what a better index already gives) are dropped.
+
+    cd backend
+    python -m app.index_advisor                    # report only
+    python -m app.index_advisor --apply            # CREATE INDEX CONCURRENTLY the recommendations
+    python -m app.index_advisor --json advice.json --verbose
+
+The trial builds take a SHARE lock on the table until the rollback, so writes
+to it wait meanwhile; run against a replica or a quiet period on big tables.
+"""
+import argparse
+import json
+import re
+import sys
+import time
+from dataclasses import dataclass, field
+from psycopg import connect, sql as pgsql
+from sqlparse import tokens as T
+from . import workload
+from .db import DB_URL
+from .sql_analysis import _is_kw, _is_name, _lex, _name, analyze
+
+# equality-like operators; ranges get their own list, LIKE/IS are not indexable as written
+_EQ = {"=", "in"}
+_RANGE = {"<", ">", "<=", ">=", "between"}
+# clause keywords that change what a column reference means
+_CLAUSES = {
+    "SELECT": "select", "FROM": "from", "WHERE": "where", "ON": "where", "HAVING": "having",
+    "GROUP BY": "group", "ORDER BY": "order", "LIMIT": "limit", "OFFSET": "limit",
+}
+# widest composite index proposed
+_MAX_COLUMNS = 3
+# the log's "?" placeholders, with the type of a typed literal (date '2024-01-01' -> date ?)
+_PLACEHOLDER = re.compile(r"(?:\b(date|time|timestamp|timestamptz|interval) )?\?")
+
+@dataclass
+class Query:
+    sql: str                 # the query shape, literals as "?"; EXPLAINed as a generic plan
+    count: int = 0
+    total_ms: float = 0.0
+    errors: int = 0
+    tables: frozenset = frozenset()
+    cost: float | None = None  # planner cost without any candidate
+
+    @property
+    def avg_ms(self) -> float:
+        return self.total_ms / self.count if self.count else 0.0
+
+@dataclass
+class Candidate:
+    table: str
+    columns: tuple
+    reasons: set = field(default_factory=set)   # "join", "where", "range", "order"
+    queries: list = field(default_factory=list) # Query objects that produced it
+    weight_ms: float = 0.0                      # measured time of those queries
+    before: float = 0.0                         # count-weighted planner cost, affected queries
+    after: float = 0.0
+    saved_ms: float = 0.0                       # measured time scaled by each query's cost drop
+    build_s: float = 0.0
+    size_bytes: int = 0
+    per_query: list = field(default_factory=list)
+    status: str = "unverified"
+
+    @property
+    def name(self) -> str:
+        return f"ix_{self.table}_{'_'.join(self.columns)}"[:63]
+
+    @property
+    def gain(self) -> float:
+        return 1.0 - self.after / self.before if self.before else 0.0
+
+    def ddl(self, concurrently: bool = False) -> pgsql.Composed:
+        return pgsql.SQL("CREATE INDEX {}{} ON {} ({})").format(
+            pgsql.SQL("CONCURRENTLY IF NOT EXISTS " if concurrently else ""),
+            pgsql.Identifier(self.name),
+            pgsql.Identifier(self.table),
+            pgsql.SQL(", ").join(pgsql.Identifier(c) for c in self.columns),
+        )
+
+def load_workload(path: str = workload.LOG_PATH) -> list:
+    """
+    Logged entries grouped by query shape (literals ignored), heaviest total time first.
+    """
+    queries = {}
+    for entry in workload.read(path):
+        # the log holds shapes already; older logs may still hold literal SQL
+        key = workload.fingerprint(entry.get("sql") or "")
+        if not key:
+            continue
+        q = queries.get(key)
+        if q is None:
+            q = queries[key] = Query(sql=key)
+        q.count += 1
+        q.total_ms += float(entry.get("ms") or 0.0)
+        q.errors += bool(entry.get("error"))
+    return sorted(queries.values(), key=lambda q: -q.total_ms)
+
+def _resolve(parts: list, aliases: dict, catalog: dict) -> tuple | None:
+    # (table, column) for a column reference, None for CTE/subquery/output names
+    if len(parts) >= 2:
+        table = aliases.get(parts[-2])
+        return (table, parts[-1]) if parts[-1] in catalog.get(table, ()) else None
+    owners = {t for t in aliases.values() if parts[0] in catalog.get(t, ())}
+    return (owners.pop(), parts[0]) if len(owners) == 1 else None
+
+def predicates(sql: str, catalog: dict) -> dict:
+    """
+    Indexable column uses of one statement as (table, column) pairs:
+    {"joins": [(left, right)], "eq": set, "range": set, "order": [[...] per ORDER BY]}.
+    """
+    a = analyze(sql)
+    toks = _lex(a.sql)
+    out = {"joins": [], "eq": set(), "range": set(), "order": []}
+    n = len(toks)
+    clause, stack = None, []
+    order = None  # ORDER BY list being read; None once it stops being plain columns
+
+    def ref(i):
+        # column reference starting at token i -> (resolved or None, next index)
+        parts = [_name(toks[i][1])]
+        while i + 2 < n and toks[i + 1][1] == "." and _is_name(toks[i + 2][0]):
+            parts.append(_name(toks[i + 2][1]))
+            i += 2
+        if i + 1 < n and toks[i + 1][1] == "(":
+            return None, i + 1  # function call
+        return _resolve(parts, a.aliases, catalog), i + 1
+
+    def op_at(i):
+        if i >= n:
+            return None
+        ttype, value = toks[i][0], toks[i][1].lower()
+        if ttype in T.Operator.Comparison or value in ("in", "between"):
+            return value
+        return None
+
+    i = 0
+    while i < n:
+        ttype, value = toks[i][0], toks[i][1]
+        if value == "(":
+            stack.append((clause, order))
+            # grouping parentheses keep the clause; function arguments are not indexable
+            if i and _is_name(toks[i - 1][0]):
+                clause = None
+            order = None
+            i += 1
+            continue
+        if value == ")":
+            if order:
+                out["order"].append(order)
+            clause, order = stack.pop() if stack else (None, None)
+            i += 1
+            continue
+        if _is_kw(ttype) and value.upper() == "USING" and i + 1 < n and toks[i + 1][1] == "(":
+            # JOIN ... USING (col): every joined table that has the column
+            i += 2
+            while i < n and toks[i][1] != ")":
+                if _is_name(toks[i][0]):
+                    column = _name(toks[i][1])
+                    owners = sorted({t for t in a.aliases.values() if column in catalog.get(t, ())})
+                    out["joins"].extend(((l, column), (r, column)) for l, r in zip(owners, owners[1:]))
+                i += 1
+            i += 1
+            continue
+        if _is_kw(ttype) and " ".join(value.upper().split()) in _CLAUSES:
+            if order:
+                out["order"].append(order)
+            clause = _CLAUSES[" ".join(value.upper().split())]
+            order = [] if clause == "order" else None
+            i += 1
+            continue
+
+        if clause == "where" and _is_name(ttype):
+            col, j = ref(i)
+            op = op_at(j)
+            if col and op:
+                if op == "=" and j + 1 < n and _is_name(toks[j + 1][0]):
+                    other, k = ref(j + 1)
+                    if other and op_at(k) is None:
+                        out["joins"].append((col, other))
+                        i = k
+                        continue
+                if op in _EQ:
+                    out["eq"].add(col)
+                elif op in _RANGE:
+                    out["range"].add(col)
+            elif col and i and op_at(i - 1) and not (i > 1 and _is_name(toks[i - 2][0])):
+                # literal on the left: '2025-01-01' <= t.transaction_time
+                (out["eq"] if op_at(i - 1) == "=" else out["range"]).add(col)
+            i = j
+            continue
+
+        if clause == "order" and order is not None:
+            if value == "," or ttype in T.Keyword.Order:
+                i += 1
+                continue
+            if _is_name(ttype):
+                col, j = ref(i)
+                if col and (j >= n or toks[j][1] in (",", ")") or _is_kw(toks[j][0])):
+                    order.append(col)
+                    i = j
+                    continue
+            # expression, position or output alias: later keys cannot use an index either
+            if order:
+                out["order"].append(order)
+            order = None
+        i += 1
+    if order:
+        out["order"].append(order)
+    return out
+
+def candidates(queries: list, catalog: dict, existing: dict) -> list:
+    """
+    Candidate indexes from every query's predicates, heaviest first; anything an
+    existing index already leads with is skipped.
+    """
+    found = {}
+
+    def add(table, columns, reason, q):
+        columns = tuple(dict.fromkeys(columns))[:_MAX_COLUMNS]
+        if any(ix[:len(columns)] == columns for ix in existing.get(table, ())):
+            return
+        c = found.get((table, columns))
+        if c is None:
+            c = found[(table, columns)] = Candidate(table, columns)
+        c.reasons.add(reason)
+        if q not in c.queries:
+            c.queries.append(q)
+            c.weight_ms += q.total_ms
+
+    for q in queries:
+        try:
+            p = predicates(q.sql, catalog)
+        except Exception:
+            continue
+        for left, right in p["joins"]:
+            for table, column in (left, right):
+                add(table, (column,), "join", q)
+        eq_by_table = {}
+        for table, column in sorted(p["eq"]):
+            add(table, (column,), "where", q)
+            eq_by_table.setdefault(table, []).append(column)
+        for table, columns in eq_by_table.items():
+            if len(columns) > 1:
+                add(table, columns, "where", q)
+        for table, column in sorted(p["range"]):
+            add(table, (column,), "range", q)
+            if table in eq_by_table:
+                # equality columns first, the range last
+                add(table, (*eq_by_table[table], column), "range", q)
+        for keys in p["order"]:
+            table = keys[0][0]
+            columns = [c for t, c in keys if t == table]
+            add(table, columns, "order", q)
+            if table in eq_by_table:
+                add(table, (*eq_by_table[table], *columns), "order", q)
+    return sorted(found.values(), key=lambda c: -c.weight_ms)
+
+def _catalog(conn) -> tuple:
+    # ({table: {column}}, {table: [index column tuples]}) for the public schema
+    catalog = {}
+    for table, column in conn.execute(
+        "SELECT table_name, column_name FROM information_schema.columns WHERE table_schema = 'public'"
+    ):
+        catalog.setdefault(table, set()).add(column)
+    existing = {}
+    for table, columns in conn.execute(
+        """
+        SELECT c.relname, array_agg(a.attname ORDER BY k.ord)
+        FROM pg_index i
+        JOIN pg_class c ON c.oid = i.indrelid
+        JOIN pg_namespace s ON s.oid = c.relnamespace AND s.nspname = 'public'
+        CROSS JOIN LATERAL unnest(i.indkey) WITH ORDINALITY AS k(attnum, ord)
+        JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = k.attnum
+        GROUP BY i.indexrelid, c.relname
+        """
+    ):
+        existing.setdefault(table, []).append(tuple(columns))
+    return catalog, existing
+
+def _explainable(sql: str) -> str:
+    # "?" -> $1, $2, ... (cast for typed literals), planned without values by GENERIC_PLAN
+    n = 0
+    def param(m):
+        nonlocal n
+        n += 1
+        return f"${n}::{m.group(1)}" if m.group(1) else f"${n}"
+    return _PLACEHOLDER.sub(param, sql)
+
+def _cost(conn, sql: str) -> float | None:
+    try:
+        with conn.transaction():
+            row = conn.execute(f"EXPLAIN (GENERIC_PLAN, FORMAT JSON) {_explainable(sql)}").fetchone()
+        return float(row[0][0]["Plan"]["Total Cost"])
+    except Exception:
+        return None
+
+def _measure(conn, cand: Candidate, queries: list, baseline: dict) -> None:
+    # count-weighted cost of the affected queries against `baseline` (query -> cost)
+    cand.before = cand.after = cand.saved_ms = 0.0
+    cand.per_query = []
+    for q in queries:
+        before = baseline.get(id(q))
+        after = _cost(conn, q.sql)
+        if before is None or after is None:
+            continue
+        cand.before += q.count * before
+        cand.after += q.count * after
+        if before > 0:
+            cand.saved_ms += q.total_ms * max(0.0, 1.0 - after / before)
+        cand.per_query.append({"sql": q.sql, "count": q.count, "avg_ms": round(q.avg_ms, 2),
+                               "before": round(before, 2), "after": round(after, 2)})
+
+def verify(conn, cands: list, queries: list, min_gain: float) -> list:
+    """
+    Planner check of each candidate (built and rolled back), then a greedy pass
+    that keeps a candidate only if it still helps next to the ones already kept.
+    Returns the recommended candidates, best first.
+    """
+    baseline = {}
+    for q in queries:
+        q.cost = _cost(conn, q.sql)
+        baseline[id(q)] = q.cost
+
+    def affected(c):
+        return [q for q in queries if c.table in q.tables]
+
+    for c in cands:
+        t0 = time.perf_counter()
+        try:
+            conn.execute(c.ddl())
+        except Exception as e:
+            conn.rollback()
+            c.status = f"failed: {e}"
+            continue
+        c.build_s = time.perf_counter() - t0
+        c.size_bytes = conn.execute("SELECT pg_relation_size(%s::regclass)", (c.name,)).fetchone()[0]
+        _measure(conn, c, affected(c), baseline)
+        conn.rollback()
+        c.status = "no gain" if c.gain < min_gain else "candidate"
+
+    ranked = sorted((c for c in cands if c.status == "candidate"), key=lambda c: (-c.saved_ms, -c.gain))
+    kept, current = [], dict(baseline)
+    try:
+        for c in ranked:
+            conn.execute(c.ddl())
+            marginal = Candidate(c.table, c.columns)
+            _measure(conn, marginal, affected(c), current)
+            if marginal.gain < min_gain:
+                conn.execute(pgsql.SQL("DROP INDEX {}").format(pgsql.Identifier(c.name)))
+                c.status = "redundant"
+                continue
+            c.status = "recommended"
+            kept.append(c)
+            for q in affected(c):
+                current[id(q)] = _cost(conn, q.sql)
+    finally:
+        conn.rollback()
+    return kept
+
+def apply(conn, cands: list, queries: list) -> None:
+    # conn must be in autocommit mode: CREATE INDEX CONCURRENTLY cannot run in a transaction
+    for c in cands:
+        t0 = time.perf_counter()
+        conn.execute(c.ddl(concurrently=True))
+        _log(f"created {c.name} in {time.perf_counter() - t0:.1f}s")
+    for q in queries:
+        q.cost = _cost(conn, q.sql)
+
+def _log(*args) -> None:
+    print(*args, file=sys.stderr, flush=True)
+
+def _report(queries: list, cands: list, kept: list, verbose: bool) -> None:
+    total = sum(q.total_ms for q in queries)
+    print(f"workload: {sum(q.count for q in queries)} executions, {len(queries)} query shapes, "
+          f"{total / 1000:.1f}s measured")
+    if not cands:
+        print("no index candidates (every filter/join/sort column is already indexed)")
+        return
+    print(f"\n{'#':>2}  {'status':<11} {'index':<52} {'reason':<16} {'queries':>7} {'time ms':>9} "
+          f"{'cost before':>12} {'after':>12} {'gain':>6} {'size':>8}")
+    for i, c in enumerate(sorted(cands, key=lambda c: (c.status != "recommended", -c.saved_ms, -c.weight_ms)), 1):
+        cols = f"{c.table}({', '.join(c.columns)})"
+        print(f"{i:>2}  {c.status[:11]:<11} {cols:<52} {','.join(sorted(c.reasons)):<16} {len(c.queries):>7} "
+              f"{c.weight_ms:>9.0f} {c.before:>12.0f} {c.after:>12.0f} {c.gain:>6.0%} "
+              f"{c.size_bytes / 1048576:>6.1f}MB")
+        if verbose:
+            for pq in c.per_query:
+                print(f"      {pq['before']:>12.0f} -> {pq['after']:>10.0f}  x{pq['count']:<4} {pq['sql'][:100]}")
+    if kept:
+        print("\nrecommended:")
+        for c in kept:
+            print(f"  {c.ddl(concurrently=True).as_string(None)};")
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--log", default=workload.LOG_PATH or "logs/workload.jsonl",
+                    help="workload log (default WORKLOAD_LOG, else logs/workload.jsonl)")
+    ap.add_argument("--candidates", type=int, default=15, help="verify at most this many, heaviest first")
+    ap.add_argument("--min-gain", type=float, default=0.1,
+                    help="minimum drop of the affected queries' weighted planner cost (0.1 = 10%%)")
+    ap.add_argument("--apply", action="store_true", help="create the recommended indexes (CONCURRENTLY)")
+    ap.add_argument("--json", help="also write the report here")
+    ap.add_argument("--verbose", action="store_true", help="per-query costs")
+    ap.add_argument("--db-url", default=DB_URL)
+    args = ap.parse_args()
+
+    queries = load_workload(args.log)
+    if not queries:
+        _log(f"no workload logged at {args.log}; run the backend with WORKLOAD_LOG set first")
+        return
+    with connect(args.db_url) as conn:
+        catalog, existing = _catalog(conn)
+        conn.commit()
+        for q in queries:
+            q.tables = frozenset(t for t in analyze(q.sql).tables if t in catalog)
+        cands = candidates(queries, catalog, existing)[:args.candidates]
+        _log(f"verifying {len(cands)} candidate(s) against {len(queries)} query shape(s)")
+        kept = verify(conn, cands, queries, args.min_gain)
+    _report(queries, cands, kept, args.verbose)
+
+    if args.apply and kept:
+        with connect(args.db_url, autocommit=True) as conn:
+            before = {id(q): q.cost for q in queries}
+            apply(conn, kept, queries)
+        print("\napplied; planner cost now:")
+        for q in queries:
+            if before[id(q)] and q.cost is not None and q.cost < before[id(q)]:
+                print(f"  {before[id(q)]:>12.0f} -> {q.cost:>10.0f}  {q.sql[:100]}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({
+                "queries": [{"sql": q.sql, "count": q.count, "total_ms": round(q.total_ms, 2),
+                             "errors": q.errors, "cost": q.cost} for q in queries],
+                "candidates": [{
+                    "index": f"{c.table}({', '.join(c.columns)})", "ddl": c.ddl(concurrently=True).as_string(None),
+                    "status": c.status, "reasons": sorted(c.reasons), "weight_ms": round(c.weight_ms, 2),
+                    "cost_before": round(c.before, 2), "cost_after": round(c.after, 2), "gain": round(c.gain, 4),
+                    "saved_ms": round(c.saved_ms, 2), "build_s": round(c.build_s, 3),
+                    "size_bytes": c.size_bytes, "queries": c.per_query,
+                } for c in cands],
+            }, f, ensure_ascii=False, indent=2, default=str)
+
+if __name__ == "__main__":
+    main()
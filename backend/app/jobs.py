@@ -0,0 +1,243 @@
+# backend/app/jobs.py
+"""
+Background query jobs for results beyond the /ask row caps. A job runs its SQL
+through a server-side cursor on a pooled connection and spools the rows to
+<JOBS_DIR>/<id>.rows, one JSON array per line; <id>.json holds its state.
+Pages are read back from the file with an opaque cursor (a byte offset into
+it), so paging never re-runs the query or uses OFFSET. Running jobs hold at
+most one fetch chunk each in memory, and at most JOB_MAX_RUNNING run at once.
+"""
+import asyncio
+import base64
+import os
+import re
+import secrets
+import time
+import orjson
+from . import db
+from .encoding import dumps
+
+JOBS_DIR = os.getenv("JOBS_DIR", "spool/jobs")
+# row cap of a job's SQL (LIMIT added / clamped as for /ask)
+MAX_ROWS = int(os.getenv("JOB_MAX_ROWS", "1000000"))
+# jobs running at once; further submissions wait, up to JOB_MAX_QUEUED, then get Busy
+MAX_RUNNING = int(os.getenv("JOB_MAX_RUNNING", "2"))
+MAX_QUEUED = int(os.getenv("JOB_MAX_QUEUED", "20"))
+STATEMENT_TIMEOUT_MS = int(os.getenv("JOB_STATEMENT_TIMEOUT_MS", "300000"))
+# planner cost budget of a job's SQL (sql_cost); higher than SQL_COST_MAX since jobs may read far more rows
+MAX_COST = float(os.getenv("JOB_COST_MAX", "50000000"))
+# finished jobs are deleted this long after they finish; the sweep runs every JOB_CLEANUP_S
+TTL_S = float(os.getenv("JOB_TTL_S", "3600"))
+CLEANUP_S = float(os.getenv("JOB_CLEANUP_S", "60"))
+PAGE_ROWS = int(os.getenv("JOB_PAGE_ROWS", "1000"))
+PAGE_MAX_ROWS = int(os.getenv("JOB_PAGE_MAX_ROWS", "10000"))
+
+_ID = re.compile(r"^[A-Za-z0-9_-]{16}$")
+_tasks = {}     # job id -> asyncio.Task, queued or running in this process
+_slots = None   # asyncio.Semaphore(MAX_RUNNING), created in the running loop
+_running = 0
+
+class Busy(RuntimeError):
+    pass
+
+def _path(job_id: str, ext: str) -> str:
+    # ids come from URLs: only ever our own token format
+    if not _ID.match(job_id):
+        raise KeyError(job_id)
+    return os.path.join(JOBS_DIR, f"{job_id}.{ext}")
+
+def load(job_id: str) -> dict | None:
+    try:
+        with open(_path(job_id, "json"), "rb") as f:
+            return orjson.loads(f.read())
+    except (KeyError, OSError, ValueError):
+        return None
+
+def _save(meta: dict) -> None:
+    # replace atomically: readers never see a half-written state file
+    path = _path(meta["id"], "json")
+    with open(path + ".tmp", "wb") as f:
+        f.write(orjson.dumps(meta))
+    os.replace(path + ".tmp", path)
+
+def _remove(job_id: str) -> None:
+    for ext in ("json", "rows"):
+        try:
+            os.remove(_path(job_id, ext))
+        except OSError:
+            pass
+
+def submit(run_sql: str, sql: str, question: str | None = None, summary: str | None = None,
+           backend: dict | None = None, cost: dict | None = None) -> dict:
+    """
+    Queue `run_sql` (`sql` as shown to the user) and return the job's state.
+    Must be called outside any request deadline: the task inherits the context.
+    """
+    global _slots
+    if len(_tasks) >= MAX_RUNNING + MAX_QUEUED:
+        raise Busy(f"{len(_tasks)} jobs queued or running")
+    if _slots is None:
+        _slots = asyncio.Semaphore(MAX_RUNNING)
+    os.makedirs(JOBS_DIR, exist_ok=True)
+    job_id = secrets.token_urlsafe(12)
+    meta = {
+        "id": job_id, "status": "queued", "question": question, "sql": sql, "summary": summary,
+        "backend": backend, "cost": cost, "columns": None, "row_count": None, "bytes": None, "error": None,
+        "created_at": time.time(), "started_at": None, "finished_at": None, "expires_at": None,
+    }
+    _save(meta)
+    task = asyncio.create_task(_run(meta, run_sql))
+    _tasks[job_id] = task
+    task.add_done_callback(lambda _: _tasks.pop(job_id, None))
+    return meta
+
+async def _run(meta: dict, run_sql: str) -> None:
+    global _running
+    async with _slots:
+        _running += 1
+        meta.update(status="running", started_at=time.time())
+        _save(meta)
+        count, status, error = 0, "done", None
+        chunks = db.astream(run_sql, timeout_ms=STATEMENT_TIMEOUT_MS)
+        try:
+            with open(_path(meta["id"], "rows"), "wb") as f:
+                meta["columns"] = await chunks.__anext__()
+                _save(meta)
+                async for rows in chunks:
+                    # one chunk at a time: memory stays bounded whatever the result size
+                    await asyncio.to_thread(f.write, b"".join(dumps(row) + b"\n" for row in rows))
+                    count += len(rows)
+        except asyncio.CancelledError:
+            status, error = "failed", "cancelled"
+            raise
+        except Exception as e:
+            status, error = "failed", str(e).split("\n")[0]
+        finally:
+            await chunks.aclose()
+            if os.path.exists(_path(meta["id"], "json")):  # not deleted meanwhile
+                finished = time.time()
+                try:
+                    size = os.path.getsize(_path(meta["id"], "rows"))
+                except OSError:
+                    size = 0
+                meta.update(status=status, error=error, row_count=count, bytes=size,
+                            finished_at=finished, expires_at=finished + TTL_S)
+                _save(meta)
+            _running -= 1
+
+async def cancel(job_id: str) -> bool:
+    # stop the job if it is running here, then delete its files: removing
+    # them first would let the task's last write recreate them
+    task = _tasks.pop(job_id, None)
+    found = task is not None or load(job_id) is not None
+    if task is not None:
+        task.cancel()
+        await asyncio.wait({task})
+    _remove(job_id)
+    return found
+
+def _encode_cursor(offset: int, row: int) -> str:
+    return base64.urlsafe_b64encode(f"{offset}.{row}".encode()).decode().rstrip("=")
+
+def _decode_cursor(cursor: str) -> tuple:
+    try:
+        offset, row = map(int, base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode().split("."))
+    except ValueError:
+        raise ValueError("Invalid cursor") from None
+    if offset < 0 or row < 0:
+        raise ValueError("Invalid cursor")
+    return offset, row
+
+def page(job_id: str, cursor: str | None = None, limit: int = PAGE_ROWS) -> bytes | None:
+    """
+    One page of a job's rows as a JSON document {"id", "status", "columns",
+    "first_row", "row_count", "next", "error", "rows"}; None for an unknown job.
+    "next" is the cursor of the following page, null once a finished job (done
+    or failed) has been read to the end. A running job's pages end at the last row written so
+    far; polling the same "next" later picks up from there.
+    """
+    meta = load(job_id)
+    if meta is None:
+        return None
+    offset, first = _decode_cursor(cursor) if cursor else (0, 0)
+    limit = max(1, min(limit, PAGE_MAX_ROWS))
+    lines, end = [], offset
+    if meta["columns"] is not None:
+        try:
+            with open(_path(job_id, "rows"), "rb") as f:
+                # a cursor always points at the start of a row
+                if offset > os.fstat(f.fileno()).st_size:
+                    raise ValueError("Invalid cursor")
+                if offset:
+                    f.seek(offset - 1)
+                    if f.read(1) != b"\n":
+                        raise ValueError("Invalid cursor")
+                f.seek(offset)
+                while len(lines) < limit:
+                    line = f.readline()
+                    if not line.endswith(b"\n"):
+                        break  # end of file, or a row still being written
+                    lines.append(line[:-1])
+                    end += len(line)
+        except FileNotFoundError:
+            return None  # expired meanwhile
+    elif offset:
+        raise ValueError("Invalid cursor")
+    status = meta["status"]
+    # a failed job's rows up to the failure are readable too
+    more = status in ("queued", "running") or end < (meta["bytes"] or 0)
+    doc = dumps({
+        "id": job_id, "status": status, "columns": meta["columns"], "first_row": first,
+        "row_count": len(lines), "next": _encode_cursor(end, first + len(lines)) if more else None,
+        "error": meta["error"],
+    })
+    # spooled lines are already JSON arrays: splice them in instead of decoding and re-encoding
+    return doc[:-1] + b',"rows":[' + b",".join(lines) + b"]}"
+
+def cleanup(now: float | None = None) -> int:
+    """
+    Delete expired jobs, jobs left unfinished by an earlier process, and
+    row files without a state file; returns how many jobs were removed.
+    """
+    now = time.time() if now is None else now
+    removed = 0
+    try:
+        names = os.listdir(JOBS_DIR)
+    except OSError:
+        return 0
+    for name in names:
+        job_id, ext = os.path.splitext(name)
+        if job_id in _tasks:
+            continue
+        if ext == ".rows":
+            # orphaned (e.g. its job was deleted mid-write); a live job always has its .json
+            if _ID.match(job_id) and not os.path.exists(_path(job_id, "json")):
+                try:
+                    os.remove(os.path.join(JOBS_DIR, name))
+                except OSError:
+                    pass
+            continue
+        if ext != ".json":
+            continue
+        meta = load(job_id)
+        if meta is None:
+            continue
+        expires = meta["expires_at"] or meta["created_at"] + TTL_S + STATEMENT_TIMEOUT_MS / 1000.0
+        if expires < now:
+            _remove(job_id)
+            removed += 1
+    return removed
+
+async def cleanup_loop() -> None:
+    while True:
+        await asyncio.sleep(CLEANUP_S)
+        await asyncio.to_thread(cleanup)
+
+def shutdown() -> None:
+    # unfinished jobs are marked failed and expire as usual
+    for task in list(_tasks.values()):
+        task.cancel()
+
+def stats() -> dict:
+    return {"running": _running, "queued": len(_tasks) - _running,
+            "max_running": MAX_RUNNING, "max_queued": MAX_QUEUED, "ttl_s": TTL_S, "dir": JOBS_DIR}
@@ -1,4 +1,4 @@
 # backend/app/llm/__init__.py
-from .router import generate_sql
+from .router import generate, generate_sql, stream, startup, shutdown, status
 
-__all__ = ["generate_sql"]
+__all__ = ["generate", "generate_sql", "stream", "startup", "shutdown", "status"]
@@ -0,0 +1,129 @@
+# backend/app/llm/cache.py
+import asyncio
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# question -> SQL cache; LRU bounded by entry count, entries expire after TTL
+CACHE_SIZE = int(os.getenv("SQL_CACHE_SIZE", "2000"))
+CACHE_TTL_S = float(os.getenv("SQL_CACHE_TTL_S", "86400"))
+# optional SQLite file so cached SQL survives restarts (empty = memory only)
+CACHE_PATH = os.getenv("SQL_CACHE_PATH", "")
+
+_entries = OrderedDict()  # key -> (sql, expires_at)
+_inflight = {}            # key -> asyncio.Future of the generation in progress
+_stats = {"hits": 0, "misses": 0, "coalesced": 0}
+_lock = threading.Lock()
+_disk = None
+
+def normalize_question(question: str) -> str:
+    q = re.sub(r"\s+", " ", (question or "").strip().lower())
+    return q.rstrip("?.! ")
+
+def fingerprint(*parts: str) -> str:
+    h = hashlib.sha256()
+    for p in parts:
+        h.update((p or "").encode("utf-8"))
+        h.update(b"\x00")
+    return h.hexdigest()[:16]
+
+def make_key(question: str, backend: str, schema_text: str, prompt_text: str) -> str:
+    """
+    backend: LLM_MODE + model id; schema/prompt are fingerprinted so a schema
+    refresh or a prompt change never serves stale SQL.
+    """
+    return f"{backend}|{fingerprint(schema_text, prompt_text)}|{normalize_question(question)}"
+
+def _get_disk():
+    global _disk
+    if _disk is None and CACHE_PATH:
+        _disk = sqlite3.connect(CACHE_PATH, check_same_thread=False)
+        _disk.execute(
+            "CREATE TABLE IF NOT EXISTS sql_cache (key TEXT PRIMARY KEY, sql TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        _disk.commit()
+    return _disk
+
+def get(key: str) -> str | None:
+    now = time.time()
+    with _lock:
+        item = _entries.get(key)
+        if item is not None:
+            if item[1] > now:
+                _entries.move_to_end(key)
+                _stats["hits"] += 1
+                return item[0]
+            del _entries[key]
+
+        disk = _get_disk()
+        if disk is not None:
+            row = disk.execute(
+                "SELECT sql, expires_at FROM sql_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row and row[1] > now:
+                _remember(key, row[0], row[1])
+                _stats["hits"] += 1
+                return row[0]
+    return None
+
+def _remember(key: str, sql: str, expires_at: float) -> None:
+    _entries[key] = (sql, expires_at)
+    _entries.move_to_end(key)
+    while len(_entries) > CACHE_SIZE:
+        _entries.popitem(last=False)
+
+def put(key: str, sql: str) -> None:
+    expires_at = time.time() + CACHE_TTL_S
+    with _lock:
+        _remember(key, sql, expires_at)
+        disk = _get_disk()
+        if disk is not None:
+            disk.execute(
+                "INSERT OR REPLACE INTO sql_cache (key, sql, expires_at) VALUES (?, ?, ?)",
+                (key, sql, expires_at),
+            )
+            disk.execute("DELETE FROM sql_cache WHERE expires_at <= ?", (time.time(),))
+            disk.commit()
+
+async def coalesce(key: str, generate):
+    """
+    Run `generate()` once for all concurrent callers with the same key and
+    give each of them its result (nothing is cached).
+    """
+    fut = _inflight.get(key)
+    if fut is not None:
+        _stats["coalesced"] += 1
+        return await asyncio.shield(fut)
+
+    fut = asyncio.get_running_loop().create_future()
+    _inflight[key] = fut
+    _stats["misses"] += 1
+    try:
+        result = await generate()
+    except asyncio.CancelledError:
+        fut.cancel()
+        raise
+    except Exception as e:
+        fut.set_exception(e)
+        fut.exception()  # mark retrieved when nobody else was waiting
+        raise
+    finally:
+        _inflight.pop(key, None)
+
+    fut.set_result(result)
+    return result
+
+def clear() -> None:
+    with _lock:
+        _entries.clear()
+        disk = _get_disk()
+        if disk is not None:
+            disk.execute("DELETE FROM sql_cache")
+            disk.commit()
+
+def stats() -> dict:
+    return {**_stats, "size": len(_entries), "max_size": CACHE_SIZE, "persistent": bool(CACHE_PATH)}
@@ -0,0 +1,424 @@
+# backend/app/llm/chain.py
+"""
+Ordered LLM backend chain (LLM_CHAIN=vllm,ollama,hf,mock) with:
+- a timeout per backend; a failed or timed-out call falls through to the next backend
+- a hedged request to the next backend when the current one runs past its p95
+- a circuit breaker per backend: after LLM_BREAKER_FAILURES failures in a
+  row it is skipped for LLM_BREAKER_COOLDOWN_S, then one probe call decides
+- live latency / error tracking that moves a backend ahead of the ones
+  configured before it once it is clearly faster in expectation
+- admission control: at most LLM_MAX_INFLIGHT calls per backend, a bounded
+  queue behind them, and early rejection when the queue wait would not fit
+  the request's deadline (app/deadline.py), which also caps every timeout
+mock never fails and always stays last.
+"""
+import asyncio
+import os
+import random
+import time
+from collections import deque
+from .. import metrics
+from ..deadline import DeadlineExceeded, generation_limit
+
+# per-backend timeout (seconds); overrides as "vllm=10,ollama=30"
+TIMEOUT_S = float(os.getenv("LLM_TIMEOUT_S", "120"))
+TIMEOUTS = {
+    k.strip().lower(): float(v)
+    for k, v in (item.split("=", 1) for item in os.getenv("LLM_TIMEOUTS", "").split(",") if "=" in item)
+}
+# hedge once the running call passes the backend's p95, known after this many successful calls
+HEDGE = os.getenv("LLM_HEDGE", "1") == "1"
+HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+BREAKER_COOLDOWN_S = float(os.getenv("LLM_BREAKER_COOLDOWN_S", "30"))
+# reorder by expected time per answer; a backend moves ahead only when this many times better
+REORDER = os.getenv("LLM_CHAIN_REORDER", "1") == "1"
+REORDER_MARGIN = float(os.getenv("LLM_REORDER_MARGIN", "1.5"))
+# share of calls that use the configured order, so a demoted backend can prove it has recovered
+EXPLORE = float(os.getenv("LLM_CHAIN_EXPLORE", "0.05"))
+WINDOW = int(os.getenv("LLM_LATENCY_WINDOW", "200"))
+# concurrent calls per backend (overrides as "hf=8,ollama=4") and calls allowed to wait for a slot
+MAX_INFLIGHT = int(os.getenv("LLM_MAX_INFLIGHT", "32"))
+MAX_INFLIGHTS = {
+    k.strip().lower(): int(v)
+    for k, v in (item.split("=", 1) for item in os.getenv("LLM_MAX_INFLIGHTS", "").split(",") if "=" in item)
+}
+MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "64"))
+_ALPHA = 0.1  # EWMA weight of the newest call
+
+class Overloaded(RuntimeError):
+    """
+    Admission refused the call; `status` is the HTTP status to answer with
+    (429 queue full, 503 the wait would not fit the deadline).
+    """
+
+    def __init__(self, message: str, status: int = 503):
+        super().__init__(message)
+        self.status = status
+
+class BackendHealth:
+    """
+    Latency window, error rate and circuit breaker of one backend.
+    """
+
+    def __init__(self, mode: str):
+        self.mode = mode
+        self.latencies = deque(maxlen=WINDOW)  # seconds of successful calls
+        self.latency = None                    # EWMA seconds
+        self.error_rate = 0.0                  # EWMA of failures (timeouts included)
+        self.failures = 0                      # in a row
+        self.open_until = 0.0
+        self.probing = False
+        self.calls = {"ok": 0, "error": 0, "timeout": 0, "cancelled": 0, "rejected": 0}
+        self.service = None                    # EWMA seconds holding a slot (queue wait excluded)
+        self.inflight = 0
+        self.queued = 0
+        self._slots = None                     # asyncio.Semaphore, created in the running loop
+
+    @property
+    def timeout(self) -> float:
+        return TIMEOUTS.get(self.mode, TIMEOUT_S)
+
+    @property
+    def max_inflight(self) -> int:
+        return MAX_INFLIGHTS.get(self.mode, MAX_INFLIGHT)
+
+    @property
+    def state(self) -> str:
+        if self.failures < BREAKER_FAILURES:
+            return "closed"
+        return "open" if time.monotonic() < self.open_until else "half_open"
+
+    def p95(self) -> float | None:
+        if len(self.latencies) < HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))]
+
+    def score(self) -> float | None:
+        # expected seconds until an answer: latency plus the time a failure costs
+        if self.latency is None:
+            return None
+        return self.latency + self.error_rate * self.timeout
+
+    def acquire(self) -> bool:
+        # may a call go out now? a half-open breaker lets exactly one probe through
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self.probing:
+            self.probing = True
+            return True
+        return False
+
+    def admit(self, budget: float) -> None:
+        """
+        Raise Overloaded unless a call could start and finish within
+        `budget` seconds: a free slot, or a queue position whose expected
+        wait plus one call fits.
+        """
+        if self.inflight < self.max_inflight:
+            return
+        if self.queued >= MAX_QUEUE:
+            self.reject()
+            raise Overloaded(f"{self.mode}: queue full ({self.queued} waiting)", 429)
+        if self.service is not None:
+            # slots free up every service / max_inflight seconds on average
+            wait = (self.queued + 1) / self.max_inflight * self.service
+            if wait + self.service > budget:
+                self.reject()
+                raise Overloaded(f"{self.mode}: ~{wait:.1f}s queue wait does not fit the deadline", 503)
+
+    def release(self) -> None:
+        # an acquired call that never went out: it was no probe, the next call may be
+        self.probing = False
+
+    def reject(self) -> None:
+        self.calls["rejected"] += 1
+        metrics.LLM_BACKEND_CALLS.labels(self.mode, "rejected").inc()
+        self.release()
+
+    async def enter(self) -> None:
+        # wait for a slot
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_inflight)
+        self.queued += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.queued -= 1
+        self.inflight += 1
+
+    def leave(self, seconds: float | None = None) -> None:
+        # release the slot; `seconds` held it for a completed call
+        self.inflight -= 1
+        self._slots.release()
+        if seconds is not None:
+            self.service = seconds if self.service is None else self.service + _ALPHA * (seconds - self.service)
+
+    def record(self, outcome: str, seconds: float) -> None:
+        self.calls[outcome] += 1
+        metrics.LLM_BACKEND_CALLS.labels(self.mode, outcome).inc()
+        if outcome == "cancelled":
+            # lost a hedge race: no error, but it took at least `seconds`, which
+            # only says something when that is already slower than expected
+            self.probing = False
+            if self.latency is not None and seconds > self.latency:
+                self.latencies.append(seconds)
+                self.latency += _ALPHA * (seconds - self.latency)
+            return
+        failed = outcome != "ok"
+        self.error_rate += _ALPHA * (failed - self.error_rate)
+        if failed:
+            self.failures += 1
+            if self.failures >= BREAKER_FAILURES:
+                self.open_until = time.monotonic() + BREAKER_COOLDOWN_S
+        else:
+            if self.failures >= BREAKER_FAILURES:
+                self.error_rate = 0.0  # probe succeeded: the breaker closes with a clean record
+            self.failures = 0
+            self.latencies.append(seconds)
+            self.latency = seconds if self.latency is None else self.latency + _ALPHA * (seconds - self.latency)
+        self.probing = False
+        metrics.LLM_BREAKER_OPEN.labels(self.mode).set(self.state == "open")
+
+    def stats(self) -> dict:
+        p95 = self.p95()
+        return {
+            "state": self.state,
+            "timeout_s": self.timeout,
+            "latency_ms": None if self.latency is None else round(self.latency * 1000.0, 1),
+            "p95_ms": None if p95 is None else round(p95 * 1000.0, 1),
+            "error_rate": round(self.error_rate, 3),
+            "failures_in_row": self.failures,
+            "inflight": self.inflight,
+            "queued": self.queued,
+            "max_inflight": self.max_inflight,
+            "calls": dict(self.calls),
+        }
+
+_health = {}  # mode -> BackendHealth
+
+def health(mode: str) -> BackendHealth:
+    h = _health.get(mode)
+    if h is None:
+        h = _health.setdefault(mode, BackendHealth(mode))
+    return h
+
+def configured(default_mode: str) -> list:
+    """
+    LLM_CHAIN as a list of modes; just LLM_MODE when unset.
+    """
+    chain = [m.strip().lower() for m in os.getenv("LLM_CHAIN", "").split(",") if m.strip()]
+    chain = list(dict.fromkeys(chain)) or [default_mode]
+    if "mock" in chain:
+        chain = [m for m in chain if m != "mock"] + ["mock"]
+    return chain
+
+def order(chain: list, reorder: bool = REORDER) -> list:
+    """
+    Current order of the chain: reachable backends first, then those whose
+    breaker is open; within them the configured order, except that a
+    backend with a REORDER_MARGIN times lower score moves ahead of
+    backends with a known score. Untried and half-open backends keep their
+    place, so they get called (and probed).
+    """
+    real = [m for m in chain if m != "mock"]
+    if reorder:
+        scores = {m: None if health(m).state == "half_open" else health(m).score() for m in real}
+        ranked = []
+        for mode in real:
+            score = scores[mode]
+            i = len(ranked)
+            while score is not None and i > 0:
+                other = scores[ranked[i - 1]]
+                if other is None or score * REORDER_MARGIN >= other:
+                    break
+                i -= 1
+            ranked.insert(i, mode)
+        real = ranked
+    real.sort(key=lambda m: health(m).state == "open")
+    return real + (["mock"] if "mock" in chain else [])
+
+def _describe(mode: str, e: BaseException) -> str:
+    return f"{mode}: {(str(e) or type(e).__name__).splitlines()[0]}"
+
+async def _in_slot(h: BackendHealth, call):
+    await h.enter()
+    t0 = time.perf_counter()
+    try:
+        result = await call(h.mode)
+    except BaseException:
+        h.leave()
+        raise
+    h.leave(time.perf_counter() - t0)
+    return result
+
+async def _attempt(mode: str, call) -> str:
+    h = health(mode)
+    try:
+        limit = generation_limit(h.timeout)
+    except DeadlineExceeded:
+        h.release()
+        raise
+    if mode != "mock":
+        h.admit(limit)
+    t0 = time.perf_counter()
+    try:
+        result = await asyncio.wait_for(_in_slot(h, call) if mode != "mock" else call(mode), timeout=limit)
+    except asyncio.TimeoutError:
+        if limit < h.timeout:
+            # cut short by the request's deadline, not by the backend's own timeout
+            h.record("cancelled", time.perf_counter() - t0)
+            raise DeadlineExceeded(f"Deadline exceeded waiting for {mode}") from None
+        h.record("timeout", time.perf_counter() - t0)
+        raise TimeoutError(f"no answer within {h.timeout:g}s") from None
+    except asyncio.CancelledError:
+        h.record("cancelled", time.perf_counter() - t0)
+        raise
+    except Exception:
+        h.record("error", time.perf_counter() - t0)
+        raise
+    h.record("ok", time.perf_counter() - t0)
+    return result
+
+async def run(chain: list, call) -> tuple:
+    """
+    Answer with the first backend of `chain` (in current order) that
+    succeeds; `call(mode)` is a coroutine factory. Returns
+    (result, mode, info) with info {"hedged", "fallback", "tried"}.
+    """
+    queue = order(chain, reorder=REORDER and random.random() >= EXPLORE)
+    first = queue[0] if queue else None
+    pending = {}  # task -> mode
+    tried, errors, rejected, hedged, expired = [], [], [], False, None
+
+    def launch() -> bool:
+        while queue:
+            mode = queue.pop(0)
+            if mode == "mock" or health(mode).acquire():
+                tried.append(mode)
+                pending[asyncio.ensure_future(_attempt(mode, call))] = mode
+                return True
+        return False
+
+    launch()
+    try:
+        while pending:
+            wait = None
+            if HEDGE and len(pending) == 1 and queue and not hedged:
+                p95 = health(next(iter(pending.values()))).p95()
+                if p95 is not None:
+                    wait = p95
+            done, _ = await asyncio.wait(pending, timeout=wait, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                # the running call is past its p95: race it against the next backend
+                hedged = launch()
+                if hedged:
+                    metrics.LLM_HEDGES.inc()
+                continue
+            for task in done:
+                mode = pending.pop(task)
+                e = task.exception()
+                if e is None:
+                    return task.result(), mode, {"hedged": hedged, "fallback": mode != first, "tried": tried}
+                errors.append(_describe(mode, e))
+                if isinstance(e, DeadlineExceeded):
+                    expired = e
+                elif isinstance(e, Overloaded):
+                    rejected.append(e)
+            if not pending:
+                if expired is not None:
+                    raise expired  # no time left for the next backend
+                launch()
+    finally:
+        for task, mode in pending.items():
+            # a task cancelled before its first step never reaches _attempt's record()
+            task.cancel()
+            health(mode).release()
+    return _give_up(chain, tried, errors, rejected)
+
+def _give_up(chain: list, tried: list, errors: list, rejected: list):
+    if not tried:
+        raise RuntimeError("No LLM backend available (circuit open: " + ", ".join(chain) + ")")
+    if rejected:
+        # 429 only when every backend turned the call away for a full queue
+        status = 429 if len(rejected) == len(errors) and all(e.status == 429 for e in rejected) else 503
+        raise Overloaded("LLM backends overloaded: " + "; ".join(errors), status)
+    raise RuntimeError("All LLM backends failed: " + "; ".join(errors))
+
+async def stream(chain: list, open_stream):
+    """
+    Streaming variant of run(), without hedging: yields (mode, text) from the
+    first backend that gets its text out; `open_stream(mode)` returns an
+    async iterator. A backend failing before its first chunk falls through
+    to the next one; after that the error propagates. The timeout bounds
+    the whole stream.
+    """
+    tried, errors, rejected = [], [], []
+    for mode in order(chain):
+        h = health(mode)
+        if mode != "mock" and not h.acquire():
+            continue
+        tried.append(mode)
+        try:
+            limit = generation_limit(h.timeout)
+        except DeadlineExceeded:
+            h.release()
+            raise
+        if mode != "mock":
+            try:
+                h.admit(limit)
+            except Overloaded as e:
+                errors.append(_describe(mode, e))
+                rejected.append(e)
+                continue
+        t0 = time.perf_counter()
+        chunks = None
+        started = False
+        slot = False
+        try:
+            chunks = open_stream(mode).__aiter__()
+            if mode != "mock":
+                await asyncio.wait_for(h.enter(), timeout=limit)
+                slot = True
+            while True:
+                left = limit - (time.perf_counter() - t0)
+                try:
+                    text = await asyncio.wait_for(chunks.__anext__(), timeout=max(left, 0.0))
+                except StopAsyncIteration:
+                    break
+                started = True
+                yield mode, text
+        except asyncio.TimeoutError:
+            if limit < h.timeout:
+                h.record("cancelled", time.perf_counter() - t0)
+                raise DeadlineExceeded(f"Deadline exceeded waiting for {mode}") from None
+            h.record("timeout", time.perf_counter() - t0)
+            error = TimeoutError(f"no answer within {h.timeout:g}s")
+        except (asyncio.CancelledError, GeneratorExit):
+            h.record("cancelled", time.perf_counter() - t0)
+            raise
+        except Exception as e:
+            h.record("error", time.perf_counter() - t0)
+            error = e
+        else:
+            h.record("ok", time.perf_counter() - t0)
+            return
+        finally:
+            if slot:
+                h.leave()
+            # an abandoned backend's HTTP stream / streamer is released now, not at garbage collection
+            aclose = getattr(chunks, "aclose", None)
+            if aclose is not None:
+                try:
+                    await aclose()
+                except Exception:
+                    pass
+        if started:
+            raise error
+        errors.append(_describe(mode, error))
+    _give_up(chain, tried, errors, rejected)
+
+def stats(chain: list) -> dict:
+    return {"chain": order(chain), "backends": {m: health(m).stats() for m in chain if m != "mock"}}
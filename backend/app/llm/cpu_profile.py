@@ -0,0 +1,100 @@
+# backend/app/llm/cpu_profile.py
+import os
+import torch
+
+# CPU inference profile for the HF backend (ignored on CUDA):
+#   fp32 - float32 weights (default)
+#   bf16 - bfloat16 weights; about half the memory traffic, fast on AVX512-BF16/AMX CPUs
+#   int8 - float32 model with dynamically quantized int8 Linear layers
+PROFILE = os.getenv("HF_CPU_PROFILE", "fp32").strip().lower()
+# intra-op threads (0 = one per CPU the process may run on) and inter-op threads (0 = torch default)
+THREADS = int(os.getenv("HF_CPU_THREADS", "0"))
+INTEROP_THREADS = int(os.getenv("HF_CPU_INTEROP_THREADS", "0"))
+# pin the process before the weights are loaded so they are allocated on the
+# same NUMA node: a CPU list ("0-15,32-47") or "node:N"; empty = no pinning
+AFFINITY = os.getenv("HF_CPU_AFFINITY", "").strip()
+# torch.compile the model forward (first generations are slow while it compiles)
+COMPILE = os.getenv("HF_COMPILE", "0") == "1"
+
+_DTYPES = {"fp32": torch.float32, "bf16": torch.bfloat16, "int8": torch.float32}
+
+def parse_cpu_list(text: str) -> set:
+    """
+    "0-3,8" -> {0, 1, 2, 3, 8} (the format of /sys/.../cpulist).
+    """
+    cpus = set()
+    for part in text.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        lo, _, hi = part.partition("-")
+        cpus.update(range(int(lo), int(hi or lo) + 1))
+    return cpus
+
+def _affinity_cpus(spec: str) -> set:
+    if spec.startswith("node:"):
+        node = int(spec.split(":", 1)[1])
+        with open(f"/sys/devices/system/node/node{node}/cpulist") as f:
+            return parse_cpu_list(f.read())
+    return parse_cpu_list(spec)
+
+def _numa_nodes(cpus: set) -> list:
+    # NUMA nodes the given CPUs belong to (empty where sysfs has no node info)
+    nodes = []
+    base = "/sys/devices/system/node"
+    if os.path.isdir(base):
+        for name in sorted(os.listdir(base)):
+            if name.startswith("node") and name[4:].isdigit():
+                with open(f"{base}/{name}/cpulist") as f:
+                    if parse_cpu_list(f.read()) & cpus:
+                        nodes.append(int(name[4:]))
+    return nodes
+
+def dtype() -> torch.dtype:
+    if PROFILE not in _DTYPES:
+        raise ValueError(f"Unknown HF_CPU_PROFILE='{PROFILE}'. Use: fp32 | bf16 | int8")
+    return _DTYPES[PROFILE]
+
+def configure_process() -> dict:
+    """
+    CPU pinning and thread pools; call before the weights are loaded.
+    """
+    if AFFINITY and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, _affinity_cpus(AFFINITY))
+    cpus = os.sched_getaffinity(0) if hasattr(os, "sched_getaffinity") else set(range(os.cpu_count() or 1))
+
+    torch.set_num_threads(THREADS or len(cpus))
+    if INTEROP_THREADS:
+        try:
+            torch.set_num_interop_threads(INTEROP_THREADS)
+        except RuntimeError:
+            pass  # only settable before the first parallel op
+
+    return {
+        "cpus": len(cpus),
+        "numa_nodes": _numa_nodes(cpus),
+        "pinned": bool(AFFINITY),
+        "threads": torch.get_num_threads(),
+        "interop_threads": torch.get_num_interop_threads(),
+    }
+
+def prepare_model(model):
+    """
+    Apply the weight profile and optional compile to a loaded CPU model.
+    """
+    if PROFILE == "int8":
+        model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    if COMPILE:
+        model.forward = torch.compile(model.forward, dynamic=True)
+    return model
+
+def report(process: dict) -> dict:
+    return {
+        "profile": PROFILE,
+        "dtype": str(dtype()).replace("torch.", ""),
+        "compile": COMPILE,
+        **process,
+        "torch": torch.__version__,
+        "mkldnn": torch.backends.mkldnn.is_available(),
+        "cpu_capability": torch.backends.cpu.get_cpu_capability(),
+    }
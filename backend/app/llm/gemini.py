@@ -4,6 +4,7 @@ import re
 from google import genai
 from google.genai import types
 from .rules import BASE_RULES, build_domain_rules
+from .. import metrics
 
 _client = None
 
@@ -32,26 +33,7 @@ def _extract_sql(text: str) -> str:
         sql += ";"
     return sql
 
-def _apply_limit(sql: str, question: str, default_limit: int = 50) -> str:
-    s = sql.strip().rstrip(";")
-
-    # top N => LIMIT N
-    m = re.search(r"\btop\s+(\d+)\b", question, flags=re.IGNORECASE)
-    if m:
-        n = int(m.group(1))
-        if re.search(r"\bLIMIT\s+\d+\b", s, flags=re.IGNORECASE):
-            s = re.sub(r"\bLIMIT\s+\d+\b", f"LIMIT {n}", s, flags=re.IGNORECASE)
-        else:
-            s = f"{s} LIMIT {n}"
-        return s + ";"
-
-    # default LIMIT
-    if not re.search(r"\bLIMIT\b", s, flags=re.IGNORECASE):
-        s = f"{s} LIMIT {default_limit}"
-    return s + ";"
-
-def generate_sql(question: str, schema_text: str) -> str:
-    client = _get_client()
+def _request(question: str, schema_text: str) -> dict:
     model_name = os.getenv("GEMINI_MODEL", "gemini-2.5-flash")
 
     # Build dynamic system prompt
@@ -64,17 +46,48 @@ def generate_sql(question: str, schema_text: str) -> str:
         f"Return ONLY SQL."
     )
 
-    resp = client.models.generate_content(
-        model=model_name,
-        contents=user_prompt,
-        config=types.GenerateContentConfig(
+    return {
+        "model": model_name,
+        "contents": user_prompt,
+        "config": types.GenerateContentConfig(
             system_instruction=system,
             temperature=0.0,
+            # end decoding at the first complete statement
+            stop_sequences=[";"],
         ),
-    )
+    }
 
-    text = getattr(resp, "text", "") or ""
+def _record_usage(resp) -> None:
+    usage = getattr(resp, "usage_metadata", None)
+    if usage is not None:
+        metrics.record_tokens(
+            "gemini", getattr(usage, "prompt_token_count", None), getattr(usage, "candidates_token_count", None)
+        )
+
+def _finish(text: str) -> str:
     sql = _extract_sql(text)
     if not sql:
-        raise ValueError(f"Gemini did not return SQL. Raw: {text[:300]}")
-    return _apply_limit(sql, question)
+        raise ValueError(f"Gemini did not return SQL. Raw: {(text or '')[:300]}")
+    # LIMIT (incl. "top N") is applied once, in the /ask pipeline
+    return sql
+
+async def generate_sql(question: str, schema_text: str) -> str:
+    # async API: no worker thread is blocked while Gemini answers
+    resp = await _get_client().aio.models.generate_content(**_request(question, schema_text))
+    _record_usage(resp)
+    return _finish(getattr(resp, "text", "") or "")
+
+async def stream_sql(question: str, schema_text: str):
+    """
+    Yields text chunks as Gemini streams them.
+    """
+    stream = await _get_client().aio.models.generate_content_stream(**_request(question, schema_text))
+    last = None
+    async for chunk in stream:
+        last = chunk
+        text = getattr(chunk, "text", "") or ""
+        if text:
+            yield text
+    if last is not None:
+        # the final chunk carries the usage totals
+        _record_usage(last)
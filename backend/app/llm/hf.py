@@ -1,11 +1,40 @@
+import asyncio
+import hashlib
 import os
 import re
+import threading
+from collections import OrderedDict
 import torch
-from transformers import AutoTokenizer, AutoModelForCausalLM
+from transformers import AutoTokenizer, AutoModelForCausalLM, DynamicCache
+from transformers.generation.streamers import BaseStreamer
+from . import cpu_profile
+from .batcher import MicroBatcher
+from .. import metrics
 
 _TOKENIZER = None
 _MODEL = None
 _DEVICE = None
+_LOAD_LOCK = threading.Lock()
+PROFILE_REPORT = None  # chosen device/dtype/threads, set once the model is loaded
+
+# decoding budget; with HF_STOP_AT_SEMICOLON every token containing ';' acts as
+# an extra EOS, so a row stops right after its first statement
+MAX_NEW_TOKENS = int(os.getenv("HF_MAX_NEW_TOKENS", "256"))
+STOP_AT_SEMICOLON = os.getenv("HF_STOP_AT_SEMICOLON", "1") == "1"
+_STOP_IDS = None  # eos + ';' token ids, set when the tokenizer is loaded
+
+# micro-batching: concurrent questions are collected for up to HF_BATCH_WAIT_MS
+# (or HF_BATCH_SIZE prompts) and decoded with a single generate() call
+BATCH_SIZE = int(os.getenv("HF_BATCH_SIZE", "8"))
+BATCH_WAIT_MS = float(os.getenv("HF_BATCH_WAIT_MS", "10"))
+_BATCHER = None
+
+# KV cache of the constant system prompt + schema prefix, computed once per
+# (model, prefix fingerprint) so only the question tokens are prefilled
+PREFIX_CACHE = os.getenv("HF_PREFIX_CACHE", "1") == "1"
+PREFIX_CACHE_SIZE = int(os.getenv("HF_PREFIX_CACHE_SIZE", "16"))
+_PREFIXES = OrderedDict()  # (model_id, fingerprint) -> (prefix_ids list, legacy past_key_values)
+_QUESTION_SLOT = "\u0000QUESTION\u0000"
 
 SYSTEM_PROMPT = (
     "You are an expert NL-to-SQL assistant for PostgreSQL.\n"
@@ -51,26 +80,53 @@ SYSTEM_PROMPT = (
 )
 
 def _load():
-    global _TOKENIZER, _MODEL, _DEVICE
+    with _LOAD_LOCK:
+        _load_locked()
+
+def _load_locked():
+    global _TOKENIZER, _MODEL, _DEVICE, _STOP_IDS, PROFILE_REPORT
     if _MODEL is not None and _TOKENIZER is not None:
         return
 
     model_id = os.getenv("HF_MODEL", "Qwen/Qwen2.5-3B-Instruct")
 
     _TOKENIZER = AutoTokenizer.from_pretrained(model_id)
+    # batched decoder-only generation needs left padding
+    _TOKENIZER.padding_side = "left"
+    if _TOKENIZER.pad_token is None:
+        _TOKENIZER.pad_token = _TOKENIZER.eos_token
+    _STOP_IDS = [_TOKENIZER.eos_token_id]
+    if STOP_AT_SEMICOLON:
+        _STOP_IDS += sorted(i for tok, i in _TOKENIZER.get_vocab().items() if ";" in tok)
 
     _DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
-    dtype = torch.float16 if _DEVICE == "cuda" else torch.float32
+    if _DEVICE == "cuda":
+        dtype = torch.float16
+    else:
+        # pinning/threads first: weights are then allocated on the pinned NUMA node
+        dtype = cpu_profile.dtype()
+        process = cpu_profile.configure_process()
 
     # NOTE: use dtype= (torch_dtype is deprecated in some stacks)
-    _MODEL = AutoModelForCausalLM.from_pretrained(
+    model = AutoModelForCausalLM.from_pretrained(
         model_id,
         torch_dtype=dtype,
         device_map="auto" if _DEVICE == "cuda" else None,
     )
 
     if _DEVICE == "cpu":
-        _MODEL.to(_DEVICE)
+        model.to(_DEVICE)
+        model = cpu_profile.prepare_model(model)
+        PROFILE_REPORT = {"model": model_id, "device": "cpu", **cpu_profile.report(process)}
+    else:
+        PROFILE_REPORT = {"model": model_id, "device": str(next(model.parameters()).device), "dtype": "float16"}
+
+    # publish only once fully loaded (agenerate_sql checks _MODEL without the lock)
+    _MODEL = model
+    print(f"[hf] loaded {PROFILE_REPORT}")
+    metrics.HF_MODEL_INFO.labels(
+        model_id, PROFILE_REPORT["device"], PROFILE_REPORT["dtype"], PROFILE_REPORT.get("profile", "cuda")
+    ).set(1)
 
 def _extract_sql(text: str) -> str:
     text = (text or "").strip()
@@ -92,24 +148,6 @@ def _extract_sql(text: str) -> str:
 
     return text
 
-def _apply_limit(sql: str, question: str, default_limit: int = 50) -> str:
-    s = sql.strip().rstrip(";")
-
-    # If user says "top N" (top 5, top 10, etc.), force LIMIT N
-    m = re.search(r"\btop\s+(\d+)\b", question, flags=re.IGNORECASE)
-    if m:
-        n = int(m.group(1))
-        if re.search(r"\bLIMIT\s+\d+\b", s, flags=re.IGNORECASE):
-            s = re.sub(r"\bLIMIT\s+\d+\b", f"LIMIT {n}", s, flags=re.IGNORECASE)
-        else:
-            s = f"{s} LIMIT {n}"
-        return s + ";"
-
-    # Otherwise ensure there's SOME limit
-    if not re.search(r"\bLIMIT\b", s, flags=re.IGNORECASE):
-        s = f"{s} LIMIT {default_limit}"
-    return s + ";"
-
 def _build_prompt(schema_text: str, question: str) -> str:
     user_content = (
         f"{SYSTEM_PROMPT}\n"
@@ -129,31 +167,213 @@ def _build_prompt(schema_text: str, question: str) -> str:
         )
     return user_content
 
-def generate_sql(question: str, schema_text: str) -> str:
-    _load()
-    print("Torch CUDA available:", torch.cuda.is_available())
-    print("Model device:", next(_MODEL.parameters()).device)
+class _RowStreamer(BaseStreamer):
+    """
+    Hands the new text of each batch row to that row's callback as tokens
+    are decoded (rows without a callback are skipped).
+    """
 
-    prompt = _build_prompt(schema_text, question)
-    inputs = _TOKENIZER(prompt, return_tensors="pt")
-    inputs = {k: v.to(_MODEL.device) for k, v in inputs.items()}
+    def __init__(self, callbacks: list):
+        self.callbacks = callbacks
+        self.tokens = [[] for _ in callbacks]
+        self.sent = [0] * len(callbacks)
+        self.done = [cb is None for cb in callbacks]
+        self.stop = set(_STOP_IDS)
+        self.prompt = True
 
+    def put(self, value):
+        if self.prompt:
+            # generate() hands over the prompt ids first
+            self.prompt = False
+            return
+        for row, tok in enumerate(value.tolist()):
+            if self.done[row]:
+                continue
+            self.tokens[row].append(tok)
+            self.done[row] = tok in self.stop
+            self._flush(row, final=self.done[row])
+
+    def end(self):
+        for row in range(len(self.callbacks)):
+            if self.callbacks[row] is not None:
+                self._flush(row, final=True)
+
+    def _flush(self, row: int, final: bool):
+        text = _TOKENIZER.decode(self.tokens[row], skip_special_tokens=True)
+        # hold back a partially decoded multi-byte character
+        if len(text) > self.sent[row] and (final or not text.endswith("\ufffd")):
+            self.callbacks[row](text[self.sent[row]:])
+            self.sent[row] = len(text)
+
+def _generate(input_ids, attention_mask, past_key_values=None, streamer=None):
     with torch.inference_mode():
-        out = _MODEL.generate(
-            **inputs,
-            max_new_tokens=256,
+        return _MODEL.generate(
+            input_ids=input_ids,
+            attention_mask=attention_mask,
+            past_key_values=past_key_values,
+            max_new_tokens=MAX_NEW_TOKENS,
             do_sample=False,      # deterministic
             # NOTE: don't pass temperature/top_p/top_k when do_sample=False
-            eos_token_id=_TOKENIZER.eos_token_id,
+            eos_token_id=_STOP_IDS,
+            pad_token_id=_TOKENIZER.pad_token_id,
+            streamer=streamer,
         )
 
-    # Decode ONLY the newly generated tokens (avoid prompt-echo issues)
-    gen_tokens = out[0][inputs["input_ids"].shape[-1]:]
-    decoded = _TOKENIZER.decode(gen_tokens, skip_special_tokens=True).strip()
+def _streamer(callbacks: list):
+    return _RowStreamer(callbacks) if any(cb is not None for cb in callbacks) else None
+
+def _prefix_entry(schema_text: str):
+    """
+    Prompt text before the question is identical for every question on the
+    same schema; prefill it once and keep its past_key_values.
+    """
+    prefix_text = _build_prompt(schema_text, _QUESTION_SLOT).split(_QUESTION_SLOT, 1)[0]
+    key = (_MODEL.name_or_path, hashlib.sha256(prefix_text.encode("utf-8")).hexdigest())
+    entry = _PREFIXES.get(key)
+    if entry is not None:
+        _PREFIXES.move_to_end(key)
+        return entry
+
+    ids = _TOKENIZER(prefix_text, return_tensors="pt")["input_ids"].to(_MODEL.device)
+    with torch.inference_mode():
+        past = _MODEL(input_ids=ids, use_cache=True).past_key_values
+    if hasattr(past, "to_legacy_cache"):
+        past = past.to_legacy_cache()
+
+    entry = (ids[0].tolist(), past)
+    _PREFIXES[key] = entry
+    # a refreshed schema yields a new fingerprint; stale prefixes age out here
+    while len(_PREFIXES) > PREFIX_CACHE_SIZE:
+        _PREFIXES.popitem(last=False)
+    return entry
+
+def _generate_with_prefix(schema_text: str, questions: list, callbacks: list) -> list | None:
+    prefix_ids, past = _prefix_entry(schema_text)
+    n = len(prefix_ids)
+
+    full = _TOKENIZER([_build_prompt(schema_text, q) for q in questions])["input_ids"]
+    # the prefix must tokenize identically inside the full prompt to be reusable
+    if any(ids[:n] != prefix_ids for ids in full):
+        return None
+
+    # [prefix | left padding | question suffix]; masked padding keeps positions
+    # identical to the uncached, left-padded prompt
+    suffixes = [ids[n:] for ids in full]
+    width = max(len(x) for x in suffixes)
+    pad = _TOKENIZER.pad_token_id
+    input_ids = torch.tensor(
+        [prefix_ids + [pad] * (width - len(x)) + x for x in suffixes], device=_MODEL.device
+    )
+    attention_mask = torch.tensor(
+        [[1] * n + [0] * (width - len(x)) + [1] * len(x) for x in suffixes], device=_MODEL.device
+    )
+
+    # fresh per-batch copy: generate() appends to the cache in place
+    b = len(questions)
+    cache = DynamicCache.from_legacy_cache(
+        tuple((k.repeat(b, 1, 1, 1), v.repeat(b, 1, 1, 1)) for k, v in past)
+    )
+    out = _generate(input_ids, attention_mask, past_key_values=cache, streamer=_streamer(callbacks))
+    gen_tokens = out[:, input_ids.shape[-1]:]
+    _record_tokens([n + len(x) for x in suffixes], gen_tokens)
+    return [t.strip() for t in _TOKENIZER.batch_decode(gen_tokens, skip_special_tokens=True)]
+
+def _record_tokens(prompt_lengths: list, gen_tokens) -> None:
+    # completion length: up to and including the first stop token (the rest is padding)
+    stop = set(_STOP_IDS)
+    for prompt_len, row in zip(prompt_lengths, gen_tokens.tolist()):
+        n = next((i + 1 for i, tok in enumerate(row) if tok in stop), len(row))
+        metrics.record_tokens("hf", prompt_len, n)
+
+def _generate_plain(schema_text_by_item: list, questions: list, callbacks: list) -> list:
+    prompts = [_build_prompt(schema_text, q) for schema_text, q in zip(schema_text_by_item, questions)]
+    inputs = _TOKENIZER(prompts, return_tensors="pt", padding=True)
+    inputs = {k: v.to(_MODEL.device) for k, v in inputs.items()}
+
+    out = _generate(inputs["input_ids"], inputs["attention_mask"], streamer=_streamer(callbacks))
+
+    # Decode ONLY the newly generated tokens (avoid prompt-echo issues);
+    # with left padding every prompt ends at the same position
+    gen_tokens = out[:, inputs["input_ids"].shape[-1]:]
+    _record_tokens(inputs["attention_mask"].sum(dim=1).tolist(), gen_tokens)
+    return [t.strip() for t in _TOKENIZER.batch_decode(gen_tokens, skip_special_tokens=True)]
+
+def _generate_batch(items: list) -> list:
+    """
+    items: [(schema_text, question, on_text), ...] -> decoded completions, same
+    order; on_text (or None) receives the text of its row as it is generated.
+    """
+    metrics.HF_BATCH_SIZE.observe(len(items))
+
+    if not PREFIX_CACHE:
+        return _generate_plain([s for s, _, _ in items], [q for _, q, _ in items], [cb for _, _, cb in items])
 
+    # one generate() per distinct schema so each group shares its cached prefix
+    groups = OrderedDict()
+    for i, (schema_text, _, _) in enumerate(items):
+        groups.setdefault(schema_text, []).append(i)
+
+    outputs = [None] * len(items)
+    for schema_text, idxs in groups.items():
+        questions = [items[i][1] for i in idxs]
+        callbacks = [items[i][2] for i in idxs]
+        texts = _generate_with_prefix(schema_text, questions, callbacks)
+        if texts is None:
+            texts = _generate_plain([schema_text] * len(questions), questions, callbacks)
+        for i, text in zip(idxs, texts):
+            outputs[i] = text
+    return outputs
+
+def _get_batcher() -> MicroBatcher:
+    global _BATCHER
+    if _BATCHER is None:
+        _BATCHER = MicroBatcher(_generate_batch, max_batch_size=BATCH_SIZE, max_wait_ms=BATCH_WAIT_MS, name="hf-batcher")
+    return _BATCHER
+
+def _finish(decoded: str) -> str:
     sql = _extract_sql(decoded)
     if not sql:
         # Helpful for debugging: you can temporarily log `decoded` in router/main
         raise ValueError(f"HF model did not return SELECT/WITH SQL. Raw output: {decoded[:300]}")
-    sql = _apply_limit(sql, question)
+    # LIMIT (incl. "top N") is applied once, in the /ask pipeline
     return sql
+
+def generate_sql(question: str, schema_text: str) -> str:
+    _load()
+    decoded = _get_batcher().submit((schema_text, question, None)).result()
+    return _finish(decoded)
+
+async def agenerate_sql(question: str, schema_text: str) -> str:
+    """
+    Async entry point: waits on the shared batcher without holding a worker thread.
+    """
+    if _MODEL is None:
+        await asyncio.to_thread(_load)
+    decoded = await asyncio.wrap_future(_get_batcher().submit((schema_text, question, None)))
+    return _finish(decoded)
+
+async def stream_sql(question: str, schema_text: str):
+    """
+    Yields generated text as it is decoded; the question still shares a
+    batch with concurrent ones.
+    """
+    if _MODEL is None:
+        await asyncio.to_thread(_load)
+    loop = asyncio.get_running_loop()
+    deltas = asyncio.Queue()
+
+    def push(item):
+        try:
+            loop.call_soon_threadsafe(deltas.put_nowait, item)
+        except RuntimeError:
+            pass  # event loop already gone; the batch must go on
+
+    fut = _get_batcher().submit((schema_text, question, push))
+    # runs after the last on_text callback of this row
+    fut.add_done_callback(lambda _: push(None))
+    try:
+        while (text := await deltas.get()) is not None:
+            yield text
+        fut.result()  # surface generation errors
+    finally:
+        fut.cancel()
@@ -0,0 +1,22 @@
+# backend/app/llm/http_client.py
+import os
+import httpx
+
+# shared keep-alive pool settings for the remote backends (ollama, vllm)
+MAX_CONNECTIONS = int(os.getenv("LLM_HTTP_MAX_CONNECTIONS", "200"))
+MAX_KEEPALIVE = int(os.getenv("LLM_HTTP_MAX_KEEPALIVE", "50"))
+TIMEOUT_S = float(os.getenv("LLM_HTTP_TIMEOUT", "120"))
+
+def new_client(base_url: str, headers: dict | None = None) -> httpx.AsyncClient:
+    """
+    Long-lived AsyncClient; create once per backend and reuse for every request.
+    """
+    return httpx.AsyncClient(
+        base_url=base_url,
+        headers=headers,
+        timeout=httpx.Timeout(TIMEOUT_S, connect=10.0),
+        limits=httpx.Limits(
+            max_connections=MAX_CONNECTIONS,
+            max_keepalive_connections=MAX_KEEPALIVE,
+        ),
+    )
@@ -1,39 +1,81 @@
+import json
 import os
-import httpx
+from .http_client import new_client
+from .. import metrics
 
-def generate_sql(question: str, schema_context: str | None = None) -> str:
-    base = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434").rstrip("/")
-    model = os.getenv("OLLAMA_MODEL", "qwen2.5:7b-instruct")
+SYSTEM_PROMPT = (
+    "You are an NL-to-SQL assistant for PostgreSQL.\n"
+    "Return ONLY one SQL query.\n"
+    "Rules:\n"
+    "- READ-ONLY ONLY (SELECT/WITH)\n"
+    "- Use ONLY tables/columns from the schema below\n"
+    "- Prefer explicit joins using keys\n"
+    "- Always include a LIMIT (<= 50) unless the user asks for an aggregate count\n"
+    "- No markdown, no explanations\n"
+)
+
+# stop sequences: generation ends where the first statement does
+STOP = [";"]
+
+_client = None
 
-    system = (
-        "You are an NL-to-SQL assistant for PostgreSQL.\n"
-        "Return ONLY one SQL query.\n"
-        "Rules:\n"
-        "- READ-ONLY ONLY (SELECT/WITH)\n"
-        "- Use ONLY tables/columns from the schema below\n"
-        "- Prefer explicit joins using keys\n"
-        "- Always include a LIMIT (<= 50) unless the user asks for an aggregate count\n"
-        "- No markdown, no explanations\n"
-    )
+def _get_client():
+    global _client
+    if _client is None:
+        base = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434").rstrip("/")
+        _client = new_client(base)
+    return _client
+
+async def aclose() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+def _payload(question: str, schema_context: str | None, stream: bool) -> dict:
+    model = os.getenv("OLLAMA_MODEL", "qwen2.5:7b-instruct")
 
     schema_block = f"\n\n{schema_context}\n" if schema_context else ""
 
-    payload = {
+    return {
         "model": model,
         "messages": [
-            {"role": "system", "content": system + schema_block},
+            {"role": "system", "content": SYSTEM_PROMPT + schema_block},
             {"role": "user", "content": question},
         ],
-        "stream": False,
+        "stream": stream,
+        # end decoding at the first complete statement
+        "options": {"stop": STOP},
     }
 
-    with httpx.Client(timeout=120.0) as client:
-        r = client.post(f"{base}/api/chat", json=payload)
-        r.raise_for_status()
-        data = r.json()
-
-    sql = (data.get("message") or {}).get("content", "")
-    sql = (sql or "").strip()
+def _finish(text: str) -> str:
+    sql = (text or "").strip()
     if not sql:
         raise RuntimeError("Ollama returned empty response")
     return sql
+
+async def generate_sql(question: str, schema_context: str | None = None) -> str:
+    r = await _get_client().post("/api/chat", json=_payload(question, schema_context, stream=False))
+    r.raise_for_status()
+    data = r.json()
+    metrics.record_tokens("ollama", data.get("prompt_eval_count"), data.get("eval_count"))
+
+    return _finish((data.get("message") or {}).get("content", ""))
+
+async def stream_sql(question: str, schema_context: str | None = None):
+    """
+    Yields content deltas from Ollama's NDJSON chat stream.
+    """
+    payload = _payload(question, schema_context, stream=True)
+    async with _get_client().stream("POST", "/api/chat", json=payload) as r:
+        r.raise_for_status()
+        async for line in r.aiter_lines():
+            if not line:
+                continue
+            data = json.loads(line)
+            text = (data.get("message") or {}).get("content", "")
+            if text:
+                yield text
+            if data.get("done"):
+                metrics.record_tokens("ollama", data.get("prompt_eval_count"), data.get("eval_count"))
+                break
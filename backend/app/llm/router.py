@@ -1,28 +1,319 @@
 # backend/app/llm/router.py
+import asyncio
+import importlib
 import os
-from . import mock, ollama, vllm, hf, gemini
-from ..schema_context import get_schema_context
+import sys
+import time
+from . import cache, chain, rules, similar, templates
+from .. import metrics, schema_index, timing
 
-def generate_sql(question: str) -> str:
-    mode = os.getenv("LLM_MODE", "mock").strip().lower()
+# LLM_MODE -> backend module, imported on first use so that e.g. mock mode
+# never loads torch/transformers or google-genai
+_BACKEND_MODULES = {"mock": "mock", "ollama": "ollama", "vllm": "vllm", "hf": "hf", "gemini": "gemini"}
 
-    schema = None
-    if mode != "mock":
-        schema = get_schema_context()
+# env var holding the model id per mode (part of the SQL cache key)
+_MODEL_ENV = {
+    "ollama": ("OLLAMA_MODEL", "qwen2.5:7b-instruct"),
+    "vllm": ("VLLM_MODEL", ""),
+    "hf": ("HF_MODEL", "Qwen/Qwen2.5-3B-Instruct"),
+    "gemini": ("GEMINI_MODEL", "gemini-2.5-flash"),
+}
 
+# opt-in background warm-up at startup: schema index, backend import and
+# client, model weights and one throwaway generation
+WARMUP = os.getenv("LLM_WARMUP", "0") == "1"
+_WARMUP_QUESTION = "How many customers are there?"
+_warmup = {"state": "pending" if WARMUP else "disabled", "seconds": None, "error": None}
+_warmup_task = None
+
+def _mode() -> str:
+    return os.getenv("LLM_MODE", "mock").strip().lower()
+
+def _chain() -> list:
+    # LLM_CHAIN, or just LLM_MODE
+    return chain.configured(_mode())
+
+def _backend(mode: str):
+    name = _BACKEND_MODULES.get(mode)
+    if name is None:
+        raise ValueError(f"Unknown LLM_MODE='{mode}'. Use: mock | ollama | vllm | hf | gemini")
+    return importlib.import_module(f".{name}", __package__)
+
+async def _aload(mode: str):
+    # _backend(), with the first import (torch, google-genai: seconds) kept off the event loop
+    module = sys.modules.get(f"{__package__}.{_BACKEND_MODULES.get(mode)}")
+    return module if module is not None else await asyncio.to_thread(_backend, mode)
+
+async def startup() -> None:
+    """
+    Without LLM_WARMUP: create the long-lived HTTP client for the configured
+    remote backend and build the schema index before the first question.
+    With it: do that and load/exercise the model in the background (see status()).
+    """
+    global _warmup_task
+    modes = [m for m in _chain() if m != "mock"]
+    if WARMUP:
+        _warmup_task = asyncio.create_task(_warm_up(modes))
+        return
+    if modes:
+        try:
+            await schema_index.aget_index()
+        except Exception:
+            pass  # DB not reachable yet; built on the first question instead
+    for mode in modes:
+        if mode in ("ollama", "vllm"):
+            (await _aload(mode))._get_client()
+
+async def _warm_up(modes: list) -> None:
+    _warmup["state"] = "running"
+    t0 = time.perf_counter()
+    try:
+        for mode in modes:
+            index = await schema_index.aget_index()
+            backend = await _aload(mode)
+            if mode in ("ollama", "vllm"):
+                backend._get_client()
+            if mode == "hf":
+                await asyncio.to_thread(backend._load)
+            schema, _ = index.context_for(_WARMUP_QUESTION)
+            try:
+                await _generate(mode, _WARMUP_QUESTION, schema)
+            except ValueError:
+                pass  # the model answered, just not with usable SQL
+        _warmup["state"] = "done"
+    except Exception as e:
+        _warmup["state"] = "failed"
+        _warmup["error"] = str(e).split("\n")[0]
+    finally:
+        _warmup["seconds"] = round(time.perf_counter() - t0, 3)
+
+def status() -> dict:
+    """
+    Readiness: true right away without warm-up, otherwise once it has finished.
+    """
+    status = {
+        "llm_mode": _mode(), "ready": _warmup["state"] in ("disabled", "done"), "warmup": dict(_warmup),
+        **chain.stats(_chain()),
+    }
+    hf = sys.modules.get(f"{__package__}.hf")
+    if hf is not None and hf.PROFILE_REPORT is not None:
+        status["hf_profile"] = hf.PROFILE_REPORT
+    return status
+
+async def shutdown() -> None:
+    if _warmup_task is not None:
+        _warmup_task.cancel()
+    # only backends that were actually imported hold clients
+    for name in ("ollama", "vllm"):
+        module = sys.modules.get(f"{__package__}.{name}")
+        if module is not None:
+            await module.aclose()
+
+def _prompt_text(mode: str) -> str:
+    return "\n".join([
+        getattr(_backend(mode), "SYSTEM_PROMPT", ""),
+        rules.BASE_RULES, rules.CUSTOMER_RULES, rules.TX_RULES,
+        rules.CREDIT_RULES, rules.BRANCH_RULES,
+    ])
+
+def _result(sql: str, schema=None, template=None, similar=None, backend=None) -> dict:
+    return {"sql": sql, "schema": schema, "template": template, "similar": similar, "backend": backend}
+
+def _answered(mode: str, cached: bool = False, hedged: bool = False, fallback: bool = False) -> dict:
+    # which backend's SQL this is, and how it was reached
+    return {"name": mode, "cached": cached, "hedged": hedged, "fallback": fallback}
+
+async def generate(question: str) -> dict:
+    """
+    {"sql", "schema", "template", "similar", "backend"}: "schema" reports which
+    tables were sent to the model and the prompt tokens saved; "template" the
+    SQL template and "similar" the earlier question that answered instead of
+    the model; "backend" the LLM backend the SQL came from. Each is None when
+    it does not apply.
+    """
+    hit = _template(question)
+    if hit is not None:
+        return _result(hit.pop("sql"), template=hit)
+
+    modes = _chain()
+
+    if modes == ["mock"]:
+        return _result(_backend("mock").generate_sql(question), backend=_answered("mock"))
+
+    # earlier answers of any backend in the chain, in current chain order
+    models = [m for m in chain.order(modes) if m != "mock"]
+    for mode in models:
+        near = await _similar(mode, question)
+        if near is not None:
+            return _result(near.pop("sql"), similar=near, backend=_answered(mode, cached=True))
+
+    schema, schema_info, keys = await _prepare(models, question)
+    for mode in models:
+        sql = cache.get(keys[mode])
+        if sql is not None:
+            return _result(sql, schema=schema_info, backend=_answered(mode, cached=True))
+
+    # concurrent callers of the same question share one pass over the chain
+    sql, mode, info = await cache.coalesce(keys[models[0]], lambda: _run_chain(modes, question, schema, keys))
+    return _result(sql, schema=schema_info, backend=_answered(mode, hedged=info["hedged"], fallback=info["fallback"]))
+
+async def stream(question: str):
+    """
+    Yields ("token", text) as the model writes the SQL, then ("done", result)
+    with the same result as generate(). Cached SQL arrives as one token.
+    """
+    hit = _template(question)
+    if hit is not None:
+        sql = hit.pop("sql")
+        yield "token", sql
+        yield "done", _result(sql, template=hit)
+        return
+
+    modes = _chain()
+
+    if modes == ["mock"]:
+        sql = _backend("mock").generate_sql(question)
+        yield "token", sql
+        yield "done", _result(sql, backend=_answered("mock"))
+        return
+
+    models = [m for m in chain.order(modes) if m != "mock"]
+    for mode in models:
+        near = await _similar(mode, question)
+        if near is not None:
+            sql = near.pop("sql")
+            yield "token", sql
+            yield "done", _result(sql, similar=near, backend=_answered(mode, cached=True))
+            return
+
+    schema, schema_info, keys = await _prepare(models, question)
+    for mode in models:
+        sql = cache.get(keys[mode])
+        if sql is not None:
+            yield "token", sql
+            yield "done", _result(sql, schema=schema_info, backend=_answered(mode, cached=True))
+            return
+
+    parts, mode = [], None
+    t0 = time.perf_counter()
+    async for mode, text in chain.stream(modes, lambda m: _stream(m, question, schema)):
+        parts.append(text)
+        yield "token", text
+    if mode is None:
+        # a backend that ended its stream without any text: a failed generation
+        raise RuntimeError("LLM returned no SQL")
+    metrics.LLM_SECONDS.labels(mode).observe(time.perf_counter() - t0)
+    sql = "".join(parts) if mode == "mock" else _backend(mode)._finish("".join(parts))
+    _store(mode, question, sql, keys)
+    yield "done", _result(sql, schema=schema_info, backend=_answered(mode, fallback=mode != models[0]))
+
+def _template(question: str) -> dict | None:
+    # fast path: common questions answered from SQL templates, no model call
+    if not templates.ENABLED:
+        return None
+    with timing.stage("template"):
+        hit = templates.match(question)
+    metrics.TEMPLATE_LOOKUPS.labels(hit["template"] if hit else "none").inc()
+    return hit
+
+async def _similar(mode: str, question: str) -> dict | None:
+    # SQL of an earlier, differently worded question to the same model, schema and prompt
+    if not similar.ENABLED:
+        return None
+    with timing.stage("similar"):
+        await schema_index.aget_index()
+        await _aload(mode)
+        return similar.lookup(question, _similar_id(mode))
+
+def _similar_id(mode: str) -> str | None:
+    # backend id + fingerprint of the full schema and the prompt, like the SQL cache keys;
+    # None while the schema index is being rebuilt
+    if not schema_index.get_index.cache_info().currsize:
+        return None
+    return f"{_backend_id(mode)}|{cache.fingerprint(schema_index.get_index().full_text, _prompt_text(mode))}"
+
+def _store(mode: str, question: str, sql: str, keys: dict) -> None:
+    # model SQL is cached per backend; mock fallbacks are not kept
     if mode == "mock":
-        return mock.generate_sql(question)
+        return
+    cache.put(keys[mode], sql)
+    index_id = _similar_id(mode) if similar.ENABLED else None
+    if index_id is not None:
+        similar.add(question, sql, index_id)
+
+def _backend_id(mode: str) -> str:
+    # LLM_MODE + model id
+    env, default = _MODEL_ENV.get(mode, ("LLM_MODEL", ""))
+    return f"{mode}:{os.getenv(env, default)}"
 
-    if mode == "ollama":
-        return ollama.generate_sql(question, schema_context=schema)
+async def _prepare(modes: list, question: str) -> tuple:
+    # (schema text for the prompt, retrieval stats, {mode: SQL cache key})
+    with timing.stage("schema"):
+        index = await schema_index.aget_index()
+        schema, schema_info = index.context_for(question)
+    keys = {}
+    for mode in modes:
+        # the prompt lives in the backend module: import it off the event loop
+        await _aload(mode)
+        keys[mode] = cache.make_key(
+            question,
+            backend=_backend_id(mode),
+            schema_text=schema,
+            prompt_text=_prompt_text(mode),
+        )
+    return schema, schema_info, keys
 
-    if mode == "vllm":
-        return vllm.generate_sql(question, schema_context=schema)
+async def generate_sql(question: str) -> str:
+    return (await generate(question))["sql"]
+
+async def _run_chain(modes: list, question: str, schema: str, keys: dict) -> tuple:
+    # only real model calls (SQL cache misses) land here; (sql, mode, info) of the backend that answered
+    async def call(mode):
+        return await _timed_generate(mode, question, schema, keys)
+
+    with timing.stage("llm"):
+        return await chain.run(modes, call)
+
+async def _timed_generate(mode: str, question: str, schema: str, keys: dict) -> str:
+    t0 = time.perf_counter()
+    try:
+        sql = await _generate(mode, question, schema)
+    finally:
+        metrics.LLM_SECONDS.labels(mode).observe(time.perf_counter() - t0)
+    _store(mode, question, sql, keys)
+    return sql
+
+async def _generate(mode: str, question: str, schema: str) -> str:
+    backend = await _aload(mode)
+
+    if mode == "mock":
+        return backend.generate_sql(question)
+
+    if mode in ("ollama", "vllm"):
+        return await backend.generate_sql(question, schema_context=schema)
 
     if mode == "hf":
-        return hf.generate_sql(question, schema_text=schema)
+        # concurrent questions are micro-batched on the model's worker thread
+        return await backend.agenerate_sql(question, schema_text=schema)
 
     if mode == "gemini":
-        return gemini.generate_sql(question, schema_text=schema)
+        return await backend.generate_sql(question, schema_text=schema)
+
+    raise ValueError(f"Unknown LLM_MODE='{mode}'. Use: mock | ollama | vllm | hf | gemini")
+
+async def _mock_stream(question: str):
+    yield _backend("mock").generate_sql(question)
+
+def _stream(mode: str, question: str, schema: str):
+    backend = _backend(mode)
+
+    if mode == "mock":
+        return _mock_stream(question)
+
+    if mode in ("ollama", "vllm"):
+        return backend.stream_sql(question, schema_context=schema)
+
+    if mode in ("hf", "gemini"):
+        return backend.stream_sql(question, schema_text=schema)
 
     raise ValueError(f"Unknown LLM_MODE='{mode}'. Use: mock | ollama | vllm | hf | gemini")
@@ -52,6 +52,24 @@ _PATTERNS = {
     "branch": re.compile(r"\b(branch|sube|şube|region|bolge|bölge)\b", re.I),
 }
 
+# Turkish/English words that point at a table (used by schema_index for retrieval)
+TABLE_SYNONYMS = {
+    "customers": ["customer", "client", "musteri", "müşteri", "kisi", "kişi"],
+    "accounts": ["account", "hesap", "balance", "bakiye", "mevduat"],
+    "transactions": ["transaction", "islem", "işlem", "harcama", "transfer", "tutar", "fraud", "dolandiricilik"],
+    "credit_applications": ["credit", "loan", "kredi", "basvuru", "başvuru", "vade"],
+    "branches": ["branch", "sube", "şube", "region", "bolge", "bölge"],
+}
+
+_TOP_N = re.compile(r"\btop\s+(\d+)\b", re.I)
+
+def top_n(question: str) -> int | None:
+    """
+    "top 5 ..." -> 5: the user asked for exactly N rows.
+    """
+    m = _TOP_N.search(question or "")
+    return int(m.group(1)) if m else None
+
 def build_domain_rules(question: str) -> str:
     q = (question or "").strip()
     blocks = []
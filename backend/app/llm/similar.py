@@ -0,0 +1,232 @@
+# backend/app/llm/similar.py
+import os
+import re
+import threading
+import unicodedata
+import zlib
+import numpy as np
+from sqlparse import tokens as T
+from .templates import STOPWORDS, fold
+from ..sql_analysis import _lex
+
+# reuse SQL generated for an earlier question that is worded differently
+# ("en yüksek bakiyeli 5 müşteri" vs "bakiyesi en yüksek 5 müşteri")
+ENABLED = os.getenv("SIMILAR_CACHE", "1") == "1"
+# minimum cosine similarity of the questions' character n-gram vectors
+THRESHOLD = float(os.getenv("SIMILAR_CACHE_THRESHOLD", "0.85"))
+# stored questions per backend; the oldest is overwritten when full
+MAX_ENTRIES = int(os.getenv("SIMILAR_CACHE_SIZE", "100000"))
+# hashed feature dimension (memory: MAX_ENTRIES * DIM * 4 bytes when full)
+DIM = int(os.getenv("SIMILAR_CACHE_DIM", "256"))
+# nearest candidates checked word by word before giving up
+_CANDIDATES = 8
+
+_NUMBER = re.compile(r"\d+")
+_WORD = re.compile(r"[a-z#]+")
+# integer literals in generated SQL that a number from the question can fill: comparison
+# operands, BETWEEN bounds and LIMIT ("branch_code = 5", "LIMIT 5"), never GROUP BY 1 / ORDER BY 2
+_FILLED_AFTER = {"=", "<>", "!=", "<", ">", "<=", ">=", "LIMIT", "BETWEEN"}
+_NUMBER_WORDS = {
+    "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7, "eight": 8, "nine": 9, "ten": 10,
+    "twenty": 20, "fifty": 50, "hundred": 100,
+    "iki": 2, "uc": 3, "dort": 4, "bes": 5, "alti": 6, "yedi": 7, "sekiz": 8, "dokuz": 9,
+    "yirmi": 20, "elli": 50, "yuz": 100,
+}
+
+def normalize(question: str) -> tuple:
+    """
+    (text, numbers): Turkish letters and other diacritics folded, number
+    words as digits, every number replaced by "#" and returned in order.
+    """
+    text = unicodedata.normalize("NFKD", fold(question))
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    words = re.findall(r"[a-z0-9]+", text)
+    words = [str(_NUMBER_WORDS[w]) if w in _NUMBER_WORDS else w for w in words]
+    numbers = [int(w) for w in words if w.isdigit()]
+    return " ".join("#" if w.isdigit() else w for w in words), numbers
+
+def vectorize(text: str) -> np.ndarray:
+    """
+    L2-normalized hashed character 3- and 4-grams of the padded words.
+    """
+    vec = np.zeros(DIM, dtype=np.float32)
+    for word in text.split():
+        w = f" {word} "
+        for n in (3, 4):
+            for i in range(len(w) - n + 1):
+                vec[zlib.crc32(w[i:i + n].encode()) % DIM] += 1.0
+    norm = np.linalg.norm(vec)
+    return vec / norm if norm else vec
+
+def _content(text: str) -> list:
+    return [w for w in _WORD.findall(text) if w not in STOPWORDS]
+
+def _stems(text: str) -> set:
+    # 5-letter stems of the longer content words ("bakiyeli" -> "bakiy")
+    return {w[:5] for w in _content(text) if len(w) >= 5}
+
+def _same_words(a: str, b: str) -> bool:
+    # every meaningful word must have a counterpart sharing its stem
+    # ("bakiyeli" ~ "bakiyesi"), so "Ankara" never answers for "Adana"
+    wa, wb = _content(a), _content(b)
+
+    def covered(word, others):
+        k = min(5, len(word))
+        return any(o[:k] == word[:k] and len(o) >= k for o in others)
+
+    return all(covered(w, wb) for w in wa) and all(covered(w, wa) for w in wb)
+
+def _literals(sql: str) -> dict:
+    # {literal: [(start, end)]} of the integer literals a question number may fill
+    found, prev, between = {}, None, False
+    for ttype, value, start, end in _lex(sql):
+        word = value.upper()
+        if ttype in T.Number.Integer and prev in _FILLED_AFTER:
+            found.setdefault(value, []).append((start, end))
+        if word == "BETWEEN":
+            between = True
+        elif word == "AND" and between:
+            between, word = False, "BETWEEN"  # the upper bound fills like the lower one
+        prev = word
+    return found
+
+def _substitute(sql: str, old: list, new: list) -> str | None:
+    # carry the new question's numbers into the stored SQL; None when that is not safe
+    if old == new:
+        return sql
+    if len(old) != len(new):
+        return None
+    mapping = {}
+    for o, n in zip(old, new):
+        if mapping.setdefault(str(o), str(n)) != str(n):
+            return None  # one number in the old question, two in the new one
+    literals = _literals(sql)
+    spans = []
+    for o, n in mapping.items():
+        places = literals.get(o, [])
+        if o != n and len(places) != 1:
+            return None  # not in the SQL, or in two places that may not both come from the question
+        spans += [(start, end, n) for start, end in places]
+    for start, end, n in sorted(spans, reverse=True):
+        sql = sql[:start] + n + sql[end:]
+    return sql
+
+class SimilarIndex:
+    """
+    Questions answered before, as rows of a (capacity x DIM) float32 matrix.
+    Only rows sharing every word stem of the question are scored (one
+    matrix-vector product); the best ones then get the full word check.
+    """
+
+    def __init__(self, capacity: int = MAX_ENTRIES):
+        self.capacity = capacity
+        self.vectors = np.zeros((min(capacity, 1024), DIM), dtype=np.float32)
+        self.entries = []  # row -> (normalized text, numbers, sql)
+        self.rows = {}     # normalized text -> row
+        self.postings = {} # stem -> rows whose question has it
+        self.next_row = 0
+        self.lock = threading.Lock()
+
+    def add(self, question: str, sql: str) -> None:
+        text, numbers = normalize(question)
+        vec = vectorize(text)
+        with self.lock:
+            row = self.rows.get(text)
+            if row is None:
+                row = self._allocate()
+                old = self.entries[row] if row < len(self.entries) else None
+                if old is not None:
+                    self.rows.pop(old[0], None)
+                    for stem in _stems(old[0]):
+                        self.postings[stem].discard(row)
+                self.rows[text] = row
+                for stem in _stems(text):
+                    self.postings.setdefault(stem, set()).add(row)
+            if row == len(self.entries):
+                self.entries.append(None)
+            self.vectors[row] = vec
+            self.entries[row] = (text, numbers, sql)
+
+    def _allocate(self) -> int:
+        row = self.next_row
+        self.next_row = (row + 1) % self.capacity
+        if row >= len(self.vectors):
+            # grow by doubling up to capacity
+            grown = np.zeros((min(self.capacity, 2 * len(self.vectors)), DIM), dtype=np.float32)
+            grown[:len(self.vectors)] = self.vectors
+            self.vectors = grown
+        return row
+
+    def lookup(self, question: str) -> dict | None:
+        """
+        {"sql", "question", "score"} for the closest stored question that
+        clears THRESHOLD and the word check, else None.
+        """
+        text, numbers = normalize(question)
+        vec = vectorize(text)
+        with self.lock:
+            n = len(self.entries)
+            if not n:
+                return None
+            rows = self._candidates(text, n)
+            if not len(rows):
+                return None
+            if len(rows) * 4 < n:
+                scores = self.vectors[rows] @ vec
+            else:
+                scores = (self.vectors[:n] @ vec)[rows]
+            k = min(_CANDIDATES, len(rows))
+            best = np.argpartition(-scores, k - 1)[:k]
+            for i in best[np.argsort(-scores[best])]:
+                row, score = rows[i], float(scores[i])
+                if score < THRESHOLD:
+                    break
+                stored, stored_numbers, sql = self.entries[row]
+                if not _same_words(text, stored):
+                    continue
+                sql = _substitute(sql, stored_numbers, numbers)
+                if sql is not None:
+                    return {"sql": sql, "question": stored, "score": round(score, 4)}
+        return None
+
+    def _candidates(self, text: str, n: int) -> np.ndarray:
+        postings = sorted((self.postings.get(stem, ()) for stem in _stems(text)), key=len)
+        if not postings:
+            return np.arange(n)
+        rows = set(postings[0])
+        for p in postings[1:]:
+            rows &= p
+        return np.fromiter(rows, dtype=np.int64, count=len(rows))
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+_indexes = {}  # backend (LLM_MODE:model|schema and prompt fingerprint) -> SimilarIndex
+_stats = {"hits": 0, "misses": 0}
+
+def lookup(question: str, backend: str) -> dict | None:
+    index = _indexes.get(backend)
+    hit = index.lookup(question) if index is not None else None
+    _stats["hits" if hit else "misses"] += 1
+    return hit
+
+def add(question: str, sql: str, backend: str) -> None:
+    index = _indexes.get(backend)
+    if index is None:
+        # a new schema/prompt fingerprint: the backend's older index can never match again
+        model = backend.split("|")[0]
+        for stale in [k for k in _indexes if k.split("|")[0] == model]:
+            _indexes.pop(stale, None)
+        index = _indexes.setdefault(backend, SimilarIndex())
+    index.add(question, sql)
+
+def clear() -> None:
+    _indexes.clear()
+
+def stats() -> dict:
+    return {
+        **_stats,
+        "size": sum(len(i) for i in _indexes.values()),
+        "max_size": MAX_ENTRIES,
+        "threshold": THRESHOLD,
+    }
@@ -0,0 +1,326 @@
+# backend/app/llm/templates.py
+import os
+import re
+from dataclasses import dataclass
+
+# answer frequent questions from parameterized SQL templates instead of the LLM
+ENABLED = os.getenv("SQL_TEMPLATES", "1") == "1"
+# share of the question's content words a template must explain
+MIN_CONFIDENCE = float(os.getenv("SQL_TEMPLATES_MIN_CONFIDENCE", "0.8"))
+
+_FOLD = str.maketrans("ıİşŞğĞüÜöÖçÇâÂîÎûÛ", "iIsSgGuUoOcCaAiIuU")
+_WORD = re.compile(r"[a-z0-9]+")
+
+# filler words in either language (plus suffixes split off by apostrophes: "Ankara'daki")
+STOPWORDS = {
+    "a", "an", "the", "of", "in", "on", "at", "to", "for", "with", "by", "and", "or", "from",
+    "show", "list", "give", "get", "me", "all", "what", "which", "who", "how", "is", "are",
+    "was", "were", "do", "does", "their", "there", "please", "whose",
+    "bana", "goster", "listele", "getir", "olan", "en", "ile", "ve", "veya", "tum", "butun",
+    "hangi", "neler", "nedir", "kim", "kimler", "tane", "adet", "bir", "icin", "lutfen",
+    "yapilan", "yapildi",
+    "da", "de", "ta", "te", "daki", "deki", "taki", "teki", "dan", "den", "tan", "ten",
+    "nin", "nun", "in", "un", "ki",
+}
+
+CITIES = [
+    "Adana", "Ankara", "Antalya", "Balıkesir", "Bursa", "Denizli", "Erzurum", "Eskişehir",
+    "Gaziantep", "İstanbul", "İzmir", "Kayseri", "Kocaeli", "Konya", "Malatya", "Manisa",
+    "Mersin", "Sakarya", "Samsun", "Trabzon",
+]
+REGIONS = ["Akdeniz", "Doğu Anadolu", "Ege", "Güneydoğu Anadolu", "İç Anadolu", "Karadeniz", "Marmara"]
+
+_CURRENCIES = {
+    "try": "TRY", "tl": "TRY", "lira": "TRY",
+    "usd": "USD", "dolar": "USD", "dollar": "USD", "dollars": "USD",
+    "eur": "EUR", "euro": "EUR", "avro": "EUR",
+    "gbp": "GBP", "sterlin": "GBP", "pound": "GBP",
+}
+_BALANCE_COLUMNS = {"TRY": "balance_try", "USD": "balance_usd", "EUR": "balance_eur"}
+
+# "last 30 days" / "son 30 gün" -> interval unit; "this month" / "bu ay" -> date_trunc field
+_UNITS = {
+    "day": "day", "days": "day", "gun": "day", "week": "week", "weeks": "week", "hafta": "week",
+    "month": "month", "months": "month", "ay": "month", "year": "year", "years": "year", "yil": "year",
+}
+_LAST = {"last", "past", "son", "gecen"}
+_THIS = {"this", "bu"}
+_TODAY = {"today", "bugun"}
+_N_WORDS = {"top", "first", "ilk", "last", "latest", "son"}
+
+# words that change a template's meaning when it leaves them unexplained, whatever the confidence:
+# reversed ordering, dates and time bounds, negation ("top 5 with lowest balance", "... in 2023")
+_VETO = {
+    "lowest", "smallest", "least", "fewest", "min", "minimum", "bottom", "poorest", "ascending",
+    "dusuk", "kucuk", "az", "azalan", "artan",
+    "january", "february", "march", "april", "may", "june", "july", "august", "september",
+    "october", "november", "december", "ocak", "subat", "mart", "nisan", "mayis", "haziran",
+    "temmuz", "agustos", "eylul", "ekim", "kasim", "aralik",
+    "yesterday", "dun", "before", "after", "until", "between", "since", "once", "sonra", "kadar", "arasinda",
+    "not", "no", "without", "except", "excluding", "haric", "disinda", "olmayan", "degil",
+}
+
+def fold(text: str) -> str:
+    return (text or "").translate(_FOLD).lower()
+
+def _words(text: str) -> list:
+    return _WORD.findall(fold(text))
+
+def _quote(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+def _names(canonical: str) -> str:
+    # the data spells cities both ways ("İstanbul" at branches, "Istanbul" for customers)
+    ascii_name = canonical.translate(_FOLD)
+    names = [canonical] if ascii_name == canonical else [canonical, ascii_name]
+    return ", ".join(_quote(n) for n in names)
+
+_CITY_KEYS = {fold(c): c for c in CITIES}
+_REGION_KEYS = {tuple(_words(r)): r for r in REGIONS}
+
+@dataclass(frozen=True)
+class Template:
+    name: str
+    sql: str             # str.format() with slot renderings, "{where}" for the filters
+    groups: tuple = ()   # keyword sets that must each match a question word
+    words: tuple = ()    # further keywords the template explains
+    slots: dict = None   # slot -> filter condition ("" when the slot only feeds the SQL)
+    required: tuple = () # slots the question must fill
+    n: int = 50          # default row count
+
+def _t(name, sql, groups, words="", slots=None, required=(), n=50) -> Template:
+    return Template(
+        name=name, sql=" ".join(sql.split()),
+        groups=tuple(frozenset(g.split()) for g in groups),
+        words=tuple(words.split()), slots=slots or {}, required=required, n=n,
+    )
+
+TEMPLATES = [
+    _t("top_balances",
+       """SELECT c.first_name, c.last_name, a.account_no, a.{balance} FROM accounts a
+          JOIN customers c ON c.customer_no = a.customer_no{where} ORDER BY a.{balance} DESC LIMIT {n};""",
+       ["top highest largest richest most ilk yuksek buyuk fazla", "balance bakiye"],
+       "customer musteri account hesap",
+       {"currency": "", "city": "c.residence_city IN ({city})"}, n=5),
+    _t("customer_total_balances",
+       """SELECT c.customer_no, c.first_name, c.last_name, SUM(a.{balance}) AS total_balance FROM customers c
+          JOIN accounts a ON a.customer_no = c.customer_no{where}
+          GROUP BY c.customer_no, c.first_name, c.last_name ORDER BY total_balance DESC LIMIT {n};""",
+       ["total sum toplam", "balance bakiye"],
+       "customer musteri per each gore",
+       {"currency": "", "city": "c.residence_city IN ({city})"}),
+    _t("avg_balance_per_branch",
+       """SELECT b.branch_code, b.branch_name, b.city, AVG(a.{balance}) AS avg_balance FROM branches b
+          JOIN accounts a ON a.branch_code = b.branch_code{where}
+          GROUP BY b.branch_code, b.branch_name, b.city ORDER BY avg_balance DESC;""",
+       ["average avg mean ortalama", "balance bakiye", "branch sube"],
+       "account hesap per each gore",
+       {"currency": "", "city": "b.city IN ({city})", "region": "b.region = {region}"}),
+    _t("accounts_in_city",
+       """SELECT a.account_no, c.first_name, c.last_name, a.account_type, a.balance_try FROM accounts a
+          JOIN customers c ON c.customer_no = a.customer_no
+          JOIN branches b ON b.branch_code = a.branch_code{where} ORDER BY a.balance_try DESC LIMIT {n};""",
+       ["account hesap"],
+       "branch sube",
+       {"city": "b.city IN ({city})"}, required=("city",)),
+    _t("accounts_per_branch",
+       """SELECT b.branch_code, b.branch_name, b.city, COUNT(a.account_no) AS account_count FROM branches b
+          LEFT JOIN accounts a ON a.branch_code = b.branch_code{where}
+          GROUP BY b.branch_code, b.branch_name, b.city ORDER BY account_count DESC;""",
+       ["branch sube", "account hesap", "count number many sayi kac per each gore"],
+       "",
+       {"city": "b.city IN ({city})", "region": "b.region = {region}"}),
+    _t("accounts_by_type",
+       """SELECT account_type, COUNT(*) AS account_count, SUM(balance_try) AS total_balance_try
+          FROM accounts GROUP BY account_type ORDER BY account_count DESC;""",
+       ["account hesap", "type tur tip"],
+       "count number many sayi kac per each gore"),
+    _t("customers",
+       """SELECT customer_no, first_name, last_name, segment, residence_city FROM customers{where}
+          ORDER BY customer_no LIMIT {n};""",
+       ["customer musteri"],
+       "live living lives yasayan ikamet eden",
+       {"city": "residence_city IN ({city})"}),
+    _t("customer_count",
+       "SELECT COUNT(*) AS customer_count FROM customers{where};",
+       ["customer musteri", "count number many sayi kac"],
+       "live living lives yasayan ikamet eden toplam total",
+       {"city": "residence_city IN ({city})"}),
+    _t("branches",
+       "SELECT branch_code, branch_name, city, region FROM branches{where} ORDER BY branch_code;",
+       ["branch sube"],
+       "region bolge",
+       {"city": "city IN ({city})", "region": "region = {region}"}),
+    _t("recent_transactions",
+       """SELECT transaction_no, account_no, transaction_type, amount, currency, transaction_time
+          FROM transactions{where} ORDER BY transaction_time DESC LIMIT {n};""",
+       ["transaction islem harcama"],
+       "recent latest last son yeni",
+       {"currency": "currency = {currency}", "period": "transaction_time >= {since}"}, n=20),
+    _t("transaction_count",
+       "SELECT COUNT(*) AS transaction_count FROM transactions{where};",
+       ["transaction islem harcama", "count number many sayi kac"],
+       "toplam total",
+       {"currency": "currency = {currency}", "period": "transaction_time >= {since}"}),
+    _t("transaction_totals",
+       """SELECT currency, COUNT(*) AS transaction_count, SUM(amount) AS total_amount
+          FROM transactions{where} GROUP BY currency ORDER BY total_amount DESC;""",
+       ["transaction islem harcama", "total sum toplam volume hacim"],
+       "amount tutar currency doviz birimi per each gore",
+       {"currency": "currency = {currency}", "period": "transaction_time >= {since}"}),
+    _t("fraud_transactions",
+       """SELECT transaction_no, account_no, transaction_type, amount, currency, transaction_time, channel
+          FROM transactions WHERE fraud_suspected = 1{and_where} ORDER BY transaction_time DESC LIMIT {n};""",
+       ["fraud fraudulent dolandiricilik"],
+       "transaction islem harcama suspected suspicious suphe suphesi suspect",
+       {"currency": "currency = {currency}", "period": "transaction_time >= {since}"}),
+    _t("credit_decisions",
+       """SELECT decision, COUNT(*) AS cnt FROM credit_applications{where}
+          GROUP BY decision ORDER BY cnt DESC;""",
+       ["credit kredi loan", "decision karar distribution dagilim count number many sayi kac"],
+       "application applications basvuru rejected reject redded approved approve onay",
+       {"period": "application_date >= {since}"}),
+    _t("rejected_applications",
+       """SELECT ca.application_no, c.first_name, c.last_name, ca.requested_amount, ca.credit_score,
+          ca.application_date FROM credit_applications ca JOIN customers c ON c.customer_no = ca.customer_no
+          WHERE ca.decision = 'Reddedildi'{and_where} ORDER BY ca.application_date DESC LIMIT {n};""",
+       ["credit kredi loan application basvuru", "rejected reject redded"],
+       "customer musteri applicant applicants",
+       {"period": "ca.application_date >= {since}"}),
+    _t("credit_score_distribution",
+       """SELECT (credit_score / 100) * 100 AS score_band, COUNT(*) AS cnt FROM credit_applications{where}
+          GROUP BY score_band ORDER BY score_band;""",
+       ["credit kredi", "score notu", "distribution dagilim band"],
+       "application basvuru applicant applicants",
+       {"period": "application_date >= {since}"}),
+]
+
+# keyword -> indexes of the templates using it; words longer than a keyword of
+# 4+ letters also match it ("musterileri" -> "musteri", "accounts" -> "account")
+_INDEX = {}
+_VOCAB = [frozenset(w for g in t.groups for w in g) | frozenset(t.words) for t in TEMPLATES]
+for _i, _vocab in enumerate(_VOCAB):
+    for _kw in _vocab:
+        _INDEX.setdefault(_kw, set()).add(_i)
+
+def _keywords(word: str) -> list:
+    found = [word] if word in _INDEX else []
+    found += [word[:k] for k in range(4, len(word)) if word[:k] in _INDEX]
+    return found
+
+def extract_slots(words: list) -> tuple:
+    """
+    ({slot: value}, {word index: slot}) for counts, periods, currencies,
+    cities and regions mentioned in the (folded) question words.
+    """
+    slots, used = {}, {}
+    for i, w in enumerate(words):
+        if i in used:
+            continue
+        nxt = words[i + 1] if i + 1 < len(words) else ""
+        unit = _UNITS.get(words[i + 2]) if i + 2 < len(words) else None
+        if w in _LAST and nxt.isdigit() and unit:
+            slots["period"] = f"now() - interval '{int(nxt)} {unit}s'"
+            used.update({i: "period", i + 1: "period", i + 2: "period"})
+        elif w in _THIS and _UNITS.get(nxt):
+            slots["period"] = f"date_trunc('{_UNITS[nxt]}', now())"
+            used.update({i: "period", i + 1: "period"})
+        elif w in _TODAY:
+            slots["period"] = "date_trunc('day', now())"
+            used[i] = "period"
+        elif w in _N_WORDS and nxt.isdigit():
+            # "top" itself stays a keyword, only the number is a slot
+            slots["n"] = int(nxt)
+            used[i + 1] = "n"
+        elif w.isdigit() and nxt in ("tane", "adet"):
+            slots["n"] = int(w)
+            used[i] = "n"
+        elif w in _CURRENCIES:
+            slots["currency"] = _CURRENCIES[w]
+            used[i] = "currency"
+        elif (w, nxt) in _REGION_KEYS:
+            slots["region"] = _REGION_KEYS[(w, nxt)]
+            used.update({i: "region", i + 1: "region"})
+        else:
+            region = next((r for k, r in _REGION_KEYS.items() if len(k) == 1 and w.startswith(k[0])), None)
+            city = next((c for k, c in _CITY_KEYS.items() if w.startswith(k)), None)
+            if city:
+                slots["city"] = city
+                used[i] = "city"
+            elif region:
+                slots["region"] = region
+                used[i] = "region"
+    return slots, used
+
+def _render(tpl: Template, slots: dict) -> str | None:
+    values = {"n": slots.get("n", tpl.n), "since": slots.get("period")}
+    currency = slots.get("currency")
+    values["balance"] = _BALANCE_COLUMNS.get(currency or "TRY")
+    if values["balance"] is None:
+        return None  # no balance column in that currency
+    if currency:
+        values["currency"] = _quote(currency)
+    if "city" in slots:
+        values["city"] = _names(slots["city"])
+    if "region" in slots:
+        values["region"] = _quote(slots["region"])
+    conditions = [tpl.slots[s].format(**values) for s in slots if tpl.slots.get(s)]
+    where = " AND ".join(conditions)
+    return tpl.sql.format(
+        where=f" WHERE {where}" if where else "",
+        and_where=f" AND {where}" if where else "",
+        **values,
+    )
+
+def match(question: str) -> dict | None:
+    """
+    Best template for the question:
+    {"template", "sql", "confidence", "slots"}, or None below MIN_CONFIDENCE
+    or when a template would leave a _VETO word or a number unexplained.
+    """
+    words = _words(question)
+    slots, used = extract_slots(words)
+
+    content = []   # (slot or None, keywords, veto) per word that carries meaning
+    candidates = set()
+    for i, w in enumerate(words):
+        if i in used:
+            content.append((used[i], (), False))
+        elif w not in STOPWORDS:
+            kws = _keywords(w)
+            # numbers no slot took are years, codes, amounts: never safe to drop
+            content.append((None, kws, w in _VETO or any(ch.isdigit() for ch in w)))
+            for kw in kws:
+                candidates |= _INDEX[kw]
+    if not content:
+        return None
+
+    best = None
+    for i in candidates:
+        tpl = TEMPLATES[i]
+        if any(s not in slots for s in tpl.required):
+            continue
+        vocab = _VOCAB[i]
+        matched = {kw for slot, kws, _ in content for kw in kws if kw in vocab}
+        if not all(g & matched for g in tpl.groups):
+            continue
+        # "n" only sizes the result, any template can take it
+        explained = [
+            (slot and (slot == "n" or slot in tpl.slots)) or any(kw in vocab for kw in kws)
+            for slot, kws, _ in content
+        ]
+        if any(veto and not ok for (_, _, veto), ok in zip(content, explained)):
+            continue
+        confidence = sum(explained) / len(content)
+        # ties go to the more specific template
+        rank = (confidence, len(tpl.groups))
+        if confidence >= MIN_CONFIDENCE and (best is None or rank > best[0]):
+            best = (rank, tpl)
+    if best is None:
+        return None
+
+    (confidence, _), tpl = best
+    sql = _render(tpl, slots)
+    if sql is None:
+        return None
+    return {"template": tpl.name, "sql": sql, "confidence": round(confidence, 3), "slots": slots}
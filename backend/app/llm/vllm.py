@@ -1,45 +1,96 @@
+import json
 import os
-import httpx
+from .http_client import new_client
+from .. import metrics
 
-def generate_sql(question: str, schema_context: str | None = None) -> str:
-    base = os.getenv("VLLM_BASE_URL", "http://localhost:8001").rstrip("/")
+SYSTEM_PROMPT = (
+    "You are an NL-to-SQL assistant for PostgreSQL.\n"
+    "Return ONLY one SQL query.\n"
+    "Rules:\n"
+    "- READ-ONLY ONLY (SELECT/WITH)\n"
+    "- Use ONLY tables/columns from the schema below\n"
+    "- Prefer explicit joins using keys\n"
+    "- Always include a LIMIT (<= 50) unless the user asks for an aggregate count\n"
+    "- No markdown, no explanations\n"
+)
+
+# stop sequences: generation ends where the first statement does
+STOP = [";"]
+
+_client = None
+
+def _get_client():
+    global _client
+    if _client is None:
+        base = os.getenv("VLLM_BASE_URL", "http://localhost:8001").rstrip("/")
+        api_key = os.getenv("VLLM_API_KEY", "EMPTY")
+        _client = new_client(base, headers={"Authorization": f"Bearer {api_key}"})
+    return _client
+
+async def aclose() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+def _payload(question: str, schema_context: str | None, stream: bool) -> dict:
     model = os.getenv("VLLM_MODEL")
-    api_key = os.getenv("VLLM_API_KEY", "EMPTY")
 
     if not model:
         raise RuntimeError("VLLM_MODEL is not set")
 
-    system = (
-        "You are an NL-to-SQL assistant for PostgreSQL.\n"
-        "Return ONLY one SQL query.\n"
-        "Rules:\n"
-        "- READ-ONLY ONLY (SELECT/WITH)\n"
-        "- Use ONLY tables/columns from the schema below\n"
-        "- Prefer explicit joins using keys\n"
-        "- Always include a LIMIT (<= 50) unless the user asks for an aggregate count\n"
-        "- No markdown, no explanations\n"
-    )
-
     schema_block = f"\n\n{schema_context}\n" if schema_context else ""
 
-    payload = {
+    return {
         "model": model,
         "messages": [
-            {"role": "system", "content": system + schema_block},
+            {"role": "system", "content": SYSTEM_PROMPT + schema_block},
             {"role": "user", "content": question},
         ],
         "temperature": 0.0,
         "max_tokens": 256,
+        # end decoding at the first complete statement
+        "stop": STOP,
+        "stream": stream,
+        # token usage arrives in a final chunk when streaming
+        **({"stream_options": {"include_usage": True}} if stream else {}),
     }
 
-    headers = {"Authorization": f"Bearer {api_key}"}
+def _record_usage(data: dict) -> None:
+    usage = data.get("usage")
+    if usage:
+        metrics.record_tokens("vllm", usage.get("prompt_tokens"), usage.get("completion_tokens"))
 
-    with httpx.Client(timeout=120.0) as client:
-        r = client.post(f"{base}/v1/chat/completions", json=payload, headers=headers)
-        r.raise_for_status()
-        data = r.json()
-
-    sql = data["choices"][0]["message"]["content"].strip()
+def _finish(text: str) -> str:
+    sql = (text or "").strip()
     if not sql:
         raise RuntimeError("vLLM returned empty response")
     return sql
+
+async def generate_sql(question: str, schema_context: str | None = None) -> str:
+    r = await _get_client().post("/v1/chat/completions", json=_payload(question, schema_context, stream=False))
+    r.raise_for_status()
+    data = r.json()
+    _record_usage(data)
+
+    return _finish(data["choices"][0]["message"]["content"])
+
+async def stream_sql(question: str, schema_context: str | None = None):
+    """
+    Yields content deltas from the OpenAI-compatible SSE stream.
+    """
+    payload = _payload(question, schema_context, stream=True)
+    async with _get_client().stream("POST", "/v1/chat/completions", json=payload) as r:
+        r.raise_for_status()
+        async for line in r.aiter_lines():
+            if not line.startswith("data:"):
+                continue
+            data = line[5:].strip()
+            if data == "[DONE]":
+                break
+            chunk = json.loads(data)
+            _record_usage(chunk)
+            choices = chunk.get("choices") or [{}]
+            text = (choices[0].get("delta") or {}).get("content")
+            if text:
+                yield text
@@ -1,15 +1,61 @@
 # backend/app/main.py
-from fastapi import FastAPI, HTTPException
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Header, HTTPException, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
 from fastapi.middleware.cors import CORSMiddleware
-from .sql_safety import assert_read_only, ensure_limit
+import psycopg
+from psycopg_pool import PoolTimeout, TooManyRequests
+from . import deadline, llm
+from .llm.chain import Overloaded
+from .llm.cache import normalize_question
+from .llm.rules import top_n
+from .sql_analysis import analyze
+from .db import POOL_MAX_SIZE, aquery, aquery_arrow, astream, get_async_pool, close_pool, close_async_pool
+from . import jobs, result_cache, sql_cost, summaries
+from .encoding import ARROW, JSON, SUPPORTED, encode, ndjson_line, negotiate, sse_event
+from .timing import StageTimer
+from . import metrics
+
+# row cap for /ask/stream; results are never held in memory, so it can be much higher
+STREAM_MAX_LIMIT = int(os.getenv("ASK_STREAM_MAX_LIMIT", "100000"))
+
+# /ask/batch: questions per request, concurrent generations, concurrent DB queries
+BATCH_MAX_ITEMS = int(os.getenv("ASK_BATCH_MAX_ITEMS", "500"))
+BATCH_GEN_CONCURRENCY = int(os.getenv("ASK_BATCH_GEN_CONCURRENCY", "16"))
+BATCH_DB_CONCURRENCY = int(os.getenv("ASK_BATCH_DB_CONCURRENCY", str(POOL_MAX_SIZE)))
 
-from .llm import generate_sql
-from .sql_guard import assert_read_only
-from .db import query
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # open the async DB pool and the shared LLM HTTP client up front
+    await get_async_pool()
+    await llm.startup()
+    await summaries.aload_state()
+    tasks = []
+    if os.getenv("RESULT_CACHE_LISTEN", "1") == "1":
+        # summary freshness follows the same table-change notifications
+        result_cache.subscribe(summaries.on_change)
+        tasks.append(asyncio.create_task(result_cache.listen_for_changes()))
+    if summaries.ENABLED and summaries.REFRESH_S > 0:
+        tasks.append(asyncio.create_task(summaries.refresh_loop()))
+    if jobs.CLEANUP_S > 0:
+        tasks.append(asyncio.create_task(jobs.cleanup_loop()))
+    yield
+    for task in tasks:
+        task.cancel()
+    jobs.shutdown()
+    await llm.shutdown()
+    # release pooled DB connections on shutdown
+    close_pool()
+    await close_async_pool()
 
-app = FastAPI(title="Mock NL→SQL System")
+app = FastAPI(title="Mock NL→SQL System", lifespan=lifespan)
 
+app.add_middleware(metrics.MetricsMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["http://localhost:5173"],
@@ -23,29 +69,355 @@ class AskReq(BaseModel):
 
 @app.get("/health")
 def health():
-    return {"ok": True}
+    # liveness: the process serves requests; readiness is reported alongside
+    return {"ok": True, **llm.status()}
+
+@app.get("/health/ready")
+def health_ready():
+    # 503 until the optional LLM warm-up (LLM_WARMUP=1) has finished
+    status = llm.status()
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
+
+async def _cached_query(sql: str, tables, arrow: bool = False) -> dict:
+    result = result_cache.get(sql)
+    if result is None:
+        if arrow:
+            # Arrow straight from the cursor; not cached, the cache holds rows
+            return await aquery_arrow(sql, timeout_ms=5000)
+        since = result_cache.version(tables)
+        result = await aquery(sql, timeout_ms=5000)
+        result_cache.put(sql, result, tables=tables, since=since)
+    return result
+
+def _route(sql: str, analysis) -> tuple:
+    # (SQL to run, tables its result depends on, summary answering it or None)
+    hit = summaries.rewrite(sql)
+    if hit is None:
+        return sql, analysis.tables, None
+    # a base-table write still drops the cached result (the summary is stale until refreshed)
+    return hit[0], analysis.tables | {hit[1]}, hit[1]
+
+async def _plan(question: str, timer: StageTimer) -> tuple:
+    # generate -> guard -> limit -> rewrite -> cost
+    # returns (generation result, final SQL, (SQL to run, tables, summary), cost estimate)
+    with timer.stage("generate"):
+        gen = await llm.generate(question)
+    with timer.stage("guard"):
+        analysis = analyze(gen["sql"].strip())
+        analysis.assert_read_only()
+    with timer.stage("limit"):
+        sql = analysis.with_limit(default_limit=50, max_limit=200, force_limit=top_n(question))
+    with timer.stage("rewrite"):
+        route = _route(sql, analysis)
+    with timer.stage("cost"):
+        cost = await sql_cost.acheck(route[0])
+    return gen, sql, route, cost
+
+def _failed(timer: StageTimer, e: Exception) -> str:
+    # the last stage recorded is the one that raised
+    metrics.ASK_ERRORS.labels(list(timer.stages)[-1] if timer.stages else "unknown").inc()
+    # clean error text for UI; shorten noisy psycopg messages
+    return str(e).split("\n")[0]
+
+def _error(e: Exception, detail: str) -> HTTPException:
+    # overload and deadline failures get their own status; anything else is the question's / SQL's
+    if isinstance(e, Overloaded):
+        return HTTPException(status_code=e.status, detail=detail, headers={"Retry-After": "1"})
+    if isinstance(e, (TooManyRequests, jobs.Busy)):
+        return HTTPException(status_code=429, detail=detail, headers={"Retry-After": "1"})
+    if isinstance(e, PoolTimeout):
+        return HTTPException(status_code=503, detail=detail, headers={"Retry-After": "1"})
+    if isinstance(e, (deadline.DeadlineExceeded, psycopg.errors.QueryCanceled)):
+        return HTTPException(status_code=504, detail=detail)
+    return HTTPException(status_code=400, detail=detail)
 
 @app.post("/ask")
-def ask(req: AskReq):
+async def ask(
+    req: AskReq,
+    accept: str | None = Header(None),
+    timeout_ms: str | None = Header(None, alias=deadline.HEADER),
+):
+    # response format from the Accept header (see encoding.FORMATS)
+    media = negotiate(accept)
+    if media is None:
+        raise HTTPException(status_code=406, detail="Supported formats: " + ", ".join(SUPPORTED))
+    with deadline.start(deadline.budget_ms(timeout_ms)):
+        return await _ask(req, media)
+
+async def _ask(req: AskReq, media: str):
+    timer = StageTimer()
     try:
-        sql = generate_sql(req.question)
-        assert_read_only(sql)
-        sql = ensure_limit(sql, default_limit=50, max_limit=200)
-        result = query(sql, timeout_ms=5000)
-        return {"question": req.question, "sql": sql.strip(), "result": result}
+        gen, sql, (run_sql, tables, summary), cost = await _plan(req.question, timer)
+        with timer.stage("db"):
+            result = await _cached_query(run_sql, tables, arrow=media == ARROW)
+        # serialize here (as FastAPI would) so the cost shows up in Server-Timing
+        with timer.stage("serialize"):
+            payload = {"question": req.question, "sql": sql.strip(), "result": result, "schema": gen["schema"],
+                       "template": gen["template"], "similar": gen["similar"], "backend": gen["backend"],
+                       "cost": cost, "summary": summary}
+            if media == JSON:
+                response = JSONResponse(jsonable_encoder(payload))
+            else:
+                response = Response(encode(payload, media), media_type=media)
+        response.headers["Vary"] = "Accept"
+        rows = result["table"].num_rows if "table" in result else len(result.get("rows", []))
+        metrics.ROWS_RETURNED.observe(rows)
+        metrics.RESPONSE_BYTES.observe(len(response.body))
+        if metrics.SERVER_TIMING:
+            response.headers["Server-Timing"] = timer.header()
+        return response
     except Exception as e:
-        # clean error text for UI
-        msg = str(e)
-        # shorten noisy psycopg messages
-        msg = msg.split("\n")[0]
-        raise HTTPException(status_code=400, detail=msg)
-import os
+        raise _error(e, _failed(timer, e))
+
+class AskBatchReq(BaseModel):
+    questions: list[str]
+
+@app.post("/ask/batch")
+async def ask_batch(req: AskBatchReq, timeout_ms: str | None = Header(None, alias=deadline.HEADER)):
+    """
+    Many questions in one call. Normalized duplicates are answered once and
+    identical SQL runs once; items come back in request order, each with
+    either "result" or "error" (and its HTTP-equivalent "status"). All items
+    share the request's deadline.
+    """
+    if len(req.questions) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"At most {BATCH_MAX_ITEMS} questions per batch")
+    with deadline.start(deadline.budget_ms(timeout_ms)):
+        return await _ask_batch(req)
+
+async def _ask_batch(req: AskBatchReq):
+    t0 = time.perf_counter()
+    gen_slots = asyncio.Semaphore(BATCH_GEN_CONCURRENCY)
+    db_slots = asyncio.Semaphore(BATCH_DB_CONCURRENCY)
+    queries = {}  # canonical SQL -> task running it
+
+    async def run_query(sql: str, tables) -> dict:
+        async with db_slots:
+            return await _cached_query(sql, tables)
+
+    async def answer(question: str) -> dict:
+        timer = StageTimer()
+        try:
+            # hf: concurrent generations meet in the model's micro-batcher
+            async with gen_slots:
+                gen, sql, (run_sql, tables, summary), cost = await _plan(question, timer)
+            key = result_cache.canonical_sql(run_sql)
+            if key not in queries:
+                queries[key] = asyncio.ensure_future(run_query(run_sql, tables))
+            with timer.stage("db"):
+                # shielded: other items may be waiting on the same query
+                result = await asyncio.shield(queries[key])
+            metrics.ROWS_RETURNED.observe(len(result.get("rows", [])))
+            return {
+                "sql": sql.strip(), "result": result,
+                "schema": gen["schema"], "template": gen["template"], "similar": gen["similar"],
+                "backend": gen["backend"], "cost": cost, "summary": summary,
+            }
+        except Exception as e:
+            return {"error": _failed(timer, e), "status": _error(e, "").status_code}
+
+    unique = {}
+    for q in req.questions:
+        unique.setdefault(normalize_question(q), q)
+    try:
+        answers = dict(zip(unique, await asyncio.gather(*(answer(q) for q in unique.values()))))
+    finally:
+        for task in queries.values():
+            task.cancel()
+
+    items = [{"question": q, **answers[normalize_question(q)]} for q in req.questions]
+    return {
+        "items": items,
+        "count": len(items),
+        "unique": len(unique),
+        "errors": sum(1 for item in items if "error" in item),
+        "elapsed_ms": round((time.perf_counter() - t0) * 1000.0, 1),
+    }
+
+@app.post("/ask/stream")
+async def ask_stream(req: AskReq, timeout_ms: str | None = Header(None, alias=deadline.HEADER)):
+    """
+    NDJSON: {"question","sql","columns","schema","template","similar","backend","cost","summary"} header, then {"rows": [...]} batches,
+    then {"done": true, "row_count": n}.
+    """
+    # the deadline covers everything up to the first rows; the statement timeout is set from it
+    try:
+        with deadline.start(deadline.budget_ms(timeout_ms)):
+            gen = await llm.generate(req.question)
+            analysis = analyze(gen["sql"].strip())
+            analysis.assert_read_only()
+            sql = analysis.with_limit(
+                default_limit=STREAM_MAX_LIMIT, max_limit=STREAM_MAX_LIMIT, force_limit=top_n(req.question)
+            )
+            run_sql, _, summary = _route(sql, analysis)
+            cost = await sql_cost.acheck(run_sql)
+            chunks = astream(run_sql, timeout_ms=5000)
+            # run the statement before committing to a 200 response
+            columns = await chunks.__anext__()
+    except Exception as e:
+        raise _error(e, str(e).split("\n")[0])
+
+    async def body():
+        yield ndjson_line({
+            "question": req.question, "sql": sql.strip(), "columns": columns,
+            "schema": gen["schema"], "template": gen["template"], "similar": gen["similar"],
+            "backend": gen["backend"], "cost": cost, "summary": summary,
+        })
+        count = 0
+        try:
+            async for rows in chunks:
+                count += len(rows)
+                yield ndjson_line({"rows": rows})
+        except Exception as e:
+            yield ndjson_line({"error": str(e).split("\n")[0]})
+            return
+        yield ndjson_line({"done": True, "row_count": count})
+
+    return StreamingResponse(body(), media_type="application/x-ndjson")
+
+@app.get("/ask/sse")
+async def ask_sse(question: str, timeout_ms: str | None = Header(None, alias=deadline.HEADER)):
+    """
+    Server-sent events for EventSource clients: "token" events carry SQL text
+    as the model writes it, then "sql" (final SQL), "result" and "done".
+    Failures arrive as an "error" event.
+    """
+    budget = deadline.budget_ms(timeout_ms)
+
+    async def events():
+        try:
+            with deadline.start(budget):
+                async for kind, data in llm.stream(question):
+                    if kind == "token":
+                        yield sse_event("token", {"text": data})
+                    else:
+                        gen = data
+                analysis = analyze(gen["sql"].strip())
+                analysis.assert_read_only()
+                sql = analysis.with_limit(default_limit=50, max_limit=200, force_limit=top_n(question))
+                run_sql, tables, summary = _route(sql, analysis)
+                cost = await sql_cost.acheck(run_sql)
+                yield sse_event("sql", {
+                    "sql": sql.strip(), "schema": gen["schema"], "template": gen["template"],
+                    "similar": gen["similar"], "backend": gen["backend"], "cost": cost, "summary": summary,
+                })
+                result = await _cached_query(run_sql, tables)
+                yield sse_event("result", {"result": result})
+        except Exception as e:
+            yield sse_event("error", {"detail": str(e).split("\n")[0]})
+            return
+        yield sse_event("done", {})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+class JobReq(BaseModel):
+    question: str | None = None
+    sql: str | None = None
+
+@app.post("/jobs", status_code=202)
+async def create_job(req: JobReq, timeout_ms: str | None = Header(None, alias=deadline.HEADER)):
+    """
+    Full results in the background: a question (or read-only SQL) within the
+    JOB_COST_MAX planner budget runs with up to JOB_MAX_ROWS rows and is
+    spooled to disk. Poll GET /jobs/{id}, read pages from GET /jobs/{id}/rows.
+    """
+    if (req.question is None) == (req.sql is None):
+        raise HTTPException(status_code=422, detail="Send either question or sql")
+    try:
+        # the deadline covers generation only; the job itself runs under JOB_STATEMENT_TIMEOUT_MS
+        with deadline.start(deadline.budget_ms(timeout_ms)):
+            gen = await llm.generate(req.question) if req.question is not None else None
+            analysis = analyze((gen["sql"] if gen else req.sql).strip())
+            analysis.assert_read_only()
+            sql = analysis.with_limit(
+                default_limit=jobs.MAX_ROWS, max_limit=jobs.MAX_ROWS,
+                force_limit=top_n(req.question) if req.question is not None else None,
+            )
+            run_sql, _, summary = _route(sql, analysis)
+            cost = await sql_cost.acheck(run_sql, max_cost=jobs.MAX_COST)
+        return jobs.submit(run_sql, sql=sql.strip(), question=req.question, summary=summary,
+                           backend=gen["backend"] if gen else None, cost=cost)
+    except Exception as e:
+        raise _error(e, str(e).split("\n")[0])
+
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str):
+    meta = jobs.load(job_id)
+    if meta is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired job")
+    return meta
+
+@app.get("/jobs/{job_id}/rows")
+def get_job_rows(job_id: str, cursor: str | None = None, limit: int = jobs.PAGE_ROWS):
+    # pages in file order; pass the previous page's "next" as ?cursor=
+    try:
+        body = jobs.page(job_id, cursor, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if body is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired job")
+    return Response(body, media_type=JSON)
+
+@app.delete("/jobs/{job_id}")
+async def delete_job(job_id: str):
+    # async: the job's task is cancelled and awaited before its files go
+    if not await jobs.cancel(job_id):
+        raise HTTPException(status_code=404, detail="Unknown or expired job")
+    return {"ok": True}
+
+@app.get("/admin/jobs")
+def jobs_stats():
+    return jobs.stats()
+
+@app.get("/metrics")
+def prometheus_metrics():
+    body, content_type = metrics.render()
+    return Response(content=body, media_type=content_type)
 
 @app.get("/config")
 def config():
     return {"llm_mode": os.getenv("LLM_MODE", "mock")}
-from .schema_context import get_schema_context
+from .schema_context import get_schema_context, refresh_schema_cache
+from .schema_index import get_index, refresh_index
+from .llm import cache as sql_cache
+from .llm import similar as similar_cache
 
 @app.get("/schema")
-def schema():
-    return {"schema": get_schema_context()}
+def schema(question: str | None = None):
+    # ?question=... previews the tables that would be sent to the LLM
+    if question is None:
+        return {"schema": get_schema_context()}
+    text, info = get_index().context_for(question)
+    return {"schema": text, **info}
+
+@app.get("/admin/cache")
+def cache_stats():
+    return {
+        "sql_cache": sql_cache.stats(), "similar_cache": similar_cache.stats(),
+        "plan_cache": sql_cost.stats(), "result_cache": result_cache.stats(),
+    }
+
+@app.post("/admin/cache/flush")
+def cache_flush():
+    # drop generated SQL together with the schema text it was keyed on
+    sql_cache.clear()
+    similar_cache.clear()
+    sql_cost.clear()
+    refresh_schema_cache()
+    refresh_index()
+    result_cache.invalidate()
+    return {"ok": True, "sql_cache": sql_cache.stats(), "result_cache": result_cache.stats()}
+
+@app.get("/admin/summaries")
+def summaries_stats():
+    # freshness of each summary table and how often generated SQL was routed to one
+    return summaries.stats()
+
+@app.post("/admin/cache/invalidate")
+def cache_invalidate(table: str | None = None):
+    # drop cached results reading `table` (all cached results if omitted)
+    return {"ok": True, "dropped": result_cache.invalidate(table)}
@@ -0,0 +1,102 @@
+# backend/app/metrics.py
+import os
+import time
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+
+# also send per-request stage timings as a Server-Timing header
+SERVER_TIMING = os.getenv("SERVER_TIMING", "1") == "1"
+
+_LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+HTTP_SECONDS = Histogram(
+    "nl2sql_http_request_seconds", "HTTP request latency",
+    ["method", "path", "status"], buckets=_LATENCY_BUCKETS,
+)
+STAGE_SECONDS = Histogram(
+    "nl2sql_stage_seconds", "Time spent per /ask pipeline stage",
+    ["stage"], buckets=_LATENCY_BUCKETS,
+)
+LLM_SECONDS = Histogram(
+    "nl2sql_llm_seconds", "Model calls (SQL cache misses) per LLM_MODE",
+    ["mode"], buckets=_LATENCY_BUCKETS,
+)
+LLM_TOKENS = Histogram(
+    "nl2sql_llm_tokens", "Prompt / completion tokens per model call",
+    ["mode", "kind"], buckets=(16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192),
+)
+LLM_BACKEND_CALLS = Counter(
+    "nl2sql_llm_backend_calls_total", "Model calls per backend by outcome (ok, error, timeout, cancelled)",
+    ["backend", "outcome"],
+)
+LLM_HEDGES = Counter("nl2sql_llm_hedges_total", "Hedged second requests sent to the next backend in the chain")
+LLM_BREAKER_OPEN = Gauge("nl2sql_llm_breaker_open", "1 while the backend's circuit breaker is open", ["backend"])
+HF_BATCH_SIZE = Histogram(
+    "nl2sql_hf_batch_size", "Prompts per HF generate() call",
+    buckets=(1, 2, 4, 8, 16, 32),
+)
+HF_MODEL_INFO = Gauge("nl2sql_hf_model_info", "Loaded HF model", ["model", "device", "dtype", "profile"])
+TEMPLATE_LOOKUPS = Counter(
+    "nl2sql_template_lookups_total", "SQL template fast-path lookups by matched template ('none' = LLM)",
+    ["template"],
+)
+SUMMARY_REWRITES = Counter(
+    "nl2sql_summary_rewrites_total", "Queries answered from a summary table by summary ('none' = base tables)",
+    ["summary"],
+)
+ASK_ERRORS = Counter("nl2sql_ask_errors_total", "Failed /ask requests by the stage that failed", ["stage"])
+SQL_COST = Histogram(
+    "nl2sql_sql_cost", "Planner total cost estimate of generated SQL (checked before running)",
+    buckets=(10, 100, 1e3, 1e4, 1e5, 1e6, 1e7, 1e8, 1e9),
+)
+ROWS_RETURNED = Histogram(
+    "nl2sql_rows_returned", "Rows per /ask result",
+    buckets=(0, 1, 5, 10, 20, 50, 100, 200, 1000, 10000, 100000),
+)
+RESPONSE_BYTES = Histogram(
+    "nl2sql_response_bytes", "Serialized /ask response size",
+    buckets=(256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304),
+)
+
+def observe_stage(stage: str, seconds: float) -> None:
+    STAGE_SECONDS.labels(stage).observe(seconds)
+
+def record_tokens(mode: str, prompt: int | None = None, completion: int | None = None) -> None:
+    # backends report what their API returns; missing counts are skipped
+    if prompt is not None:
+        LLM_TOKENS.labels(mode, "prompt").observe(prompt)
+    if completion is not None:
+        LLM_TOKENS.labels(mode, "completion").observe(completion)
+
+class MetricsMiddleware:
+    """
+    ASGI middleware feeding nl2sql_http_request_seconds; streamed
+    responses are timed until their last byte.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        t0 = time.perf_counter()
+        status = "500"
+
+        async def send_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = str(message["status"])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_status)
+        finally:
+            # route template ("/ask"), not the raw URL, keeps label cardinality bounded
+            path = getattr(scope.get("route"), "path", "unmatched")
+            HTTP_SECONDS.labels(scope["method"], path, status).observe(time.perf_counter() - t0)
+
+def render() -> tuple:
+    """
+    (body, content type) for the /metrics endpoint.
+    """
+    return generate_latest(), CONTENT_TYPE_LATEST
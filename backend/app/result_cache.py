@@ -0,0 +1,162 @@
+# backend/app/result_cache.py
+import asyncio
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+import psycopg
+from .db import DB_URL, normalize_sql
+from .sql_analysis import analyze
+
+# total size budget for cached results (approximate bytes), LRU evicted
+MAX_BYTES = int(os.getenv("RESULT_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+# default lifetime of a cached result; per-table overrides as "accounts=300,transactions=10"
+DEFAULT_TTL_S = float(os.getenv("RESULT_CACHE_TTL_S", "60"))
+TABLE_TTLS = {
+    k.strip().lower(): float(v)
+    for k, v in (
+        item.split("=", 1) for item in os.getenv("RESULT_CACHE_TABLE_TTLS", "").split(",") if "=" in item
+    )
+}
+# Postgres channel carrying the name of a changed table (see db/init/03_notify.sql)
+NOTIFY_CHANNEL = os.getenv("RESULT_CACHE_CHANNEL", "table_changed")
+
+_entries = OrderedDict()  # key -> (result, tables, size, expires_at)
+_by_table = {}            # table -> set of keys
+_stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0, "overtaken": 0, "bytes": 0}
+_versions = {}            # table -> invalidations so far (None: flushes of everything)
+_lock = threading.Lock()
+_subscribers = []         # async callables awaited with each changed table (None = anything)
+_listening = False        # LISTEN connection up and caught up
+
+_QUOTED = re.compile(r"""('(?:[^']|'')*'|"(?:[^"]|"")*")""")
+
+def canonical_sql(sql: str) -> str:
+    """
+    Whitespace-normalized SQL, lowercased outside string literals and quoted identifiers.
+    """
+    parts = _QUOTED.split(normalize_sql(sql))
+    return "".join(p if i % 2 else p.lower() for i, p in enumerate(parts))
+
+def _size_of(result: dict) -> int:
+    # rough payload estimate; good enough for a byte budget
+    size = sum(len(c) for c in result.get("columns", [])) + 64
+    for row in result.get("rows", []):
+        size += 16 + sum(len(str(v)) + 8 for v in row)
+    return size
+
+def _drop(key: str) -> None:
+    result, tables, size, _ = _entries.pop(key)
+    _stats["bytes"] -= size
+    for t in tables:
+        keys = _by_table.get(t)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del _by_table[t]
+
+def get(sql: str):
+    key = canonical_sql(sql)
+    with _lock:
+        item = _entries.get(key)
+        if item is None or item[3] <= time.monotonic():
+            if item is not None:
+                _drop(key)
+            _stats["misses"] += 1
+            return None
+        _entries.move_to_end(key)
+        _stats["hits"] += 1
+        return item[0]
+
+def version(tables) -> tuple:
+    """
+    Invalidation counters of `tables`; taken before running a query and
+    passed to put(), so a result a write overtook is never cached.
+    """
+    with _lock:
+        return tuple(_versions.get(t, 0) for t in (*sorted(tables), None))
+
+def put(sql: str, result: dict, tables=None, since: tuple | None = None) -> None:
+    key = canonical_sql(sql)
+    if tables is None:
+        tables = analyze(sql.strip()).tables
+    size = _size_of(result)
+    if size > MAX_BYTES:
+        return
+    ttl = min([TABLE_TTLS.get(t, DEFAULT_TTL_S) for t in tables] or [DEFAULT_TTL_S])
+    with _lock:
+        if since is not None and since != tuple(_versions.get(t, 0) for t in (*sorted(tables), None)):
+            _stats["overtaken"] += 1
+            return  # invalidated while the query ran: the result may predate the write
+        if key in _entries:
+            _drop(key)
+        _entries[key] = (result, tables, size, time.monotonic() + ttl)
+        _stats["bytes"] += size
+        for t in tables:
+            _by_table.setdefault(t, set()).add(key)
+        while _stats["bytes"] > MAX_BYTES and _entries:
+            _drop(next(iter(_entries)))
+            _stats["evictions"] += 1
+
+def invalidate(table: str | None = None) -> int:
+    """
+    Drop cached results that read `table` (all results if table is None).
+    """
+    with _lock:
+        if table is None:
+            keys = list(_entries)
+        else:
+            table = table.strip().lower()
+            keys = list(_by_table.get(table, ()))
+        _versions[table] = _versions.get(table, 0) + 1
+        for key in keys:
+            _drop(key)
+        _stats["invalidations"] += len(keys)
+        return len(keys)
+
+def stats() -> dict:
+    return {**_stats, "entries": len(_entries), "max_bytes": MAX_BYTES}
+
+def listening() -> bool:
+    """
+    True while listen_for_changes is connected, i.e. table writes reach
+    invalidate() and the subscribers within moments of their commit.
+    """
+    return _listening
+
+def subscribe(fn) -> None:
+    """
+    Also pass every change seen by listen_for_changes to `fn` (async).
+    """
+    _subscribers.append(fn)
+
+async def _changed(table: str | None) -> None:
+    invalidate(table)
+    for fn in _subscribers:
+        try:
+            await fn(table)
+        except Exception:
+            pass
+
+async def listen_for_changes() -> None:
+    """
+    LISTEN on NOTIFY_CHANNEL and invalidate the table named in each payload.
+    Runs until cancelled; reconnects if the connection drops.
+    """
+    global _listening
+    while True:
+        try:
+            async with await psycopg.AsyncConnection.connect(DB_URL, autocommit=True) as conn:
+                await conn.execute(f"LISTEN {NOTIFY_CHANNEL}")
+                # anything cached before LISTEN started may already be stale
+                await _changed(None)
+                _listening = True
+                async for n in conn.notifies():
+                    await _changed(n.payload or None)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            await asyncio.sleep(5)
+        finally:
+            _listening = False
@@ -1,4 +1,5 @@
 # backend/app/schema_context.py
+import asyncio
 from functools import lru_cache
 from .db import query
 
@@ -31,5 +32,14 @@ def get_schema_context() -> str:
     # Keep it short-ish
     return "\n".join(lines)
 
+async def aget_schema_context() -> str:
+    """
+    Async accessor: served from the cache once built, otherwise
+    built off the event loop.
+    """
+    if get_schema_context.cache_info().currsize:
+        return get_schema_context()
+    return await asyncio.to_thread(get_schema_context)
+
 def refresh_schema_cache() -> None:
     get_schema_context.cache_clear()
@@ -0,0 +1,183 @@
+# backend/app/schema_index.py
+import asyncio
+import math
+import os
+import re
+from collections import Counter
+from functools import lru_cache
+from .db import query
+from .llm.rules import TABLE_SYNONYMS
+
+# send only the tables relevant to the question (0 = always the full schema)
+RETRIEVAL_ENABLED = os.getenv("SCHEMA_RETRIEVAL", "1") == "1"
+# best-scoring tables kept per question (those within SCHEMA_MIN_SCORE_RATIO of
+# the best score); FK neighbours needed to join them are added on top
+TOP_K = int(os.getenv("SCHEMA_TOP_K", "3"))
+MIN_SCORE_RATIO = float(os.getenv("SCHEMA_MIN_SCORE_RATIO", "0.4"))
+
+# BM25 parameters
+_K1 = 1.2
+_B = 0.75
+
+_FOLD = str.maketrans("ıİşŞğĞüÜöÖçÇ", "iIsSgGuUoOcC")
+_WORD = re.compile(r"[a-z0-9]+")
+
+def _terms(text: str) -> list:
+    # snake_case and Turkish letters fold into plain ascii words
+    return _WORD.findall((text or "").translate(_FOLD).lower())
+
+def approx_tokens(text: str) -> int:
+    """
+    Rough LLM token count (words + punctuation); used to compare prompt sizes.
+    """
+    return len(re.findall(r"[A-Za-z]+|\d+|[^\sA-Za-z\d]", text or ""))
+
+class SchemaIndex:
+    """
+    BM25 over one document per table (table name, column names, synonyms)
+    plus the FK graph, both read from the catalog.
+    """
+
+    def __init__(self, columns: dict, joins: list):
+        self.columns = columns    # table -> [(column, data_type)]
+        self.joins = joins        # [(table, column, ref_table, ref_column)]
+        self.neighbours = {t: set() for t in columns}
+        for t, _, rt, _ in joins:
+            if t in self.neighbours and rt in self.neighbours and t != rt:
+                self.neighbours[t].add(rt)
+                self.neighbours[rt].add(t)
+
+        self.docs = {}
+        for t, cols in columns.items():
+            # the table name and its synonyms weigh more than a single column
+            words = _terms(t) * 2 + [w for s in TABLE_SYNONYMS.get(t, ()) for w in _terms(s)] * 2
+            for c, _ in cols:
+                words += _terms(c)
+            self.docs[t] = Counter(words)
+        self.doc_len = {t: sum(d.values()) for t, d in self.docs.items()}
+        self.avg_len = sum(self.doc_len.values()) / max(1, len(self.docs))
+        df = Counter(w for d in self.docs.values() for w in d)
+        n = len(self.docs)
+        self.idf = {w: math.log(1 + (n - f + 0.5) / (f + 0.5)) for w, f in df.items()}
+        self.full_text = self.render(list(columns))
+        self.full_tokens = approx_tokens(self.full_text)
+        self._matches = {}
+
+    def _match(self, word: str) -> tuple:
+        # exact term, or a term the word extends ("musteriler" -> "musteri", "accounts" -> "account")
+        terms = self._matches.get(word)
+        if terms is None:
+            if word in self.idf:
+                terms = (word,)
+            else:
+                terms = tuple(w for w in self.idf if len(w) >= 4 and word.startswith(w))
+            if len(self._matches) < 4096:
+                self._matches[word] = terms
+        return terms
+
+    def score(self, question: str) -> dict:
+        scores = dict.fromkeys(self.docs, 0.0)
+        for word in set(_terms(question)):
+            for term in self._match(word):
+                for t, doc in self.docs.items():
+                    tf = doc.get(term, 0)
+                    if tf:
+                        norm = _K1 * (1 - _B + _B * self.doc_len[t] / self.avg_len)
+                        scores[t] += self.idf[term] * tf * (_K1 + 1) / (tf + norm)
+        return scores
+
+    def _path(self, src: str, dst: str) -> list:
+        # shortest FK path src -> dst (BFS); empty when not connected
+        prev = {src: None}
+        frontier = [src]
+        while frontier and dst not in prev:
+            nxt = []
+            for t in frontier:
+                for nb in self.neighbours[t]:
+                    if nb not in prev:
+                        prev[nb] = t
+                        nxt.append(nb)
+            frontier = nxt
+        path = []
+        t = dst if dst in prev else None
+        while t is not None:
+            path.append(t)
+            t = prev[t]
+        return path
+
+    def select(self, question: str, top_k: int = TOP_K) -> list:
+        """
+        The best-scoring tables plus the FK neighbours that join them to the
+        top one, in catalog order; every table when nothing matches.
+        """
+        ranked = sorted(self.score(question).items(), key=lambda kv: -kv[1])
+        if not ranked or ranked[0][1] <= 0:
+            return list(self.columns)
+        best = ranked[0][1]
+        relevant = [t for t, s in ranked[:max(1, top_k)] if s >= best * MIN_SCORE_RATIO]
+        picked = set(relevant)
+        for t in relevant[1:]:
+            picked.update(self._path(relevant[0], t))
+        return [t for t in self.columns if t in picked]
+
+    def render(self, tables: list) -> str:
+        lines = ["DATABASE SCHEMA (PostgreSQL):"]
+        for t in tables:
+            col_str = ", ".join([f"{c} ({dt})" for c, dt in self.columns[t]])
+            lines.append(f"- {t}: {col_str}")
+        picked = set(tables)
+        joins = [j for j in self.joins if j[0] in picked and j[2] in picked]
+        if joins:
+            lines.append("JOINS:")
+            lines += [f"- {t}.{c} = {rt}.{rc}" for t, c, rt, rc in joins]
+        return "\n".join(lines)
+
+    def context_for(self, question: str) -> tuple:
+        """
+        (schema text, stats) for one question; stats carry the token saving.
+        """
+        tables = self.select(question) if RETRIEVAL_ENABLED else list(self.columns)
+        text = self.full_text if len(tables) == len(self.columns) else self.render(tables)
+        tokens = approx_tokens(text)
+        return text, {
+            "tables": tables,
+            "tokens": tokens,
+            "full_tokens": self.full_tokens,
+            "saved_pct": round(100.0 * (1 - tokens / self.full_tokens), 1) if self.full_tokens else 0.0,
+        }
+
+@lru_cache(maxsize=1)
+def get_index() -> SchemaIndex:
+    """
+    Built from information_schema once; refresh_index() drops it.
+    """
+    res = query("""
+    SELECT table_name, column_name, data_type
+    FROM information_schema.columns
+    WHERE table_schema = 'public'
+    ORDER BY table_name, ordinal_position;
+    """)
+    columns = {}
+    for table_name, column_name, data_type in res.get("rows", []):
+        columns.setdefault(table_name, []).append((column_name, data_type))
+
+    res = query("""
+    SELECT kcu.table_name, kcu.column_name, ccu.table_name, ccu.column_name
+    FROM information_schema.table_constraints tc
+    JOIN information_schema.key_column_usage kcu
+      ON kcu.constraint_name = tc.constraint_name AND kcu.table_schema = tc.table_schema
+    JOIN information_schema.constraint_column_usage ccu
+      ON ccu.constraint_name = tc.constraint_name AND ccu.table_schema = tc.table_schema
+    WHERE tc.constraint_type = 'FOREIGN KEY' AND tc.table_schema = 'public'
+    ORDER BY kcu.table_name, kcu.column_name;
+    """)
+    joins = [tuple(r) for r in res.get("rows", [])]
+    return SchemaIndex(columns, joins)
+
+async def aget_index() -> SchemaIndex:
+    if get_index.cache_info().currsize:
+        return get_index()
+    return await asyncio.to_thread(get_index)
+
+def refresh_index() -> None:
+    get_index.cache_clear()
@@ -0,0 +1,234 @@
+# backend/app/sql_analysis.py
+import os
+from dataclasses import dataclass, field
+from functools import lru_cache
+from sqlparse import lexer
+from sqlparse import tokens as T
+
+# only these top-level statements are allowed
+ALLOWED_FIRST = {"select", "with"}
+
+# disallowed SQL keywords (checked as real tokens, not substrings)
+DISALLOWED_KEYWORDS = {
+    "insert", "update", "delete", "drop", "alter", "truncate", "copy",
+    "create", "grant", "revoke", "vacuum", "analyze", "call", "do",
+}
+
+AGGREGATES = {"count", "sum", "avg", "min", "max"}
+
+ANALYSIS_CACHE_SIZE = int(os.getenv("SQL_ANALYSIS_CACHE_SIZE", "1024"))
+
+@dataclass(frozen=True)
+class SqlAnalysis:
+    """
+    Everything the request path needs to know about one generated statement,
+    produced from a single pass over the sqlparse token stream. Instances are shared through the
+    LRU in analyze(); treat them as read-only.
+    """
+    sql: str                                # statement text without trailing ';' / comments
+    error: str | None = None                # None when the statement is read-only
+    tables: frozenset = frozenset()         # referenced tables (CTE names excluded)
+    aliases: dict = field(default_factory=dict)  # alias (or table) -> table
+    columns: frozenset = frozenset()        # column references as written, e.g. "a.balance_try"
+    limit: int | None = None                # top-level LIMIT value
+    limit_span: tuple | None = None         # offsets of the LIMIT value (or ALL) in `sql`
+    has_aggregate: bool = False             # top-level aggregate function call
+    has_group_by: bool = False
+
+    @property
+    def read_only(self) -> bool:
+        return self.error is None
+
+    @property
+    def scalar_aggregate(self) -> bool:
+        # e.g. SELECT COUNT(*) FROM ... -> one row, no LIMIT needed
+        return self.has_aggregate and not self.has_group_by
+
+    def assert_read_only(self) -> None:
+        if self.error:
+            raise ValueError(self.error)
+
+    def with_limit(self, default_limit: int = 50, max_limit: int | None = None, force_limit: int | None = None) -> str:
+        """
+        Final SQL: force_limit replaces/adds LIMIT; otherwise a missing LIMIT
+        becomes default_limit (except scalar aggregates). Anything above
+        max_limit is clamped.
+        """
+        if force_limit is not None:
+            n = int(force_limit) if max_limit is None else min(int(force_limit), max_limit)
+        elif self.limit is None:
+            if self.scalar_aggregate and self.limit_span is None:
+                return self.sql + ";"
+            n = default_limit
+        elif max_limit is not None and self.limit > max_limit:
+            n = max_limit
+        else:
+            return self.sql + ";"
+
+        if self.limit_span is not None:
+            start, end = self.limit_span
+            return f"{self.sql[:start]}{n}{self.sql[end:]};"
+        return f"{self.sql}\nLIMIT {n};"
+
+def _lex(text: str) -> list:
+    """
+    Meaningful tokens as (ttype, value, start, end). Lexing only: sqlparse's
+    grouping pass is what makes parse() slow on long CTEs, and everything
+    below can be read off the flat token stream.
+    """
+    toks, pos = [], 0
+    for ttype, value in lexer.tokenize(text):
+        start, pos = pos, pos + len(value)
+        if ttype in T.Whitespace or ttype in T.Comment or value.isspace():
+            continue
+        toks.append((ttype, value, start, pos))
+    return toks
+
+def _name(value: str) -> str:
+    return value[1:-1] if value.startswith('"') else value.lower()
+
+def _is_name(ttype) -> bool:
+    return ttype in T.Name or ttype in T.String.Symbol
+
+def _is_kw(ttype) -> bool:
+    return ttype in T.Keyword or ttype in T.DDL or ttype in T.DML
+
+def _statement_count(toks: list) -> int:
+    count, pending = 0, False
+    for ttype, value, _, _ in toks:
+        if ttype is T.Punctuation and value == ";":
+            count += pending
+            pending = False
+        else:
+            pending = True
+    return count + pending
+
+@lru_cache(maxsize=ANALYSIS_CACHE_SIZE)
+def analyze(sql: str) -> SqlAnalysis:
+    text = (sql or "").strip()
+    if not text:
+        return SqlAnalysis(sql="", error="Empty SQL")
+
+    toks = _lex(text)
+    # block multiple statements like "SELECT ...; DROP TABLE ..."
+    if _statement_count(toks) != 1:
+        return SqlAnalysis(sql=text, error="Blocked: multiple SQL statements are not allowed")
+    while toks and toks[-1][1] == ";":
+        toks.pop()
+
+    first_kw = bad_kw = None
+    tables, ctes, aliases, columns = set(), set(), {}, set()
+    limit = limit_span = None
+    has_aggregate = has_group_by = False
+
+    parens = []        # stack of "func" / "group" for open parentheses
+    expect = None      # "table" after FROM/JOIN, "limit" after a top-level LIMIT,
+                       # "alias" right after a closing parenthesis
+    n = len(toks)
+    i = 0
+    while i < n:
+        ttype, value, start, end = toks[i]
+        prev = toks[i - 1] if i else None
+        depth = len(parens)
+        i += 1
+
+        if ttype is T.Punctuation and value == "(":
+            # the lexer tags "name(" as Name, so only those open argument lists
+            parens.append("func" if prev is not None and _is_name(prev[0]) else "group")
+            expect = None
+            continue
+        if ttype is T.Punctuation and value == ")":
+            # "(subquery) s" / "(expr) total": a bare name next is an alias
+            expect = "alias" if parens and parens.pop() == "group" else None
+            continue
+
+        if _is_kw(ttype):
+            word = " ".join(value.upper().split())
+            if first_kw is None:
+                first_kw = word.lower()
+            if bad_kw is None and word.lower() in DISALLOWED_KEYWORDS:
+                bad_kw = word.lower()
+
+            if expect == "limit" and word == "ALL":
+                limit_span = (start, end)
+                expect = None
+            elif word == "FROM" and not (parens and parens[-1] == "func") or word.endswith("JOIN"):
+                expect = "table"
+            elif depth == 0 and word == "LIMIT":
+                expect = "limit"
+            else:
+                if depth == 0 and word == "GROUP BY":
+                    has_group_by = True
+                expect = None
+            continue
+
+        if expect == "limit":
+            if ttype in T.Number.Integer:
+                limit = int(value)
+                limit_span = (start, end)
+            expect = None
+            continue
+
+        if _is_name(ttype):
+            # qualified name: a.b.c
+            parts = [_name(value)]
+            while i + 1 < n and toks[i][1] == "." and _is_name(toks[i + 1][0]):
+                parts.append(_name(toks[i + 1][1]))
+                i += 2
+            after = toks[i] if i < n else None
+
+            if expect == "table":
+                table = parts[-1]
+                tables.add(table)
+                alias = table
+                # optional alias: [AS] name
+                j = i + 1 if after and after[0] in T.Keyword and after[1].upper() == "AS" else i
+                if j < n and _is_name(toks[j][0]):
+                    alias = _name(toks[j][1])
+                    i = j + 1
+                aliases[alias] = table
+                # comma-separated FROM list continues with another table
+                expect = "table" if i < n and toks[i][1] == "," else None
+                if expect:
+                    i += 1
+                continue
+
+            if expect == "alias":
+                expect = None
+                continue
+            if after is not None and after[1] == "(":
+                # function call
+                if depth == 0 and parts[-1] in AGGREGATES:
+                    has_aggregate = True
+                continue
+            if after is not None and after[0] in T.Keyword and after[1].upper() == "AS" \
+                    and i + 1 < n and toks[i + 1][1] in ("(", "MATERIALIZED", "materialized"):
+                # WITH name AS (...)
+                ctes.add(parts[-1])
+                continue
+            if prev is not None and ((prev[0] in T.Keyword and prev[1].upper() == "AS") or prev[1] == "::"):
+                continue  # output alias or type name
+            columns.add(".".join(parts))
+            continue
+
+        expect = None
+
+    error = None
+    if first_kw is None:
+        error = "Blocked: could not determine SQL type"
+    elif first_kw not in ALLOWED_FIRST:
+        error = f"Blocked: only SELECT/WITH allowed (got: {first_kw})"
+    elif bad_kw is not None:
+        error = f"Blocked: non read-only SQL keyword detected ({bad_kw})"
+
+    return SqlAnalysis(
+        sql=text[:toks[-1][3]] if toks else "",
+        error=error,
+        tables=frozenset(tables - ctes),
+        aliases=aliases,
+        columns=frozenset(columns),
+        limit=limit,
+        limit_span=limit_span,
+        has_aggregate=has_aggregate,
+        has_group_by=has_group_by,
+    )
@@ -0,0 +1,88 @@
+# backend/app/sql_cost.py
+import os
+import threading
+import time
+from collections import OrderedDict
+from . import metrics
+from .db import aexplain
+from .result_cache import canonical_sql
+
+# planner cost budget checked before a generated query runs (EXPLAIN, no execution)
+ENABLED = os.getenv("SQL_COST_CHECK", "1") == "1"
+# reject above SQL_COST_MAX, flag ("warn": true) above SQL_COST_WARN; Postgres cost units
+MAX_COST = float(os.getenv("SQL_COST_MAX", "5000000"))
+WARN_COST = float(os.getenv("SQL_COST_WARN", "500000"))
+# plan estimates per canonical SQL; expire so new table statistics are picked up
+CACHE_SIZE = int(os.getenv("SQL_COST_CACHE_SIZE", "2000"))
+CACHE_TTL_S = float(os.getenv("SQL_COST_CACHE_TTL_S", "600"))
+
+_entries = OrderedDict()  # canonical SQL -> (estimate, expires_at)
+_stats = {"hits": 0, "misses": 0, "rejected": 0, "warned": 0}
+_lock = threading.Lock()
+
+class CostError(ValueError):
+    pass
+
+def _get(key: str) -> dict | None:
+    with _lock:
+        item = _entries.get(key)
+        if item is None or item[1] <= time.monotonic():
+            return None
+        _entries.move_to_end(key)
+        return item[0]
+
+def _put(key: str, estimate: dict) -> None:
+    with _lock:
+        _entries[key] = (estimate, time.monotonic() + CACHE_TTL_S)
+        _entries.move_to_end(key)
+        while len(_entries) > CACHE_SIZE:
+            _entries.popitem(last=False)
+
+async def aestimate(sql: str) -> dict:
+    """
+    {"total_cost", "startup_cost", "rows", "node", "cached"} from the planner.
+    """
+    key = canonical_sql(sql)
+    estimate = _get(key)
+    if estimate is not None:
+        _stats["hits"] += 1
+        return {**estimate, "cached": True}
+    _stats["misses"] += 1
+    plan = await aexplain(sql)
+    estimate = {
+        "total_cost": plan["Total Cost"],
+        "startup_cost": plan["Startup Cost"],
+        "rows": plan["Plan Rows"],
+        "node": plan["Node Type"],
+    }
+    _put(key, estimate)
+    return {**estimate, "cached": False}
+
+async def acheck(sql: str, max_cost: float | None = None) -> dict | None:
+    """
+    Estimate plus "warn"; raises CostError over the budget (MAX_COST unless
+    given). None when disabled.
+    """
+    if not ENABLED:
+        return None
+    max_cost = MAX_COST if max_cost is None else max_cost
+    estimate = await aestimate(sql)
+    cost = estimate["total_cost"]
+    metrics.SQL_COST.observe(cost)
+    if cost > max_cost:
+        _stats["rejected"] += 1
+        raise CostError(
+            f"Query too expensive: estimated cost {cost:.0f} exceeds the budget of {max_cost:.0f} "
+            f"(~{estimate['rows']} rows). Try a narrower question."
+        )
+    estimate["warn"] = cost > WARN_COST
+    if estimate["warn"]:
+        _stats["warned"] += 1
+    return estimate
+
+def clear() -> None:
+    with _lock:
+        _entries.clear()
+
+def stats() -> dict:
+    return {**_stats, "size": len(_entries), "max_cost": MAX_COST, "warn_cost": WARN_COST}
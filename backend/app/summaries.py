@@ -0,0 +1,780 @@
+# backend/app/summaries.py
+"""
+Summary tables (db/init/04_summaries.sql) and the rewriter that answers
+aggregate queries from them.
+
+A guarded query goes to a summary when its FROM/JOIN shape is one the summary
+was built from, it groups and filters only on columns the summary keeps, and
+every aggregate can be read off (or re-aggregated from) the stored sums and
+counts. Grouping by the summary's key reads rows directly (an index lookup);
+coarser groupings re-aggregate the much smaller summary. Summaries are only
+used while fresh: writes to a source table mark them stale until the next
+refresh, and freshness is only trusted while the table-change listener
+(result_cache.listen_for_changes) is connected.
+
+    cd backend
+    python -m app.summaries                  # freshness of each summary
+    python -m app.summaries --refresh        # refresh the stale ones (--force: all)
+"""
+import argparse
+import asyncio
+import os
+import re
+from dataclasses import dataclass, field
+from functools import lru_cache
+import psycopg
+from psycopg import sql as pgsql
+from sqlparse import tokens as T
+from . import metrics, result_cache
+from .db import DB_URL, get_async_pool
+from .result_cache import NOTIFY_CHANNEL
+from .sql_analysis import AGGREGATES, _is_kw, _is_name, _lex, _name
+
+# answer matching aggregate queries from the summary tables
+ENABLED = os.getenv("SUMMARIES", "1") == "1"
+# refresh stale summaries (and reload their state) every N seconds in the backend; 0 = off
+REFRESH_S = float(os.getenv("SUMMARY_REFRESH_S", "60"))
+REWRITE_CACHE_SIZE = int(os.getenv("SUMMARY_REWRITE_CACHE_SIZE", "1024"))
+
+SCHEMA = "summaries"
+
+# constant bounds at day / month boundaries: "col >= bound" and "col < bound"
+# then select whole summary rows
+_CONSTANT = r"(?:now \( \)|current_date|current_timestamp|localtimestamp|'[^']*'(?: :: \w+)?)"
+_DAY_BOUND = rf"date_trunc \( '(?:day|week|month|quarter|year)' , {_CONSTANT} \)|current_date|'\d{{4}}-\d{{2}}-\d{{2}}'"
+_MONTH_BOUND = rf"date_trunc \( '(?:month|quarter|year)' , {_CONSTANT} \)|'\d{{4}}-\d{{2}}-01'"
+
+# structures the rewriter leaves alone
+_UNSUPPORTED = {"UNION", "UNION ALL", "INTERSECT", "EXCEPT", "WINDOW", "OVER", "FILTER", "LATERAL", "WITHIN GROUP"}
+_JOINS = {"JOIN": "inner", "INNER JOIN": "inner", "LEFT JOIN": "left", "LEFT OUTER JOIN": "left"}
+_CLAUSES = {"FROM": "from", "WHERE": "where", "GROUP BY": "group", "HAVING": "having", "ORDER BY": "order",
+            "LIMIT": "tail", "OFFSET": "tail", "FETCH": "tail"}
+
+def _inner(a: tuple, b: tuple) -> tuple:
+    return ("inner", frozenset((a, b)))
+
+def _left(kept: tuple, nullable: tuple) -> tuple:
+    return ("left", kept, nullable)
+
+def _shape(tables, *joins) -> tuple:
+    return frozenset(tables), frozenset(joins)
+
+@dataclass(frozen=True)
+class Summary:
+    name: str
+    base: str                # table whose rows are aggregated
+    shapes: dict             # _shape(...) -> extra condition for queries of that shape ("" = none)
+    columns: dict            # (table, column) -> summary column equal to it on every base row
+    key: frozenset           # summary columns identifying one row
+    measures: dict           # ("sum" | "count" | "distinct", (table, column) | "*") -> (column, kind)
+    inner_columns: frozenset = frozenset()  # columns that only equal theirs when nothing is outer-joined
+    exprs: tuple = ()        # (regex over the normalized expression, replacement)
+    ranges: dict = field(default_factory=dict)  # (table, column) -> (summary column, aligned bound regex)
+
+    @property
+    def sources(self) -> frozenset:
+        return frozenset(t for tables, _ in self.shapes for t in tables)
+
+    @property
+    def known(self) -> set:
+        # base-table columns the rewriter can place
+        return set(self.columns) | set(self.ranges) | {k[1] for k in self.measures if k[1] != "*"}
+
+# measure kinds: re-aggregated with SUM, SUM(...)::bigint (integer sums), COALESCE(SUM(...), 0)::bigint
+# (counts); "distinct" counts cannot be re-aggregated
+def _balances(table: str) -> dict:
+    m = {("count", "*"): ("account_count", "count"), ("count", (table, "account_no")): ("account_count", "count")}
+    for col in ("balance", "balance_try", "balance_usd", "balance_eur"):
+        m[("sum", (table, col))] = (f"total_{col}", "sum")
+        m[("count", (table, col))] = (f"n_{col}", "count")
+    return m
+
+SUMMARIES = [
+    Summary(
+        name="customer_balances", base="accounts",
+        shapes={
+            _shape({"customers", "accounts"}, _inner(("accounts", "customer_no"), ("customers", "customer_no"))):
+                "account_count > 0",
+            _shape({"customers", "accounts"}, _left(("customers", "customer_no"), ("accounts", "customer_no"))): "",
+        },
+        columns={
+            **{("customers", c): c for c in ("customer_no", "first_name", "last_name", "segment", "residence_city")},
+            ("accounts", "customer_no"): "customer_no",
+        },
+        inner_columns=frozenset({("accounts", "customer_no")}),
+        key=frozenset({"customer_no"}),
+        measures=_balances("accounts"),
+    ),
+    Summary(
+        name="branch_balances", base="accounts",
+        shapes={
+            _shape({"branches", "accounts"}, _inner(("accounts", "branch_code"), ("branches", "branch_code"))):
+                "account_count > 0",
+            _shape({"branches", "accounts"}, _left(("branches", "branch_code"), ("accounts", "branch_code"))): "",
+        },
+        columns={
+            **{("branches", c): c for c in ("branch_code", "branch_name", "city", "region")},
+            ("accounts", "branch_code"): "branch_code",
+        },
+        inner_columns=frozenset({("accounts", "branch_code")}),
+        key=frozenset({"branch_code"}),
+        measures={**_balances("accounts"), ("distinct", ("accounts", "customer_no")): ("customer_count", "distinct")},
+    ),
+    Summary(
+        name="credit_outcomes", base="credit_applications",
+        shapes={
+            _shape({"credit_applications"}): "",
+            _shape({"credit_applications", "customers"},
+                   _inner(("credit_applications", "customer_no"), ("customers", "customer_no"))): "has_customer",
+            _shape({"credit_applications", "customers"},
+                   _left(("credit_applications", "customer_no"), ("customers", "customer_no"))): "",
+        },
+        columns={
+            ("customers", "segment"): "segment",
+            **{("credit_applications", c): c for c in ("decision", "education", "self_employed")},
+        },
+        key=frozenset({"segment", "decision", "education", "self_employed", "application_month", "has_customer"}),
+        measures={
+            ("count", "*"): ("applications", "count"),
+            ("count", ("credit_applications", "application_no")): ("applications", "count"),
+            ("sum", ("credit_applications", "credit_score")): ("sum_credit_score", "isum"),
+            ("count", ("credit_applications", "credit_score")): ("n_credit_score", "count"),
+            ("sum", ("credit_applications", "requested_amount")): ("sum_requested_amount", "sum"),
+            ("count", ("credit_applications", "requested_amount")): ("n_requested_amount", "count"),
+            ("sum", ("credit_applications", "annual_income")): ("sum_annual_income", "sum"),
+            ("count", ("credit_applications", "annual_income")): ("n_annual_income", "count"),
+        },
+        exprs=(
+            (r"date_trunc \( '(month|quarter|year)' , credit_applications\.application_date \)",
+             r"date_trunc('\1', application_month)"),
+        ),
+        ranges={("credit_applications", "application_date"): ("application_month", _MONTH_BOUND)},
+    ),
+    Summary(
+        name="daily_transactions", base="transactions",
+        shapes={_shape({"transactions"}): ""},
+        columns={("transactions", c): c for c in ("transaction_type", "currency", "channel", "fraud_suspected")},
+        key=frozenset({"day", "transaction_type", "currency", "channel", "fraud_suspected"}),
+        measures={
+            ("count", "*"): ("transaction_count", "count"),
+            ("count", ("transactions", "transaction_no")): ("transaction_count", "count"),
+            ("sum", ("transactions", "amount")): ("total_amount", "sum"),
+            ("count", ("transactions", "amount")): ("n_amount", "count"),
+        },
+        exprs=(
+            (r"date_trunc \( '(day|week|month|quarter|year)' , transactions\.transaction_time \)",
+             r"date_trunc('\1', day::timestamp)"),
+            (r"transactions\.transaction_time :: date|date \( transactions\.transaction_time \)"
+             r"|cast \( transactions\.transaction_time as date \)", "day"),
+        ),
+        ranges={("transactions", "transaction_time"): ("day", _DAY_BOUND)},
+    ),
+]
+_BY_NAME = {s.name: s for s in SUMMARIES}
+
+class _Skip(Exception):
+    # the query cannot be answered from a summary
+    pass
+
+def _parens(toks: list) -> dict:
+    # "(" index -> matching ")" index
+    match, stack = {}, []
+    for i, tok in enumerate(toks):
+        if tok[1] == "(":
+            stack.append(i)
+        elif tok[1] == ")":
+            if not stack:
+                raise _Skip()
+            match[stack.pop()] = i
+    if stack:
+        raise _Skip()
+    return match
+
+def _split(toks: list, i: int, j: int, parens: dict, sep: str = ",") -> list:
+    # top-level items of toks[i:j] separated by `sep` ("," or "AND"), as (start, end) ranges
+    items, start, k = [], i, i
+    between = False
+    while k < j:
+        value = toks[k][1]
+        if value == "(":
+            k = parens[k] + 1
+            continue
+        word = value.upper()
+        if sep == "AND" and word == "BETWEEN":
+            between = True
+        elif word == sep and not (sep == "AND" and between):
+            items.append((start, k))
+            start = k + 1
+        elif sep == "AND" and word == "AND":
+            between = False
+        k += 1
+    items.append((start, j))
+    if any(a >= b for a, b in items):
+        raise _Skip()
+    return items
+
+def _quote(name: str) -> str:
+    return name if re.fullmatch(r"[a-z_][a-z0-9_]*", name) else '"' + name.replace('"', '""') + '"'
+
+class _Query:
+    """
+    One SELECT cut into clauses, with its FROM shape resolved.
+    """
+
+    def __init__(self, text: str):
+        self.text = text
+        self.toks = toks = _lex(text)
+        self.parens = _parens(toks)
+        if not toks or toks[0][1].upper() != "SELECT":
+            raise _Skip()
+        for k, (ttype, value, _, _) in enumerate(toks[1:], 1):
+            word = " ".join(value.upper().split())
+            if word == "SELECT" or word in _UNSUPPORTED:
+                raise _Skip()
+            if _is_kw(ttype) and "JOIN" in word and word not in _JOINS:
+                raise _Skip()  # RIGHT / FULL / CROSS / NATURAL
+            if _is_name(ttype) and value.lower() in ("rollup", "cube", "grouping"):
+                raise _Skip()
+        self.ranges = {}
+        clause, start, k = "select", 1, 1
+        while k < len(toks):
+            value = toks[k][1]
+            if value == "(":
+                k = self.parens[k] + 1
+                continue
+            word = " ".join(value.upper().split())
+            if _is_kw(toks[k][0]) and word in _CLAUSES and clause != "tail":
+                self.ranges[clause] = (start, k)
+                clause = _CLAUSES[word]
+                start = k if clause == "tail" else k + 1  # LIMIT/OFFSET are kept verbatim
+            k += 1
+        self.ranges[clause] = (start, len(toks))
+        if "from" not in self.ranges:
+            raise _Skip()
+        s, e = self.ranges["select"]
+        self.distinct = toks[s][1].upper() == "DISTINCT"
+        if self.distinct:
+            if s + 1 < e and toks[s + 1][1].upper() == "ON":
+                raise _Skip()
+            self.ranges["select"] = (s + 1, e)
+        self._parse_from(*self.ranges["from"])
+
+    def _ref(self, k: int, j: int) -> tuple:
+        # qualified name at k -> (parts, next index)
+        toks = self.toks
+        if not _is_name(toks[k][0]):
+            raise _Skip()
+        parts = [_name(toks[k][1])]
+        while k + 2 < j and toks[k + 1][1] == "." and _is_name(toks[k + 2][0]):
+            parts.append(_name(toks[k + 2][1]))
+            k += 2
+        return parts, k + 1
+
+    def _parse_from(self, i: int, j: int) -> None:
+        toks = self.toks
+        self.aliases, self.order, self.using = {}, [], set()
+        joins, nullable = set(), set()
+
+        def table(k):
+            parts, k = self._ref(k, j)
+            name = parts[-1]
+            if name in self.order:
+                raise _Skip()  # self join
+            alias = name
+            if k < j and toks[k][1].upper() == "AS":
+                k += 1
+            if k < j and _is_name(toks[k][0]):
+                alias = _name(toks[k][1])
+                k += 1
+            self.aliases[alias] = name
+            self.order.append(name)
+            return name, k
+
+        def column(parts):
+            if len(parts) != 2 or parts[0] not in self.aliases:
+                raise _Skip()
+            return self.aliases[parts[0]], parts[1]
+
+        _, k = table(i)
+        while k < j:
+            kind = _JOINS.get(" ".join(toks[k][1].upper().split()))
+            if kind is None:
+                raise _Skip()  # comma joins, NATURAL, ...
+            new, k = table(k + 1)
+            if k < j and toks[k][1].upper() == "USING":
+                close = self.parens.get(k + 1)
+                if close is None or close != k + 3 or not _is_name(toks[k + 2][0]):
+                    raise _Skip()
+                col = _name(toks[k + 2][1])
+                self.using.add(col)
+                left, right = (self.order[-2], col), (new, col)
+                k = close + 1
+            elif k < j and toks[k][1].upper() == "ON":
+                a_parts, m = self._ref(k + 1, j)
+                if m >= j or toks[m][1] != "=":
+                    raise _Skip()
+                b_parts, k = self._ref(m + 1, j)
+                a, b = column(a_parts), column(b_parts)
+                left, right = (b, a) if a[0] == new else (a, b)
+                if right[0] != new or left[0] == new:
+                    raise _Skip()
+                if k < j and _JOINS.get(" ".join(toks[k][1].upper().split())) is None:
+                    raise _Skip()  # more than one join condition
+            else:
+                raise _Skip()
+            if kind == "left":
+                joins.add(_left(left, right))
+                nullable.add(new)
+            else:
+                joins.add(_inner(left, right))
+        self.shape = _shape(self.order, *joins)
+        self.nullable = frozenset(nullable)
+
+class _Mapper:
+    """
+    Re-expresses clauses of a _Query over one summary's columns. Every
+    method raises _Skip when something has no exact counterpart.
+    """
+
+    def __init__(self, q: _Query, summary: Summary, rollup: bool = False):
+        self.q, self.s, self.rollup = q, summary, rollup
+        self.known = summary.known
+        self.names = {c for _, c in self.known}
+        self.outputs = set()
+
+    def _is_ref(self, k: int) -> bool:
+        ttype, value = self.q.toks[k][0], self.q.toks[k][1]
+        if ttype in T.Name.Builtin:
+            return False
+        return _is_name(ttype) or (ttype in T.Keyword and value.lower() in self.names)
+
+    def resolve(self, k: int, j: int) -> tuple:
+        # column reference at k -> ((table, column) or None, bare name or None, next index)
+        toks = self.q.toks
+        parts = [_name(toks[k][1])]
+        while k + 2 < j and toks[k + 1][1] == "." and (_is_name(toks[k + 2][0]) or toks[k + 2][0] in T.Keyword):
+            parts.append(_name(toks[k + 2][1]))
+            k += 2
+        if len(parts) == 2:
+            table = self.q.aliases.get(parts[0])
+            if table is None:
+                raise _Skip()
+            return (table, parts[1]), None, k + 1
+        if len(parts) > 2:
+            raise _Skip()
+        owners = [t for t in self.q.order if (t, parts[0]) in self.known]
+        if len(owners) == 1 or (owners and parts[0] in self.q.using):
+            return (owners[0], parts[0]), parts[0], k + 1
+        return None, parts[0], k + 1
+
+    def norm(self, i: int, j: int) -> str:
+        # tokens joined by single spaces, lowercased outside strings, references as table.column
+        out, k, toks = [], i, self.q.toks
+        while k < j:
+            if self._is_ref(k) and not (k + 1 < j and toks[k + 1][1] == "("):
+                col, bare, k = self.resolve(k, j)
+                out.append(f"{col[0]}.{col[1]}" if col else bare)
+                continue
+            value = toks[k][1]
+            out.append(value if toks[k][0] in T.String else " ".join(value.lower().split()))
+            k += 1
+        return " ".join(out)
+
+    def _expr(self, i: int, j: int) -> str | None:
+        text = self.norm(i, j)
+        for pattern, repl in self.s.exprs:
+            m = re.fullmatch(pattern, text)
+            if m:
+                return m.expand(repl)
+        return None
+
+    def column(self, col: tuple) -> str:
+        if col in self.s.inner_columns and self.q.nullable:
+            raise _Skip()
+        name = self.s.columns.get(col)
+        if name is None:
+            raise _Skip()
+        return name
+
+    def aggregate(self, func: str, i: int, j: int) -> str:
+        toks = self.q.toks
+        distinct = toks[i][1].upper() == "DISTINCT"
+        i += distinct
+        if j - i == 1 and toks[i][1] == "*":
+            col = "*"
+            if self.s.base in self.q.nullable or distinct:
+                raise _Skip()  # COUNT(*) also counts the NULL-extended rows
+        elif i < j and self._is_ref(i):
+            col, _, k = self.resolve(i, j)
+            if col is None or k != j:
+                raise _Skip()
+        else:
+            raise _Skip()
+        m = self.s.measures
+        if func == "avg" and not distinct:
+            total, n = m.get(("sum", col)), m.get(("count", col))
+            if total is None or n is None:
+                raise _Skip()
+            if self.rollup:
+                return f"(SUM({total[0]})::numeric / NULLIF(SUM({n[0]}), 0))"
+            return f"({total[0]}::numeric / NULLIF({n[0]}, 0))"
+        if func not in ("sum", "count") or (distinct and func != "count"):
+            raise _Skip()
+        measure = m.get(("distinct" if distinct else func, col))
+        if measure is None:
+            raise _Skip()
+        column, kind = measure
+        if not self.rollup:
+            return column
+        if kind == "sum":
+            return f"SUM({column})"
+        if kind == "isum":
+            return f"SUM({column})::bigint"
+        if kind == "count":
+            return f"COALESCE(SUM({column}), 0)::bigint"
+        raise _Skip()
+
+    def map(self, i: int, j: int, aggregates: bool = True, outputs: bool = False) -> str:
+        """
+        Text of toks[i:j] over the summary's columns.
+        """
+        toks, text = self.q.toks, self.q.text
+        out, last, k = [], toks[i][2], i
+        while k < j:
+            ttype, value, start, end = toks[k]
+            if value == "." or ttype in T.Wildcard:
+                raise _Skip()
+            if k + 1 < j and toks[k + 1][1] == "(" and (_is_name(ttype) or value.upper() == "CAST"):
+                close = self.q.parens[k + 1]
+                func = value.lower()
+                if func in AGGREGATES:
+                    if not aggregates:
+                        raise _Skip()
+                    rep = self.aggregate(func, k + 2, close)
+                else:
+                    rep = self._expr(k, close + 1)
+                if rep is not None:
+                    out.append(text[last:start] + rep)
+                    last, k = toks[close][3], close + 1
+                    continue
+                k += 1  # other functions stay; their arguments are mapped one by one
+                continue
+            if self._is_ref(k):
+                col, bare, nxt = self.resolve(k, j)
+                if col is not None and nxt + 1 < j and toks[nxt][1] == "::":
+                    rep = self._expr(k, nxt + 2)
+                    if rep is not None:
+                        out.append(text[last:start] + rep)
+                        last, k = toks[nxt + 1][3], nxt + 2
+                        continue
+                if col is None:
+                    if outputs and bare in self.outputs:
+                        k = nxt
+                        continue
+                    raise _Skip()
+                out.append(text[last:start] + self.column(col))
+                last, k = toks[nxt - 1][3], nxt
+                continue
+            k += 1
+        out.append(text[last:toks[j - 1][3]])
+        return "".join(out)
+
+    def condition(self, i: int, j: int) -> str:
+        # WHERE conjunct; "col >= bound" / "col < bound" on a range column with an aligned bound
+        toks = self.q.toks
+        if self._is_ref(i):
+            col, _, k = self.resolve(i, j)
+            if col in self.s.ranges and k < j and toks[k][1] in (">=", "<"):
+                column, bound = self.s.ranges[col]
+                rhs = self.norm(k + 1, j)
+                if re.fullmatch(bound, rhs):
+                    return f"{column} {toks[k][1]} {self.q.text[toks[k + 1][2]:toks[j - 1][3]]}"
+                raise _Skip()
+        return self.map(i, j, aggregates=False)
+
+def _output_name(toks: list, parens: dict, i: int, j: int) -> str:
+    # the column name Postgres gives an unaliased select item
+    while j - i > 2 and toks[j - 2][1] == "::":
+        j -= 2
+    if j - i >= 1 and _is_name(toks[i][0]):
+        k = i
+        while k + 2 < j and toks[k + 1][1] == "." and _is_name(toks[k + 2][0]):
+            k += 2
+        if k + 1 == j:
+            return _name(toks[k][1])
+    if j - i >= 3 and toks[i + 1][1] == "(" and parens.get(i + 1) == j - 1:
+        if toks[i][1].upper() == "CAST":
+            inner = [k for k in range(i + 2, j - 1) if toks[k][1].upper() == "AS"]
+            return _output_name(toks, parens, i + 2, inner[-1]) if inner else "?column?"
+        return toks[i][1].lower()
+    if toks[i][1].upper() == "CASE":
+        return "case"
+    if toks[i][0] in T.Keyword:
+        return toks[i][1].lower()
+    return "?column?"
+
+def _select_items(q: _Query) -> list:
+    # [(expr start, expr end, alias text or None, output name)]
+    toks, items = q.toks, []
+    for a, b in _split(toks, *q.ranges["select"], q.parens):
+        alias = None
+        if b - a >= 3 and toks[b - 2][1].upper() == "AS":
+            alias, b = toks[b - 1][1], b - 2
+        elif b - a >= 2 and _is_name(toks[b - 1][0]) and toks[b - 2][1] not in (".", "::") \
+                and toks[b - 2][0] not in T.Operator and not _is_kw(toks[b - 2][0]):
+            alias, b = toks[b - 1][1], b - 1
+        name = _name(alias) if alias else _output_name(toks, q.parens, a, b)
+        items.append((a, b, alias, name))
+    return items
+
+def _plan(q: _Query, summary: Summary, extra: str) -> str:
+    toks = q.toks
+    items = _select_items(q)
+    probe = _Mapper(q, summary)
+    probe.outputs = {name for _, _, _, name in items}
+
+    groups = []  # (kept text or None, summary column it maps to or None)
+    if "group" in q.ranges:
+        for a, b in _split(toks, *q.ranges["group"], q.parens):
+            target = (a, b)
+            kept = None
+            if b - a == 1 and toks[a][0] in T.Number.Integer:
+                n = int(toks[a][1])
+                if not 1 <= n <= len(items):
+                    raise _Skip()
+                kept, target = toks[a][1], items[n - 1][:2]
+            elif b - a == 1 and probe._is_ref(a) and probe.resolve(a, b)[0] is None:
+                named = [it for it in items if it[3] == _name(toks[a][1])]
+                if not named:
+                    raise _Skip()
+                kept, target = toks[a][1], named[0][:2]
+            mapped = probe.map(*target, aggregates=False)
+            groups.append((kept or mapped, mapped))
+    grouped = {m for _, m in groups}
+    aggregated = any(
+        _is_name(t[0]) and t[1].lower() in AGGREGATES and k + 1 < len(toks) and toks[k + 1][1] == "("
+        for k, t in enumerate(toks)
+    )
+    if not groups and not aggregated:
+        raise _Skip()  # plain row query
+    rollup = not (groups and summary.key <= grouped)
+
+    m = _Mapper(q, summary, rollup=rollup)
+    m.outputs = probe.outputs
+    select = []
+    for a, b, alias, name in items:
+        expr = m.map(a, b)
+        if alias:
+            select.append(f"{expr} AS {alias}")
+        else:
+            new = _lex(expr)
+            same = _output_name(new, _parens(new), 0, len(new)) == name
+            select.append(expr if same else f"{expr} AS {_quote(name)}")
+
+    where = [extra] if extra else []
+    if "where" in q.ranges:
+        if len(_split(toks, *q.ranges["where"], q.parens, sep="OR")) > 1:
+            # a top-level OR binds looser than the ANDs around it: keep the condition whole
+            where.append(f"({m.map(*q.ranges['where'], aggregates=False)})")
+        else:
+            where += [f"({m.condition(a, b)})" for a, b in _split(toks, *q.ranges["where"], q.parens, sep="AND")]
+    having = m.map(*q.ranges["having"]) if "having" in q.ranges else None
+    if having and not rollup:
+        where.append(f"({having})")
+    order = [m.map(a, b, outputs=True) for a, b in _split(toks, *q.ranges["order"], q.parens)] \
+        if "order" in q.ranges else []
+
+    parts = [f"SELECT {'DISTINCT ' if q.distinct else ''}{', '.join(select)}", f"FROM {SCHEMA}.{summary.name}"]
+    if where:
+        parts.append("WHERE " + " AND ".join(where))
+    if rollup and groups:
+        parts.append("GROUP BY " + ", ".join(kept for kept, _ in groups))
+    if rollup and having:
+        parts.append(f"HAVING {having}")
+    if order:
+        parts.append("ORDER BY " + ", ".join(order))
+    if "tail" in q.ranges:
+        a, b = q.ranges["tail"]
+        parts.append(q.text[toks[a][2]:toks[b - 1][3]])
+    return " ".join(parts)
+
+@lru_cache(maxsize=REWRITE_CACHE_SIZE)
+def plan(sql: str) -> tuple | None:
+    """
+    (summary SQL, summary name) giving the same result as `sql`, ignoring
+    freshness; None when no summary can answer it.
+    """
+    try:
+        q = _Query(sql.strip().rstrip(";").strip())
+        for summary in SUMMARIES:
+            extra = summary.shapes.get(q.shape)
+            if extra is None:
+                continue
+            try:
+                return _plan(q, summary, extra), summary.name
+            except _Skip:
+                continue
+    except (_Skip, KeyError, IndexError):
+        pass
+    return None
+
+# summary name -> {"stale", "dirty_from", "refreshed_at"}; a summary missing here is not used
+_state = {}
+_stats = {"rewrites": 0, "stale": 0, "misses": 0}
+
+def fresh(name: str) -> bool:
+    # _state only follows writes while the change listener is connected; without it nothing is fresh
+    s = _state.get(name)
+    return s is not None and not s["stale"] and result_cache.listening()
+
+def rewrite(sql: str) -> tuple | None:
+    """
+    (summary SQL, summary name) when a fresh summary answers `sql`, else None.
+    """
+    if not ENABLED:
+        return None
+    hit = plan(sql)
+    if hit is not None and not fresh(hit[1]):
+        _stats["stale"] += 1
+        hit = None
+    _stats["rewrites" if hit else "misses"] += 1
+    metrics.SUMMARY_REWRITES.labels(hit[1] if hit else "none").inc()
+    return hit
+
+async def aload_state() -> None:
+    global _state
+    pool = await get_async_pool()
+    try:
+        async with pool.connection() as conn:
+            cur = await conn.execute(f"SELECT name, stale, dirty_from::text, refreshed_at FROM {SCHEMA}.state")
+            rows = await cur.fetchall()
+    except psycopg.Error:
+        rows = []  # database without db/init/04_summaries.sql
+    _state = {
+        name: {"stale": stale, "dirty_from": dirty, "refreshed_at": refreshed}
+        for name, stale, dirty, refreshed in rows if name in _BY_NAME
+    }
+
+async def on_change(table: str | None) -> None:
+    """
+    Table-change notification (result_cache listener): a source table write
+    makes its summaries stale at once; a refreshed summary (or a reconnect)
+    reloads the state from the database.
+    """
+    if table is None or table in _BY_NAME:
+        await aload_state()
+        return
+    for s in SUMMARIES:
+        if table in s.sources and s.name in _state:
+            _state[s.name] = {**_state[s.name], "stale": True}
+
+# same rollup as db/init/04_summaries.sql
+_DAILY = (
+    "INSERT INTO {schema}.daily_transactions "
+    "SELECT transaction_time::date, transaction_type, currency, channel, fraud_suspected, "
+    "COUNT(*), SUM(amount), COUNT(amount) FROM transactions {where} GROUP BY 1, 2, 3, 4, 5"
+)
+
+def _refresh_one(conn, name: str, incremental: bool, force: bool) -> str:
+    if not incremental:
+        # cleared first: a write landing during the refresh marks it stale again
+        conn.execute(f"UPDATE {SCHEMA}.state SET stale = false WHERE name = %s", (name,))
+        try:
+            conn.execute(pgsql.SQL("REFRESH MATERIALIZED VIEW CONCURRENTLY {}").format(pgsql.Identifier(SCHEMA, name)))
+        except Exception:
+            conn.execute(f"UPDATE {SCHEMA}.state SET stale = true WHERE name = %s", (name,))
+            raise
+        conn.execute(f"UPDATE {SCHEMA}.state SET refreshed_at = now() WHERE name = %s", (name,))
+        return "concurrent"
+
+    first = conn.execute(
+        f"UPDATE {SCHEMA}.state s SET stale = false, dirty_from = NULL "
+        f"FROM (SELECT dirty_from FROM {SCHEMA}.state WHERE name = %s FOR UPDATE) old "
+        f"WHERE s.name = %s RETURNING old.dirty_from::text",
+        (name, name),
+    ).fetchone()[0]
+    full = force or first in (None, "-infinity")
+    try:
+        with conn.transaction():
+            if full:
+                conn.execute(f"DELETE FROM {SCHEMA}.daily_transactions")
+                conn.execute(_DAILY.format(schema=SCHEMA, where=""))
+            else:
+                conn.execute(f"DELETE FROM {SCHEMA}.daily_transactions WHERE day >= %s::date", (first,))
+                conn.execute(_DAILY.format(schema=SCHEMA, where="WHERE transaction_time >= %s::date"), (first,))
+            conn.execute(f"UPDATE {SCHEMA}.state SET refreshed_at = now() WHERE name = %s", (name,))
+    except Exception:
+        conn.execute(
+            f"UPDATE {SCHEMA}.state SET stale = true, dirty_from = least(dirty_from, %s::date) WHERE name = %s",
+            ("-infinity" if full else first, name),
+        )
+        raise
+    return "full" if full else f"from {first}"
+
+def refresh(names=None, force: bool = False, db_url: str = DB_URL) -> list:
+    """
+    Refresh the stale summaries (all of `names` with force). Returns
+    [(name, mode)]; empty when another process is already refreshing.
+    """
+    done = []
+    with psycopg.connect(db_url, autocommit=True) as conn:
+        if not conn.execute("SELECT pg_try_advisory_lock(hashtext('summaries.refresh'))").fetchone()[0]:
+            return done
+        rows = conn.execute(f"SELECT name, incremental, stale FROM {SCHEMA}.state ORDER BY name").fetchall()
+        for name, incremental, stale in rows:
+            if (names and name not in names) or not (stale or force):
+                continue
+            mode = _refresh_one(conn, name, incremental, force)
+            # drops cached results that read the summary; backends reload its state
+            conn.execute("SELECT pg_notify(%s, %s)", (NOTIFY_CHANNEL, name))
+            done.append((name, mode))
+    return done
+
+async def refresh_loop() -> None:
+    """
+    Backend task: refresh stale summaries every REFRESH_S seconds.
+    """
+    while True:
+        try:
+            await asyncio.to_thread(refresh)
+            await aload_state()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            pass
+        await asyncio.sleep(REFRESH_S)
+
+def stats() -> dict:
+    return {
+        **_stats,
+        "enabled": ENABLED,
+        "plans_cached": plan.cache_info().currsize,
+        "summaries": {
+            name: {**s, "refreshed_at": str(s["refreshed_at"]) if s["refreshed_at"] else None}
+            for name, s in _state.items()
+        },
+    }
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--refresh", action="store_true", help="refresh stale summaries")
+    ap.add_argument("--force", action="store_true", help="with --refresh: all of them, fully")
+    ap.add_argument("names", nargs="*", help="only these summaries")
+    ap.add_argument("--db-url", default=DB_URL)
+    args = ap.parse_args()
+
+    if args.refresh:
+        import time
+        t0 = time.perf_counter()
+        for name, mode in refresh(args.names or None, force=args.force, db_url=args.db_url):
+            print(f"refreshed {name} ({mode})")
+        print(f"done in {time.perf_counter() - t0:.1f}s")
+    with psycopg.connect(args.db_url) as conn:
+        for name, stale, dirty, refreshed in conn.execute(
+            f"SELECT name, stale, dirty_from::text, refreshed_at FROM {SCHEMA}.state ORDER BY name"
+        ):
+            since = f", changed from {dirty}" if dirty else ""
+            print(f"{name:<20} {'stale' if stale else 'fresh':<6} refreshed {refreshed:%Y-%m-%d %H:%M:%S}{since}")
+
+if __name__ == "__main__":
+    main()
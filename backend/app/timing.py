@@ -0,0 +1,64 @@
+# backend/app/timing.py
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from . import metrics
+
+# timer of the request whose stage is currently running (for nested spans)
+_current = ContextVar("stage_timer", default=None)
+
+class StageTimer:
+    """
+    Wall-clock milliseconds per pipeline stage of one request,
+    rendered as a Server-Timing header. Every stage is also exported
+    to the nl2sql_stage_seconds histogram.
+    """
+
+    def __init__(self):
+        self.stages = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        token = _current.set(self)
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - t0
+            _current.reset(token)
+            self.stages[name] = self.stages.get(name, 0.0) + seconds * 1000.0
+            metrics.observe_stage(name, seconds)
+
+    def header(self) -> str:
+        return ", ".join(f"{name};dur={ms:.3f}" for name, ms in self.stages.items())
+
+@contextmanager
+def stage(name: str):
+    """
+    Span inside a running stage (e.g. schema retrieval within "generate"):
+    recorded on the request's timer (Server-Timing and metrics) when one is
+    active, otherwise only exported to metrics.
+    """
+    timer = _current.get()
+    if timer is not None:
+        with timer.stage(name):
+            yield
+        return
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.observe_stage(name, time.perf_counter() - t0)
+
+def parse_server_timing(header: str) -> dict:
+    """
+    "generate;dur=1.2, db;dur=3.4" -> {"generate": 1.2, "db": 3.4}
+    """
+    stages = {}
+    for item in (header or "").split(","):
+        name, _, params = item.strip().partition(";")
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if name and key == "dur":
+                stages[name] = float(value)
+    return stages
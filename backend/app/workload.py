@@ -0,0 +1,85 @@
+# backend/app/workload.py
+import json
+import os
+import queue
+import re
+import threading
+import time
+
+# every executed query's shape as one JSON line {"ts", "sql", "ms", "rows", "error"}, literals
+# replaced by "?" (values from questions never reach the log); input for the index advisor
+# (python -m app.index_advisor). Empty = off.
+LOG_PATH = os.getenv("WORKLOAD_LOG", "")
+# rotated to <path>.1 beyond this size
+LOG_MAX_BYTES = int(float(os.getenv("WORKLOAD_LOG_MAX_MB", "50")) * 1024 * 1024)
+# entries waiting for the writer thread; beyond this they are dropped rather than block a request
+QUEUE_MAX = int(os.getenv("WORKLOAD_LOG_QUEUE", "10000"))
+
+# positional GROUP BY / ORDER BY references (part of the shape, kept), else string and numeric literals
+_LITERAL = re.compile(
+    r"(\b(?:group|order) by \d+(?: (?:asc|desc))?(?: ?, ?\d+(?: (?:asc|desc))?)*(?![\w.\"]))"
+    r"|'(?:[^']|'')*'|(?<![\w.\"])\d+(?:\.\d+)?(?![\w.\"])"
+)
+
+_queue = queue.Queue(QUEUE_MAX)
+_writer = None
+_lock = threading.Lock()
+
+def fingerprint(sql: str) -> str:
+    """
+    Canonical SQL with literals replaced by "?": one string per query shape.
+    """
+    from .result_cache import canonical_sql  # result_cache imports db, which imports this module
+    return _LITERAL.sub(lambda m: m.group(1) or "?", canonical_sql(sql))
+
+def record(sql: str, seconds: float, rows: int | None = None, error: bool = False) -> None:
+    """
+    Queue one executed statement for the log; never blocks or raises into the request.
+    """
+    global _writer
+    if not LOG_PATH:
+        return
+    if _writer is None:
+        with _lock:
+            if _writer is None:
+                _writer = threading.Thread(target=_write_loop, name="workload-log", daemon=True)
+                _writer.start()
+    try:
+        _queue.put_nowait((time.time(), sql, seconds, rows, error))
+    except queue.Full:
+        pass
+
+def _write_loop() -> None:
+    # fingerprinting and file I/O stay off the event loop
+    f = None
+    while True:
+        ts, sql, seconds, rows, error = _queue.get()
+        try:
+            line = json.dumps(
+                {"ts": round(ts, 3), "sql": fingerprint(sql), "ms": round(seconds * 1000.0, 3),
+                 "rows": rows, "error": error},
+                ensure_ascii=False,
+            )
+            if f is None:
+                os.makedirs(os.path.dirname(LOG_PATH) or ".", exist_ok=True)
+                f = open(LOG_PATH, "a", encoding="utf-8", buffering=1)
+            f.write(line + "\n")
+            if f.tell() > LOG_MAX_BYTES:
+                f.close()
+                f = None
+                os.replace(LOG_PATH, LOG_PATH + ".1")
+        except Exception:
+            pass
+
+def read(path: str = LOG_PATH):
+    """
+    Yields logged entries, the rotated file first.
+    """
+    for p in (path + ".1", path):
+        if os.path.exists(p):
+            with open(p, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        continue  # partially written last line
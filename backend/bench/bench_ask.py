@@ -0,0 +1,196 @@
+# backend/bench/bench_ask.py
+"""
+Load/latency benchmark for POST /ask.
+
+Drives the app in-process (ASGI, default) or a running server (--url) with
+the question corpus in bench/questions.json at one or more concurrency
+levels, and reports throughput plus p50/p95/p99 latency overall and per
+stage (from the Server-Timing header: generate, guard, limit, cost, db, serialize).
+
+    cd backend
+    python -m bench.bench_ask --concurrency 1,8,32 --requests 400
+    python -m bench.bench_ask --url http://127.0.0.1:8000
+    python -m bench.bench_ask --baseline bench/results/base.json   # exit 1 on regression
+
+In-process runs default to LLM_MODE=mock and disable the result cache so
+every request reaches Postgres (DB_URL as usual, loaded from backend/db).
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import sys
+import time
+from pathlib import Path
+
+HERE = Path(__file__).resolve().parent
+STAGES = ["generate", "guard", "limit", "rewrite", "cost", "db", "serialize"]
+
+def _pct(values: list, p: float) -> float:
+    # linear interpolation between closest ranks
+    if not values:
+        return 0.0
+    values = sorted(values)
+    k = (len(values) - 1) * p / 100.0
+    lo = int(k)
+    hi = min(lo + 1, len(values) - 1)
+    return values[lo] + (values[hi] - values[lo]) * (k - lo)
+
+def _summary(values: list) -> dict:
+    return {
+        "p50": round(_pct(values, 50), 3),
+        "p95": round(_pct(values, 95), 3),
+        "p99": round(_pct(values, 99), 3),
+        "mean": round(sum(values) / len(values), 3) if values else 0.0,
+    }
+
+async def _run_level(client, questions: list, concurrency: int, total: int) -> dict:
+    from app.timing import parse_server_timing
+
+    latencies, stages, errors = [], {s: [] for s in STAGES}, {}
+    next_i = 0
+
+    async def worker():
+        nonlocal next_i
+        while next_i < total:
+            q = questions[next_i % len(questions)]
+            next_i += 1
+            t0 = time.perf_counter()
+            try:
+                r = await client.post("/ask", json={"question": q})
+                await r.aread()
+            except Exception as e:
+                errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+                continue
+            ms = (time.perf_counter() - t0) * 1000.0
+            if r.status_code != 200:
+                errors[str(r.status_code)] = errors.get(str(r.status_code), 0) + 1
+                continue
+            latencies.append(ms)
+            for name, dur in parse_server_timing(r.headers.get("server-timing", "")).items():
+                stages.setdefault(name, []).append(dur)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall = time.perf_counter() - t0
+
+    return {
+        "concurrency": concurrency,
+        "requests": total,
+        "ok": len(latencies),
+        "errors": errors,
+        "wall_s": round(wall, 3),
+        "throughput_rps": round(len(latencies) / wall, 2) if wall else 0.0,
+        "latency_ms": _summary(latencies),
+        "stages_ms": {name: _summary(v) for name, v in stages.items() if v},
+    }
+
+async def _bench(args, questions: list) -> dict:
+    import httpx
+
+    levels = [int(c) for c in args.concurrency.split(",") if c.strip()]
+    limits = httpx.Limits(max_connections=max(levels), max_keepalive_connections=max(levels))
+
+    async def run(client):
+        # warm-up: pools, schema/analysis caches, JIT-ish first-call costs
+        await _run_level(client, questions, 1, args.warmup)
+        return [await _run_level(client, questions, c, args.requests) for c in levels]
+
+    if args.url:
+        async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=args.timeout) as client:
+            return await run(client)
+
+    from app.main import app
+    transport = httpx.ASGITransport(app=app)
+    # ASGITransport does not run the lifespan; do it here so pools open once
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=args.timeout) as client:
+            return await run(client)
+
+def _compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """
+    Regressions vs a previous run: p95 latency up or throughput down by more
+    than `tolerance` (fraction) at the same concurrency level.
+    """
+    base = {lvl["concurrency"]: lvl for lvl in baseline.get("levels", [])}
+    problems = []
+    for lvl in results["levels"]:
+        old = base.get(lvl["concurrency"])
+        if old is None:
+            continue
+        c = lvl["concurrency"]
+        p95, old_p95 = lvl["latency_ms"]["p95"], old["latency_ms"]["p95"]
+        if old_p95 and p95 > old_p95 * (1 + tolerance):
+            problems.append(f"c={c}: p95 {old_p95:.2f} -> {p95:.2f} ms")
+        rps, old_rps = lvl["throughput_rps"], old["throughput_rps"]
+        if old_rps and rps < old_rps * (1 - tolerance):
+            problems.append(f"c={c}: throughput {old_rps:.1f} -> {rps:.1f} rps")
+        if lvl["errors"] and not old["errors"]:
+            problems.append(f"c={c}: errors {lvl['errors']}")
+    return problems
+
+def _print(results: dict) -> None:
+    print(f"{'conc':>5}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    for lvl in results["levels"]:
+        lat = lvl["latency_ms"]
+        print(
+            f"{lvl['concurrency']:>5}{lvl['throughput_rps']:>10.1f}{lat['p50']:>10.2f}"
+            f"{lat['p95']:>10.2f}{lat['p99']:>10.2f}{sum(lvl['errors'].values()):>8}"
+        )
+        for name, s in lvl["stages_ms"].items():
+            print(f"{'':>5}  {name:<10}p50 {s['p50']:>8.3f}  p95 {s['p95']:>8.3f}  p99 {s['p99']:>8.3f}")
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--url", help="benchmark a running server instead of the in-process app")
+    ap.add_argument("--concurrency", default="1,8,32", help="comma-separated levels")
+    ap.add_argument("--requests", type=int, default=200, help="requests per level")
+    ap.add_argument("--warmup", type=int, default=20)
+    ap.add_argument("--timeout", type=float, default=120.0)
+    ap.add_argument("--questions", default=str(HERE / "questions.json"))
+    ap.add_argument("--lang", choices=["tr", "en"], help="only questions in this language")
+    ap.add_argument("--result-cache", action="store_true", help="keep the result cache on (in-process)")
+    ap.add_argument("--out", help="results JSON (default bench/results/ask-<time>.json)")
+    ap.add_argument("--baseline", help="previous results JSON to compare against")
+    ap.add_argument("--tolerance", type=float, default=0.2, help="allowed regression fraction")
+    args = ap.parse_args()
+
+    if not args.url:
+        # must be set before app modules read their config
+        os.environ.setdefault("LLM_MODE", "mock")
+        os.environ.setdefault("RESULT_CACHE_LISTEN", "0")
+        if not args.result_cache:
+            os.environ["RESULT_CACHE_MAX_BYTES"] = "0"
+
+    corpus = json.loads(Path(args.questions).read_text(encoding="utf-8"))
+    questions = [item["question"] for item in corpus if not args.lang or item.get("lang") == args.lang]
+
+    results = {
+        "meta": {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "target": args.url or "in-process",
+            "llm_mode": None if args.url else os.environ["LLM_MODE"],
+            "result_cache": bool(args.url) or args.result_cache,
+            "questions": len(questions),
+            "python": platform.python_version(),
+        },
+        "levels": asyncio.run(_bench(args, questions)),
+    }
+    _print(results)
+
+    out = Path(args.out) if args.out else HERE / "results" / f"ask-{time.strftime('%Y%m%d-%H%M%S')}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(results, indent=2), encoding="utf-8")
+    print(f"saved {out}")
+
+    if args.baseline:
+        problems = _compare(results, json.loads(Path(args.baseline).read_text(encoding="utf-8")), args.tolerance)
+        for p in problems:
+            print(f"REGRESSION {p}")
+        if problems:
+            sys.exit(1)
+        print("no regressions")
+
+if __name__ == "__main__":
+    main()
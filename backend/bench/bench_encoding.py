@@ -0,0 +1,85 @@
+# backend/bench/bench_encoding.py
+"""
+Serialization cost of an /ask result per response format (Accept header),
+per 1k rows.
+
+    cd backend
+    python -m bench.bench_encoding [--rows 10000] [--repeat 20]
+    python -m bench.bench_encoding --sql "SELECT * FROM transactions LIMIT 10000"   # real rows from the DB
+
+Without --sql the rows are synthetic and shaped like transactions (int, text,
+numeric, timestamp, date), so no database is needed.
+"""
+import argparse
+import datetime as dt
+import random
+import time
+from decimal import Decimal
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from app.encoding import ARROW, COLUMNS, HAS_ARROW, ROWS, encode
+
+def synthetic(n: int) -> dict:
+    rnd = random.Random(0)
+    t0 = dt.datetime(2024, 1, 1)
+    rows = [
+        (
+            i, rnd.randint(1, 2500), rnd.choice(("EFT", "Havale", "POS", "ATM")),
+            Decimal(f"{rnd.uniform(1, 50000):.2f}"), rnd.choice(("TRY", "USD", "EUR")),
+            t0 + dt.timedelta(seconds=rnd.randint(0, 3 * 365 * 86400)), rnd.choice(("Mobil", "Internet", "Şube")),
+            rnd.random() < 0.02, (t0 + dt.timedelta(days=rnd.randint(0, 1000))).date(),
+        )
+        for i in range(n)
+    ]
+    columns = ["transaction_no", "account_no", "transaction_type", "amount", "currency",
+               "transaction_time", "channel", "fraud_suspected", "value_date"]
+    return {"columns": columns, "rows": rows}
+
+def payload(result: dict) -> dict:
+    # the /ask response around the result
+    return {"question": "bench", "sql": "SELECT ...", "result": result, "schema": "", "template": None,
+            "similar": None, "cost": None, "summary": None}
+
+def legacy(p: dict) -> bytes:
+    return JSONResponse(jsonable_encoder(p)).body
+
+FORMATS = {
+    "json (fastapi)": legacy,
+    "rows (orjson)": lambda p: encode(p, ROWS),
+    "columns (orjson)": lambda p: encode(p, COLUMNS),
+}
+if HAS_ARROW:
+    FORMATS["arrow ipc"] = lambda p: encode(p, ARROW)
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, default=10000)
+    ap.add_argument("--repeat", type=int, default=20)
+    ap.add_argument("--sql", help="benchmark the rows of this query instead of synthetic ones")
+    args = ap.parse_args()
+
+    if args.sql:
+        from app.db import query
+        result = query(args.sql, timeout_ms=60000)
+    else:
+        result = synthetic(args.rows)
+    p = payload(result)
+    n = max(len(result["rows"]), 1)
+
+    print(f"{len(result['rows'])} rows x {len(result['columns'])} columns")
+    print(f"{'format':<18}{'ms/1k rows':>12}{'bytes/row':>11}{'speedup':>9}")
+    base = None
+    for name, fn in FORMATS.items():
+        best = float("inf")
+        for _ in range(args.repeat):
+            t0 = time.perf_counter()
+            body = fn(p)
+            best = min(best, time.perf_counter() - t0)
+        per_1k = best * 1000.0 / n * 1000.0
+        base = base or per_1k
+        print(f"{name:<18}{per_1k:>12.3f}{len(body) / n:>11.1f}{base / per_1k:>8.1f}x")
+    if not HAS_ARROW:
+        print("arrow ipc: skipped (pip install pyarrow)")
+
+if __name__ == "__main__":
+    main()
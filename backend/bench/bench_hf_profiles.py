@@ -0,0 +1,131 @@
+# backend/bench/bench_hf_profiles.py
+"""
+Compare HF CPU inference profiles on a fixed prompt set.
+
+Each profile runs in its own process (threads, pinning and quantization are
+process-wide). The first profile is the reference; a profile only counts as
+a candidate when its generated text is identical to the reference.
+
+    cd backend
+    HF_MODEL=Qwen/Qwen2.5-3B-Instruct python -m bench.bench_hf_profiles
+    python -m bench.bench_hf_profiles --profiles fp32,bf16,int8,bf16:compile --threads 16 --affinity node:0
+
+The prompts use the schema from db/init/01_schema.sql, so no database is needed.
+"""
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+HERE = Path(__file__).resolve().parent
+SCHEMA_SQL = HERE.parent / "db" / "init" / "01_schema.sql"
+
+def _schema_text() -> str:
+    # same layout as schema_index.render(), built from the DDL file
+    lines = ["DATABASE SCHEMA (PostgreSQL):"]
+    ddl = SCHEMA_SQL.read_text(encoding="utf-8")
+    for table, body in re.findall(r"CREATE TABLE (\w+) \((.*?)\);", ddl, flags=re.S):
+        cols = []
+        for line in body.splitlines():
+            m = re.match(r"\s*(\w+)\s+(\w+)", line)
+            if m:
+                cols.append(f"{m.group(1)} ({m.group(2).lower()})")
+        lines.append(f"- {table}: {', '.join(cols)}")
+    return "\n".join(lines)
+
+def _worker(questions: list) -> dict:
+    from app.llm import hf
+
+    t0 = time.perf_counter()
+    hf._load()
+    load_s = time.perf_counter() - t0
+
+    schema = _schema_text()
+    hf._generate_batch([(schema, questions[0], None)])  # warm-up (and compile)
+
+    latencies, outputs = [], []
+    for q in questions:
+        t = time.perf_counter()
+        outputs.append(hf._generate_batch([(schema, q, None)])[0])
+        latencies.append(time.perf_counter() - t)
+
+    t = time.perf_counter()
+    batched = hf._generate_batch([(schema, q, None) for q in questions])
+    batch_s = time.perf_counter() - t
+
+    tokens = sum(len(hf._TOKENIZER(o)["input_ids"]) for o in outputs)
+    latencies.sort()
+    return {
+        "report": hf.PROFILE_REPORT,
+        "load_s": round(load_s, 3),
+        "seq_total_s": round(sum(latencies), 3),
+        "seq_p50_ms": round(latencies[len(latencies) // 2] * 1000, 1),
+        "batch_s": round(batch_s, 3),
+        "tokens_per_s": round(tokens / sum(latencies), 1) if sum(latencies) else 0.0,
+        "batch_matches_seq": batched == outputs,
+        "outputs": outputs,
+    }
+
+def _run_profile(spec: str, args, questions: list) -> dict:
+    profile, _, flag = spec.partition(":")
+    env = dict(os.environ, HF_CPU_PROFILE=profile, HF_COMPILE="1" if flag == "compile" else "0")
+    if args.threads:
+        env["HF_CPU_THREADS"] = str(args.threads)
+    if args.affinity:
+        env["HF_CPU_AFFINITY"] = args.affinity
+    proc = subprocess.run(
+        [sys.executable, "-m", "bench.bench_hf_profiles", "--worker", "--questions", str(len(questions))],
+        cwd=HERE.parent, env=env, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        return {"error": (proc.stderr.strip().splitlines() or ["failed"])[-1]}
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--profiles", default="fp32,bf16,int8", help="comma-separated, 'name:compile' adds torch.compile")
+    ap.add_argument("--questions", type=int, default=8, help="first N questions of bench/questions.json")
+    ap.add_argument("--threads", type=int, default=0)
+    ap.add_argument("--affinity", default="")
+    ap.add_argument("--out", help="results JSON (default bench/results/hf-profiles-<time>.json)")
+    ap.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    corpus = json.loads((HERE / "questions.json").read_text(encoding="utf-8"))
+    questions = [item["question"] for item in corpus][:args.questions]
+
+    if args.worker:
+        print(json.dumps(_worker(questions)))
+        return
+
+    results = {}
+    for spec in [p.strip() for p in args.profiles.split(",") if p.strip()]:
+        results[spec] = _run_profile(spec, args, questions)
+
+    reference = next(iter(results.values()), {}).get("outputs")
+    print(f"{'profile':<14}{'load s':>8}{'p50 ms':>9}{'seq s':>8}{'batch s':>9}{'tok/s':>8}  same SQL")
+    for spec, r in results.items():
+        if "error" in r:
+            print(f"{spec:<14}  error: {r['error']}")
+            continue
+        r["identical"] = r["outputs"] == reference
+        print(
+            f"{spec:<14}{r['load_s']:>8.2f}{r['seq_p50_ms']:>9.1f}{r['seq_total_s']:>8.2f}"
+            f"{r['batch_s']:>9.2f}{r['tokens_per_s']:>8.1f}  {'yes' if r['identical'] else 'NO'}"
+        )
+
+    ok = [(r["seq_total_s"], spec) for spec, r in results.items() if r.get("identical")]
+    if ok:
+        print(f"fastest with identical output: {min(ok)[1]}")
+
+    out = Path(args.out) if args.out else HERE / "results" / f"hf-profiles-{time.strftime('%Y%m%d-%H%M%S')}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(results, indent=2, ensure_ascii=False), encoding="utf-8")
+    print(f"saved {out}")
+
+if __name__ == "__main__":
+    main()
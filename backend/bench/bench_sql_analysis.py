@@ -0,0 +1,122 @@
+# backend/bench/bench_sql_analysis.py
+"""
+Per-query cost of the SQL post-processing chain, before and after the
+single-parse analyzer.
+
+    cd backend
+    python -m bench.bench_sql_analysis [--repeat 200]
+"""
+import argparse
+import re
+import time
+import sqlparse
+from sqlparse import tokens as T
+from app.llm.rules import top_n
+from app.sql_analysis import analyze
+
+QUERIES = {
+    "simple": "SELECT customer_no, first_name, last_name FROM customers ORDER BY customer_no;",
+    "join": (
+        "SELECT c.first_name, c.last_name, SUM(a.balance_try) AS total_try "
+        "FROM accounts a JOIN customers c ON c.customer_no = a.customer_no "
+        "GROUP BY c.customer_no, c.first_name, c.last_name ORDER BY total_try DESC LIMIT 500;"
+    ),
+    "long_cte": (
+        "WITH "
+        + ", ".join(
+            f"t{i} AS (SELECT a.customer_no, SUM(a.balance_try) AS s{i}, COUNT(*) AS n{i} "
+            f"FROM accounts a JOIN branches b ON b.branch_code = a.branch_code "
+            f"WHERE b.region = 'Ege' AND a.balance_try > {i * 100} GROUP BY a.customer_no)"
+            for i in range(12)
+        )
+        + " SELECT c.customer_no, c.first_name, t0.s0, t11.s11 FROM customers c "
+        "JOIN t0 ON t0.customer_no = c.customer_no JOIN t11 ON t11.customer_no = c.customer_no "
+        "ORDER BY t0.s0 DESC;"
+    ),
+}
+QUESTION = "top 5 customers by balance"
+
+# --- legacy chain (hf._apply_limit -> sql_guard -> sql_safety), kept for comparison ---
+
+_LEGACY_DISALLOWED = {
+    "insert", "update", "delete", "drop", "alter", "truncate",
+    "create", "grant", "revoke", "vacuum", "analyze", "call", "do",
+}
+
+def _legacy_apply_limit(sql, question, default_limit=50):
+    s = sql.strip().rstrip(";")
+    m = re.search(r"\btop\s+(\d+)\b", question, flags=re.IGNORECASE)
+    if m:
+        n = int(m.group(1))
+        if re.search(r"\bLIMIT\s+\d+\b", s, flags=re.IGNORECASE):
+            s = re.sub(r"\bLIMIT\s+\d+\b", f"LIMIT {n}", s, flags=re.IGNORECASE)
+        else:
+            s = f"{s} LIMIT {n}"
+        return s + ";"
+    if not re.search(r"\bLIMIT\b", s, flags=re.IGNORECASE):
+        s = f"{s} LIMIT {default_limit}"
+    return s + ";"
+
+def _legacy_assert_read_only(sql):
+    sql = (sql or "").strip()
+    statements = [s for s in sqlparse.split(sql) if s.strip()]
+    if len(statements) != 1:
+        raise ValueError("multiple")
+    stmt = sqlparse.parse(sql)[0]
+    for tok in stmt.flatten():
+        if tok.is_whitespace:
+            continue
+        if tok.ttype in T.Keyword or tok.ttype in T.DML:
+            break
+    for tok in stmt.flatten():
+        if tok.ttype in T.Keyword or tok.ttype in T.DDL or tok.ttype in T.DML:
+            if tok.value.lower() in _LEGACY_DISALLOWED:
+                raise ValueError("blocked")
+
+def _legacy_ensure_limit(sql, default_limit=50, max_limit=200):
+    s = sql.strip().rstrip(";")
+    if re.search(r"\bcount\s*\(", s, re.IGNORECASE):
+        return s + ";"
+    m = re.search(r"\blimit\s+(\d+)\b", s, re.IGNORECASE)
+    if not m:
+        return f"{s}\nLIMIT {default_limit};"
+    if int(m.group(1)) > max_limit:
+        s = re.sub(r"\blimit\s+\d+\b", f"LIMIT {max_limit}", s, flags=re.IGNORECASE)
+    return s + ";"
+
+def legacy(sql):
+    sql = _legacy_apply_limit(sql, QUESTION)
+    _legacy_assert_read_only(sql)
+    return _legacy_ensure_limit(sql)
+
+# --- analyzer chain ---
+
+def single_parse(sql):
+    a = analyze(sql.strip())
+    a.assert_read_only()
+    return a.with_limit(default_limit=50, max_limit=200, force_limit=top_n(QUESTION))
+
+def _time(fn, sql, repeat, before=None):
+    best = float("inf")
+    for _ in range(repeat):
+        if before:
+            before()
+        t0 = time.perf_counter()
+        fn(sql)
+        best = min(best, time.perf_counter() - t0)
+    return best * 1e6
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--repeat", type=int, default=200)
+    args = ap.parse_args()
+
+    print(f"{'query':<10}{'chars':>7}{'legacy us':>12}{'cold us':>12}{'warm us':>12}")
+    for name, sql in QUERIES.items():
+        old = _time(legacy, sql, args.repeat)
+        cold = _time(single_parse, sql, args.repeat, before=analyze.cache_clear)
+        warm = _time(single_parse, sql, args.repeat)
+        print(f"{name:<10}{len(sql):>7}{old:>12.1f}{cold:>12.1f}{warm:>12.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -13,9 +13,8 @@ COPY accounts(account_no, customer_no, account_type, balance, balance_try, balan
 FROM '/data/hesaplar.csv'
 WITH (FORMAT csv, HEADER true, ENCODING 'UTF8');
 
-COPY transactions(transaction_no, account_no, transaction_type, amount, currency, transaction_time, channel, category, fraud_suspected)
-FROM '/data/islemler.csv'
-WITH (FORMAT csv, HEADER true, ENCODING 'UTF8');
+-- transactions have no seed file; generate them (and larger data sets) with
+--   python -m bench.datagen --replace        (see README, "Synthetic data")
 
 COPY credit_applications(application_no, customer_no, dependents, education, self_employed, annual_income, requested_amount, term_months, credit_score, house_asset, commercial_asset, luxury_asset, bank_asset, decision, application_date)
 FROM '/data/kredi_basvurulari.csv'
@@ -0,0 +1,24 @@
+-- 03_notify.sql
+-- Statement-level triggers that NOTIFY 'table_changed' with the table name,
+-- so the backend result cache can drop entries that read the table.
+
+CREATE OR REPLACE FUNCTION notify_table_changed() RETURNS trigger AS $$
+BEGIN
+  PERFORM pg_notify('table_changed', TG_TABLE_NAME);
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DO $$
+DECLARE
+  t TEXT;
+BEGIN
+  FOREACH t IN ARRAY ARRAY['branches', 'customers', 'accounts', 'transactions', 'credit_applications'] LOOP
+    EXECUTE format('DROP TRIGGER IF EXISTS %I ON %I', t || '_notify', t);
+    EXECUTE format(
+      'CREATE TRIGGER %I AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON %I '
+      'FOR EACH STATEMENT EXECUTE FUNCTION notify_table_changed()',
+      t || '_notify', t
+    );
+  END LOOP;
+END $$;
@@ -0,0 +1,159 @@
+-- 04_summaries.sql
+-- Pre-aggregated summaries of the base tables. The backend sends matching
+-- aggregate queries to them (app/summaries.py) while they are fresh. Writes to
+-- a base table mark its summaries stale until the next refresh:
+--   python -m app.summaries --refresh      (or SUMMARY_REFRESH_S in the backend)
+-- Materialized views are refreshed CONCURRENTLY (readers are never blocked);
+-- daily_transactions is a table refreshed incrementally from the first changed day.
+-- Everything lives in the "summaries" schema, so it stays out of the LLM's schema prompt.
+
+CREATE SCHEMA IF NOT EXISTS summaries;
+
+CREATE TABLE IF NOT EXISTS summaries.state (
+  name         TEXT PRIMARY KEY,
+  sources      TEXT[] NOT NULL,
+  incremental  BOOLEAN NOT NULL DEFAULT false,
+  stale        BOOLEAN NOT NULL DEFAULT false,
+  dirty_from   DATE,            -- incremental: first day to recompute ('-infinity' = all)
+  refreshed_at TIMESTAMPTZ
+);
+
+-- one row per customer; customers without accounts have account_count = 0
+DROP MATERIALIZED VIEW IF EXISTS summaries.customer_balances;
+CREATE MATERIALIZED VIEW summaries.customer_balances AS
+SELECT c.customer_no, c.first_name, c.last_name, c.segment, c.residence_city,
+       COUNT(a.account_no) AS account_count,
+       SUM(a.balance) AS total_balance, COUNT(a.balance) AS n_balance,
+       SUM(a.balance_try) AS total_balance_try, COUNT(a.balance_try) AS n_balance_try,
+       SUM(a.balance_usd) AS total_balance_usd, COUNT(a.balance_usd) AS n_balance_usd,
+       SUM(a.balance_eur) AS total_balance_eur, COUNT(a.balance_eur) AS n_balance_eur
+FROM customers c
+LEFT JOIN accounts a ON a.customer_no = c.customer_no
+GROUP BY c.customer_no;
+CREATE UNIQUE INDEX customer_balances_pk ON summaries.customer_balances (customer_no);
+CREATE INDEX customer_balances_total_try ON summaries.customer_balances (total_balance_try DESC);
+CREATE INDEX customer_balances_segment_city ON summaries.customer_balances (segment, residence_city);
+
+-- one row per branch; city and region totals roll up from it
+DROP MATERIALIZED VIEW IF EXISTS summaries.branch_balances;
+CREATE MATERIALIZED VIEW summaries.branch_balances AS
+SELECT b.branch_code, b.branch_name, b.city, b.region,
+       COUNT(a.account_no) AS account_count,
+       COUNT(DISTINCT a.customer_no) AS customer_count,
+       SUM(a.balance) AS total_balance, COUNT(a.balance) AS n_balance,
+       SUM(a.balance_try) AS total_balance_try, COUNT(a.balance_try) AS n_balance_try,
+       SUM(a.balance_usd) AS total_balance_usd, COUNT(a.balance_usd) AS n_balance_usd,
+       SUM(a.balance_eur) AS total_balance_eur, COUNT(a.balance_eur) AS n_balance_eur
+FROM branches b
+LEFT JOIN accounts a ON a.branch_code = b.branch_code
+GROUP BY b.branch_code;
+CREATE UNIQUE INDEX branch_balances_pk ON summaries.branch_balances (branch_code);
+CREATE INDEX branch_balances_city ON summaries.branch_balances (city);
+CREATE INDEX branch_balances_region ON summaries.branch_balances (region);
+
+-- credit decisions per customer segment, applicant profile and application month
+DROP MATERIALIZED VIEW IF EXISTS summaries.credit_outcomes;
+CREATE MATERIALIZED VIEW summaries.credit_outcomes AS
+SELECT c.segment, ca.decision, ca.education, ca.self_employed,
+       date_trunc('month', ca.application_date)::date AS application_month,
+       c.customer_no IS NOT NULL AS has_customer,
+       COUNT(*) AS applications,
+       SUM(ca.credit_score) AS sum_credit_score, COUNT(ca.credit_score) AS n_credit_score,
+       SUM(ca.requested_amount) AS sum_requested_amount, COUNT(ca.requested_amount) AS n_requested_amount,
+       SUM(ca.annual_income) AS sum_annual_income, COUNT(ca.annual_income) AS n_annual_income
+FROM credit_applications ca
+LEFT JOIN customers c ON c.customer_no = ca.customer_no
+GROUP BY 1, 2, 3, 4, 5, 6;
+CREATE UNIQUE INDEX credit_outcomes_pk ON summaries.credit_outcomes
+  (segment, decision, education, self_employed, application_month, has_customer) NULLS NOT DISTINCT;
+
+-- transactions per day, type, currency, channel and fraud flag
+CREATE TABLE IF NOT EXISTS summaries.daily_transactions (
+  day               DATE,
+  transaction_type  TEXT,
+  currency          TEXT,
+  channel           TEXT,
+  fraud_suspected   INT,
+  transaction_count BIGINT NOT NULL,
+  total_amount      NUMERIC,
+  n_amount          BIGINT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS daily_transactions_day ON summaries.daily_transactions (day);
+TRUNCATE summaries.daily_transactions;
+INSERT INTO summaries.daily_transactions
+SELECT transaction_time::date, transaction_type, currency, channel, fraud_suspected,
+       COUNT(*), SUM(amount), COUNT(amount)
+FROM transactions
+GROUP BY 1, 2, 3, 4, 5;
+
+INSERT INTO summaries.state (name, sources, incremental, refreshed_at) VALUES
+  ('customer_balances', ARRAY['customers', 'accounts'], false, now()),
+  ('branch_balances', ARRAY['branches', 'accounts'], false, now()),
+  ('credit_outcomes', ARRAY['credit_applications', 'customers'], false, now()),
+  ('daily_transactions', ARRAY['transactions'], true, now())
+ON CONFLICT (name) DO UPDATE
+  SET sources = EXCLUDED.sources, incremental = EXCLUDED.incremental,
+      stale = false, dirty_from = NULL, refreshed_at = now();
+
+-- any write to a source table: its materialized views are stale
+CREATE OR REPLACE FUNCTION summaries.mark_stale() RETURNS trigger AS $$
+BEGIN
+  UPDATE summaries.state SET stale = true
+  WHERE TG_TABLE_NAME = ANY(sources) AND NOT incremental AND NOT stale;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DO $$
+DECLARE
+  t TEXT;
+BEGIN
+  FOREACH t IN ARRAY ARRAY['branches', 'customers', 'accounts', 'credit_applications'] LOOP
+    EXECUTE format('DROP TRIGGER IF EXISTS %I ON %I', t || '_summaries', t);
+    EXECUTE format(
+      'CREATE TRIGGER %I AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON %I '
+      'FOR EACH STATEMENT EXECUTE FUNCTION summaries.mark_stale()',
+      t || '_summaries', t
+    );
+  END LOOP;
+END $$;
+
+-- transactions: remember the earliest changed day, so the refresh only recomputes from there
+CREATE OR REPLACE FUNCTION summaries.mark_daily_dirty() RETURNS trigger AS $$
+DECLARE
+  first_day DATE;
+  has_null  BOOLEAN := false;
+BEGIN
+  IF TG_OP = 'TRUNCATE' THEN
+    first_day := '-infinity';
+  ELSIF TG_OP = 'INSERT' THEN
+    SELECT min(transaction_time)::date, bool_or(transaction_time IS NULL) INTO first_day, has_null FROM new_rows;
+  ELSIF TG_OP = 'DELETE' THEN
+    SELECT min(transaction_time)::date, bool_or(transaction_time IS NULL) INTO first_day, has_null FROM old_rows;
+  ELSE
+    SELECT min(transaction_time)::date, bool_or(transaction_time IS NULL) INTO first_day, has_null
+    FROM (SELECT transaction_time FROM old_rows UNION ALL SELECT transaction_time FROM new_rows) r;
+  END IF;
+  IF has_null THEN
+    first_day := '-infinity';  -- the NULL day group is only rebuilt by a full refresh
+  END IF;
+  IF first_day IS NOT NULL THEN
+    UPDATE summaries.state SET stale = true, dirty_from = least(dirty_from, first_day)
+    WHERE name = 'daily_transactions' AND (NOT stale OR dirty_from IS NULL OR dirty_from > first_day);
+  END IF;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS transactions_summaries_ins ON transactions;
+DROP TRIGGER IF EXISTS transactions_summaries_upd ON transactions;
+DROP TRIGGER IF EXISTS transactions_summaries_del ON transactions;
+DROP TRIGGER IF EXISTS transactions_summaries_trunc ON transactions;
+CREATE TRIGGER transactions_summaries_ins AFTER INSERT ON transactions
+  REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION summaries.mark_daily_dirty();
+CREATE TRIGGER transactions_summaries_upd AFTER UPDATE ON transactions
+  REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION summaries.mark_daily_dirty();
+CREATE TRIGGER transactions_summaries_del AFTER DELETE ON transactions
+  REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION summaries.mark_daily_dirty();
+CREATE TRIGGER transactions_summaries_trunc AFTER TRUNCATE ON transactions
+  FOR EACH STATEMENT EXECUTE FUNCTION summaries.mark_daily_dirty();
@@ -0,0 +1,40 @@
+# backend/tests/test_chain.py
+import asyncio
+import time
+import pytest
+from app import deadline
+from app.llm import chain
+
+def _half_open(mode: str) -> chain.BackendHealth:
+    h = chain.health(mode)
+    h.failures = chain.BREAKER_FAILURES
+    h.open_until = time.monotonic() - 1.0
+    assert h.state == "half_open"
+    return h
+
+async def _never(mode):
+    raise AssertionError(f"{mode} called")
+
+def test_probe_rejected_by_the_deadline_is_released():
+    h = _half_open("probe-run")
+
+    async def go():
+        # less than the DB reserve left: the probe is turned away before it goes out
+        with deadline.start(1):
+            await chain.run(["probe-run"], _never)
+
+    with pytest.raises(deadline.DeadlineExceeded):
+        asyncio.run(go())
+    assert h.acquire()
+
+def test_streamed_probe_rejected_by_the_deadline_is_released():
+    h = _half_open("probe-stream")
+
+    async def go():
+        with deadline.start(1):
+            async for _ in chain.stream(["probe-stream"], _never):
+                pass
+
+    with pytest.raises(deadline.DeadlineExceeded):
+        asyncio.run(go())
+    assert h.acquire()
@@ -0,0 +1,38 @@
+# backend/tests/test_encoding.py
+import datetime as dt
+import json
+from collections import namedtuple
+from decimal import Decimal
+import orjson
+import pytest
+from fastapi.encoders import jsonable_encoder
+from app.encoding import arrow_batch, arrow_ipc, arrow_schema, dumps, json_default
+
+def test_orjson_matches_fastapi_values():
+    row = (Decimal("10"), Decimal("10.00"), Decimal("1E+2"), Decimal("-2.5"), dt.date(2024, 1, 31), None)
+    expected = jsonable_encoder(list(row))
+    assert orjson.loads(dumps(row)) == expected
+    assert json.loads(json.dumps(row, default=json_default)) == expected
+    assert [type(v) for v in orjson.loads(dumps(row))[:4]] == [int, float, int, float]
+
+def test_orjson_numeric_beyond_64_bits_stays_a_number():
+    big = Decimal("123456789012345678901234567890")
+    assert orjson.loads(dumps([big, -big, Decimal(2**63 - 1)])) == [float(big), -float(big), 2**63 - 1]
+    assert json.loads(json.dumps([big], default=json_default)) == jsonable_encoder([big])
+
+def test_arrow_from_cursor_chunks_and_from_rows_agree():
+    pa = pytest.importorskip("pyarrow")
+    Col = namedtuple("Col", "name type_code")
+    description = [Col("account_no", 20), Col("balance", 1700), Col("opened_at", 1082), Col("note", 25)]
+    rows = [(1, Decimal("10.50"), dt.date(2024, 1, 31), None), (2, None, dt.date(2024, 2, 1), None)]
+    schema = arrow_schema(description)
+    table = pa.Table.from_batches([arrow_batch(schema, rows[:1]), arrow_batch(schema, rows[1:])], schema=schema)
+    body = arrow_ipc({"columns": schema.names, "table": table}, {"sql": "SELECT 1"})
+    read = pa.ipc.open_stream(body).read_all()
+    assert read.column("note").type == pa.string()  # typed from the description, though all NULL
+    assert orjson.loads(read.schema.metadata[b"nl2sql"]) == {"sql": "SELECT 1"}
+    from_rows = pa.ipc.open_stream(arrow_ipc({"columns": schema.names, "rows": rows})).read_all()
+    assert read.to_pylist() == from_rows.to_pylist() == [
+        {"account_no": 1, "balance": 10.5, "opened_at": dt.date(2024, 1, 31), "note": None},
+        {"account_no": 2, "balance": None, "opened_at": dt.date(2024, 2, 1), "note": None},
+    ]
@@ -0,0 +1,62 @@
+# backend/tests/test_jobs.py
+import asyncio
+import os
+import time
+import orjson
+import pytest
+from app import jobs
+
+@pytest.fixture
+def spool(tmp_path, monkeypatch):
+    monkeypatch.setattr(jobs, "JOBS_DIR", str(tmp_path))
+    return tmp_path
+
+def _job(job_id: str, **meta) -> dict:
+    now = time.time()
+    state = {
+        "id": job_id, "status": "done", "columns": ["n"], "row_count": 0, "bytes": 0, "error": None,
+        "created_at": now, "finished_at": now, "expires_at": now + jobs.TTL_S,
+    }
+    state.update(meta)
+    jobs._save(state)
+    return state
+
+def test_cleanup_sweeps_orphaned_rows(spool):
+    _job("a" * 16)
+    (spool / ("a" * 16 + ".rows")).write_bytes(b"[1]\n")
+    (spool / ("b" * 16 + ".rows")).write_bytes(b"[1]\n")
+    (spool / "unrelated.rows").write_bytes(b"")
+    jobs.cleanup()
+    assert sorted(os.listdir(spool)) == sorted(["a" * 16 + ".json", "a" * 16 + ".rows", "unrelated.rows"])
+
+def test_cancel_removes_files_after_the_task_stops(spool):
+    job_id = "c" * 16
+
+    async def run():
+        async def writer():
+            try:
+                await asyncio.sleep(10)
+            finally:
+                # a job's last act on cancellation: rewrite its state
+                _job(job_id, status="failed", error="cancelled")
+        _job(job_id, status="running")
+        jobs._tasks[job_id] = asyncio.create_task(writer())
+        await asyncio.sleep(0)
+        return await jobs.cancel(job_id)
+
+    assert asyncio.run(run())
+    assert os.listdir(spool) == []
+
+def test_failed_job_pages_to_the_end(spool):
+    job_id = "d" * 16
+    rows = b"".join(b"[%d]\n" % i for i in range(5))
+    (spool / (job_id + ".rows")).write_bytes(rows)
+    _job(job_id, status="failed", error="canceling statement due to statement timeout", bytes=len(rows))
+    seen, cursor = [], None
+    while True:
+        doc = orjson.loads(jobs.page(job_id, cursor, limit=2))
+        seen += doc["rows"]
+        cursor = doc["next"]
+        if cursor is None:
+            break
+    assert seen == [[i] for i in range(5)]
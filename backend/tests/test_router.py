@@ -0,0 +1,28 @@
+# backend/tests/test_router.py
+import asyncio
+import pytest
+from app.llm import chain, router
+
+def test_stream_without_any_text_fails(monkeypatch):
+    async def none(*args):
+        return None
+
+    async def prepare(modes, question):
+        return "", {}, {m: f"key-{m}" for m in modes}
+
+    async def empty(modes, open_stream):
+        return
+        yield
+
+    monkeypatch.setattr(router, "_template", lambda question: None)
+    monkeypatch.setattr(router, "_chain", lambda: ["ollama", "mock"])
+    monkeypatch.setattr(router, "_similar", none)
+    monkeypatch.setattr(router, "_prepare", prepare)
+    monkeypatch.setattr(router.cache, "get", lambda key: None)
+    monkeypatch.setattr(chain, "stream", empty)
+
+    async def go():
+        return [event async for event in router.stream("how many customers")]
+
+    with pytest.raises(RuntimeError, match="no SQL"):
+        asyncio.run(go())
@@ -0,0 +1,18 @@
+# backend/tests/test_similar.py
+from app.llm.similar import _substitute
+
+def test_positional_references_are_not_substituted():
+    sql = "SELECT branch_code, SUM(balance) FROM accounts WHERE branch_code = 1 GROUP BY 1 ORDER BY 2 DESC"
+    assert _substitute(sql, [1], [2]) == sql.replace("branch_code = 1", "branch_code = 2")
+
+def test_limit_and_between_bounds_are_substituted():
+    sql = "SELECT * FROM credit_applications WHERE credit_score BETWEEN 600 AND 700 LIMIT 10"
+    assert _substitute(sql, [600, 700, 10], [500, 650, 20]) == \
+        "SELECT * FROM credit_applications WHERE credit_score BETWEEN 500 AND 650 LIMIT 20"
+
+def test_ambiguous_literal_is_not_reused():
+    # "branch 5" -> "branch 7": the LIMIT 5 did not necessarily come from the question
+    assert _substitute("SELECT * FROM accounts WHERE branch_code = 5 LIMIT 5", [5], [7]) is None
+
+def test_number_missing_from_the_sql_is_not_reused():
+    assert _substitute("SELECT * FROM t WHERE t.x >= now() - interval '30 days'", [30], [7]) is None
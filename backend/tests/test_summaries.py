@@ -0,0 +1,98 @@
+# backend/tests/test_summaries.py
+"""
+The summary rewriter must never change a result. Plan-only tests need
+nothing; the equivalence tests run each query and its rewrite against the
+database (DB_URL) and are skipped when it or the summaries schema is missing.
+
+    cd backend
+    python -m pytest -q tests
+"""
+from decimal import Decimal
+import psycopg
+import pytest
+from app import summaries
+from app.db import DB_URL
+from app.summaries import plan
+
+def test_top_level_or_stays_one_condition():
+    sql, name = plan(
+        "SELECT currency, COUNT(*) FROM transactions "
+        "WHERE currency = 'USD' AND channel = 'ATM' OR fraud_suspected = 1 GROUP BY currency"
+    )
+    assert name == "daily_transactions"
+    assert "WHERE (currency = 'USD' AND channel = 'ATM' OR fraud_suspected = 1)" in sql
+
+def test_or_next_to_an_inner_join_filter():
+    sql, _ = plan(
+        "SELECT c.segment, SUM(a.balance_try) FROM customers c JOIN accounts a ON a.customer_no = c.customer_no "
+        "WHERE c.segment = 'Bireysel' OR c.residence_city = 'Ankara' GROUP BY c.segment"
+    )
+    assert "WHERE account_count > 0 AND (segment = 'Bireysel' OR residence_city = 'Ankara')" in sql
+
+def test_and_conjuncts_keep_not_and_between():
+    sql, _ = plan(
+        "SELECT b.region, SUM(a.balance_try) FROM branches b JOIN accounts a ON a.branch_code = b.branch_code "
+        "WHERE NOT b.region = 'Marmara' AND b.city BETWEEN 'A' AND 'K' GROUP BY b.region"
+    )
+    assert "(NOT region = 'Marmara') AND (city BETWEEN 'A' AND 'K')" in sql
+
+def test_range_bound_inside_or_is_not_rewritten():
+    # day-aligned bounds are only recognized as plain conjuncts
+    assert plan(
+        "SELECT currency, COUNT(*) FROM transactions "
+        "WHERE transaction_time >= '2024-01-01' OR channel = 'ATM' GROUP BY currency"
+    ) is None
+
+def test_count_star_over_null_extended_rows_is_not_rewritten():
+    assert plan(
+        "SELECT c.segment, COUNT(*) FROM customers c LEFT JOIN accounts a ON a.customer_no = c.customer_no "
+        "GROUP BY c.segment"
+    ) is None
+
+EQUIVALENT = [
+    "SELECT currency, COUNT(*) FROM transactions "
+    "WHERE currency = 'USD' AND channel = 'ATM' OR fraud_suspected = 1 GROUP BY currency",
+    "SELECT currency, SUM(amount) FROM transactions "
+    "WHERE transaction_time >= '2024-01-01' AND transaction_time < '2024-02-01' "
+    "AND NOT (channel = 'ATM' OR fraud_suspected = 1) GROUP BY currency",
+    "SELECT channel, COUNT(*), AVG(amount) FROM transactions WHERE NOT currency = 'TRY' GROUP BY channel",
+    "SELECT c.segment, COUNT(a.account_no), SUM(a.balance_try) FROM customers c "
+    "LEFT JOIN accounts a ON a.customer_no = c.customer_no GROUP BY c.segment",
+    "SELECT c.customer_no, SUM(a.balance) FROM customers c LEFT JOIN accounts a ON a.customer_no = c.customer_no "
+    "GROUP BY c.customer_no ORDER BY c.customer_no LIMIT 50",
+    "SELECT c.segment, AVG(a.balance_try) FROM customers c JOIN accounts a ON a.customer_no = c.customer_no "
+    "WHERE c.segment = 'Bireysel' OR c.residence_city = 'Ankara' GROUP BY c.segment",
+    "SELECT b.region, SUM(a.balance_try) FROM branches b JOIN accounts a ON a.branch_code = b.branch_code "
+    "WHERE b.city BETWEEN 'A' AND 'K' AND NOT b.region = 'Marmara' GROUP BY b.region",
+    "SELECT b.city, COUNT(a.account_no) FROM branches b LEFT JOIN accounts a ON a.branch_code = b.branch_code "
+    "WHERE b.region = 'Ege' OR b.city = 'Ankara' GROUP BY b.city",
+    "SELECT c.segment, ca.decision, COUNT(*) FROM credit_applications ca "
+    "LEFT JOIN customers c ON c.customer_no = ca.customer_no GROUP BY c.segment, ca.decision",
+]
+
+@pytest.fixture(scope="module")
+def conn():
+    try:
+        conn = psycopg.connect(DB_URL, autocommit=True, connect_timeout=3)
+    except psycopg.OperationalError:
+        pytest.skip("database not reachable")
+    with conn:
+        if conn.execute("SELECT to_regclass('summaries.state')").fetchone()[0] is None:
+            pytest.skip("db/init/04_summaries.sql not applied")
+        summaries.refresh()
+        yield conn
+
+def _rows(conn, sql: str, ordered: bool) -> list:
+    # Decimal vs numeric division differ in scale only
+    rows = [
+        tuple(round(float(v), 6) if isinstance(v, (Decimal, float)) else v for v in row)
+        for row in conn.execute(sql).fetchall()
+    ]
+    return rows if ordered else sorted(rows, key=repr)
+
+@pytest.mark.parametrize("sql", EQUIVALENT)
+def test_rewrite_returns_the_same_rows(conn, sql):
+    hit = plan(sql)
+    assert hit is not None, "expected a summary to answer this query"
+    ordered = "ORDER BY" in sql
+    assert _rows(conn, hit[0], ordered) == _rows(conn, sql, ordered)
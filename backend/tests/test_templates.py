@@ -0,0 +1,25 @@
+# backend/tests/test_templates.py
+import pytest
+from app.llm.templates import match
+
+@pytest.mark.parametrize("question", [
+    "top 5 customers with lowest balance",
+    "top 10 accounts with smallest balance",
+    "en düşük bakiyeli 5 tane müşteri",
+    "average balance per branch in 2023",
+    "transactions in March",
+    "accounts not in Ankara",
+    "branch 5 accounts",
+])
+def test_unexplained_modifier_rejects_the_template(question):
+    assert match(question) is None
+
+@pytest.mark.parametrize("question, template", [
+    ("top 5 customers with highest balance", "top_balances"),
+    ("en yüksek bakiyeli 5 tane müşteri", "top_balances"),
+    ("average balance per branch", "avg_balance_per_branch"),
+    ("transactions in the last 30 days", "recent_transactions"),
+    ("how many customers live in İzmir", "customer_count"),
+])
+def test_fully_explained_question_matches(question, template):
+    assert match(question)["template"] == template
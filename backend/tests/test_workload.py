@@ -0,0 +1,16 @@
+# backend/tests/test_workload.py
+from app.index_advisor import _explainable
+from app.workload import fingerprint
+
+def test_literals_are_not_logged():
+    fp = fingerprint("SELECT * FROM customers WHERE full_name = 'Ayşe Yılmaz' AND customer_no = 1042 LIMIT 5")
+    assert fp == "select * from customers where full_name = ? and customer_no = ? limit ?"
+
+def test_positional_references_stay_in_the_shape():
+    fp = fingerprint("SELECT branch_code, COUNT(*) FROM accounts WHERE balance > 1000 GROUP BY 1 ORDER BY 2 DESC, 1")
+    assert fp == "select branch_code, count(*) from accounts where balance > ? group by 1 order by 2 desc, 1"
+
+def test_shape_is_explainable_as_a_generic_plan():
+    fp = fingerprint("SELECT * FROM transactions WHERE transaction_time >= DATE '2024-01-01' - INTERVAL '7 days' LIMIT 10")
+    assert _explainable(fp) == \
+        "select * from transactions where transaction_time >= $1::date - $2::interval limit $3"
@@ -55,6 +55,7 @@ export default function App() {
   const [sql, setSql] = useState("");
   const [result, setResult] = useState(null);
   const [error, setError] = useState("");
+  const [cost, setCost] = useState(null);
   const [ms, setMs] = useState(null);
 
   // “presentation” controls (UI only)
@@ -75,37 +76,46 @@ export default function App() {
     setError("");
     setSql("");
     setResult(null);
+    setCost(null);
     setMs(null);
 
     const t0 = performance.now();
-    try {
-      const res = await fetch(`${API_BASE}/ask`, {
-        method: "POST",
-        headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({ question: q }),
-      });
-
-      const data = await res.json();
-      const t1 = performance.now();
-      setMs(Math.round(t1 - t0));
-
-      if (!res.ok) throw new Error(data?.detail || "Request failed");
-
+    const done = () => {
+      setMs(Math.round(performance.now() - t0));
+      setLoading(false);
+    };
+
+    // SSE: SQL text appears while the model is still writing it
+    const es = new EventSource(`${API_BASE}/ask/sse?question=${encodeURIComponent(q)}`);
+    let streamed = "";
+
+    es.addEventListener("token", (ev) => {
+      streamed += JSON.parse(ev.data).text;
+      setSql(streamed.trim());
+    });
+    es.addEventListener("sql", (ev) => {
+      const data = JSON.parse(ev.data);
       setSql(data.sql || "");
-      setResult(data.result || null);
-    } catch (e) {
-      const t1 = performance.now();
-      setMs(Math.round(t1 - t0));
-      const msg = (e.message || "Unknown error");
+      setCost(data.cost || null);
+    });
+    es.addEventListener("result", (ev) => {
+      setResult(JSON.parse(ev.data).result || null);
+    });
+    es.addEventListener("done", () => {
+      es.close();
+      done();
+    });
+    // server-sent "error" event carries a detail; a bare error is a dropped connection
+    es.addEventListener("error", (ev) => {
+      es.close();
+      const msg = ev.data ? JSON.parse(ev.data).detail || "Request failed" : "Connection lost";
       if (msg.includes("Unknown LLM_MODE")) {
         setError("Model yapılandırması hatalı. Lütfen sistem yöneticisiyle iletişime geçin.");
       } else {
         setError(msg);
       }
-
-    } finally {
-      setLoading(false);
-    }
+      done();
+    });
   }
 
   return (
@@ -201,6 +211,7 @@ export default function App() {
             setSql("");
             setResult(null);
             setError("");
+            setCost(null);
             setMs(null);
           }}
         >
@@ -242,6 +253,13 @@ export default function App() {
 
           {error && <div className="error">{error}</div>}
 
+          {cost?.warn && (
+            <div className="warn">
+              Bu sorgu ağır olabilir (tahmini maliyet {Math.round(cost.total_cost).toLocaleString("tr-TR")},
+              ~{cost.rows.toLocaleString("tr-TR")} satır). Sonuç gecikebilir.
+            </div>
+          )}
+
           {showSQL && sql && (
             <div className="card">
               <div className="cardTitle">Generated SQL</div>